@@ -0,0 +1,120 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+region_name = os.environ.get('REPO_T_AWS_REGION', 'us-east-2')
+endpoint_url = os.environ.get('REPO_T_DYNAMODB_ENDPOINT') or None
+max_pool_connections = int(os.environ.get('REPO_T_MAX_POOL_CONNECTIONS', '50'))
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_resource_clients = {}
+_resource_classes = {}
+# boto3 clients are thread-safe but resources are not: each thread gets its own resource, all of them
+# backed by one shared client and its connection pool. That client comes from a resource, so it carries
+# the resource's hooks (eg. dynamodb's python type serialization). Only the first resource of a service
+# is built by the session, which loads the service model and creates a client; the resource class it
+# produced is kept, so the resources of later (often short-lived pool) threads are plain instances of
+# it on the shared client. configure() and reset() bump the generation so every thread rebuilds its
+# resources.
+_local = threading.local()
+_generation = 0
+
+
+def configure(region: str = None, endpoint: str = None, pool_connections: int = None):
+    """Overrides region, endpoint (eg. DynamoDB Local on http://localhost:8000) and connection pool size.
+       Drops cached resources so the next lookup picks up the new settings."""
+
+    global region_name, endpoint_url, max_pool_connections, _generation
+
+    with _lock:
+        if region is not None:
+            region_name = region
+        if endpoint is not None:
+            endpoint_url = endpoint or None
+        if pool_connections is not None:
+            max_pool_connections = pool_connections
+        _clients.clear()
+        _resource_clients.clear()
+        _resource_classes.clear()
+        _generation += 1
+
+
+def reset():
+    """Drops the shared session and every cached resource and client"""
+
+    global _session, _generation
+
+    with _lock:
+        _session = None
+        _clients.clear()
+        _resource_clients.clear()
+        _resource_classes.clear()
+        _generation += 1
+
+
+def get_session() -> boto3.session.Session:
+    """Returns the process-wide boto3 session, creating it on first use"""
+
+    global _session
+
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session(region_name=region_name)
+        return _session
+
+
+def get_resource(service_name: str = 'dynamodb'):
+    """Returns the calling thread's boto3 resource, which makes its requests through the shared client so
+       pooled HTTP connections are reused across calls and threads"""
+
+    if getattr(_local, 'generation', None) != _generation:
+        _local.resources = {}
+        _local.generation = _generation
+    resource = _local.resources.get(service_name)
+    if resource is not None:
+        return resource
+
+    session = get_session()
+    with _lock:
+        if service_name not in _resource_classes:
+            resource = session.resource(service_name, **_client_kwargs(service_name))
+            _resource_classes[service_name] = type(resource)
+            _resource_clients[service_name] = resource.meta.client
+        resource = _resource_classes[service_name](client=_resource_clients[service_name])
+    _local.resources[service_name] = resource
+
+    return resource
+
+
+def get_client(service_name: str = 'dynamodb'):
+    """Returns a shared low-level boto3 client; clients are safe to use from many threads. The dynamodb
+       client is the one backing the resources."""
+
+    if service_name == 'dynamodb':
+        return get_resource(service_name).meta.client
+
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+
+    session = get_session()
+    with _lock:
+        if service_name not in _clients:
+            _clients[service_name] = session.client(service_name, **_client_kwargs(service_name))
+        return _clients[service_name]
+
+
+def _client_kwargs(service_name: str) -> dict:
+    """Returns resource/client construction arguments for the current settings"""
+
+    kwargs = {
+        'region_name': region_name,
+        'config': Config(max_pool_connections=max_pool_connections)
+    }
+    if service_name == 'dynamodb' and endpoint_url:
+        kwargs['endpoint_url'] = endpoint_url
+
+    return kwargs
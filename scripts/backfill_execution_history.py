@@ -0,0 +1,312 @@
+import os
+import sys
+import argparse
+import hashlib
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+import aws_session
+import execution_history_table
+import export_sink
+import git_backend
+import metrics
+import update_execution_history
+import write_scheduler
+from update_execution_history import ExecutionHistoryError
+
+# Windows are written in 'upsert' mode: a jira id's commits can span windows, and each window merges
+# its commits into the stored item instead of replacing the commits an earlier window wrote.
+window_days = 7
+# export shards destination (--export, tag ranges only); windows then write shards instead of the table
+export_destination = None
+backfill_workers = os.cpu_count() or 4
+date_format = '%Y-%m-%d'
+
+
+def date_windows(head_commit: str, since: str, until: str, days: int = window_days) -> List[dict]:
+    """Splits [since, until) into windows of days, each a git log revision range on the branch head"""
+
+    start = datetime.strptime(since, date_format)
+    end = datetime.strptime(until, date_format)
+    if start >= end:
+        raise ExecutionHistoryError(f'error: --since {since} is not before --until {until}.')
+
+    windows = []
+    while start < end:
+        window_end = min(start + timedelta(days=days), end)
+        windows.append({
+            'id': f'{start.strftime(date_format)}..{window_end.strftime(date_format)}',
+            'revision_range': [head_commit, '--since', start.isoformat(), '--until', window_end.isoformat()],
+            'build_number': None
+        })
+        start = window_end
+
+    return windows
+
+
+def tag_windows(from_tag: str, to_tag: str) -> List[dict]:
+    """Returns one window per tag after from_tag up to to_tag, holding the commits since the previous
+       tag. The tag names the build the window's items are recorded under."""
+
+    backend = git_backend.SubprocessGitBackend(update_execution_history.xhfw_repo)
+    process = backend.run(['tag', '--sort=creatordate', '--contains', from_tag, '--merged', to_tag])
+    if process.returncode != 0:
+        raise ExecutionHistoryError(f'error listing tags {from_tag}..{to_tag}: {process.stderr.strip()}')
+
+    tags = [tag for tag in process.stdout.split() if tag != from_tag]
+    windows = []
+    previous_tag = from_tag
+    for tag in tags:
+        windows.append({'id': f'{previous_tag}..{tag}', 'revision_range': [f'{previous_tag}..{tag}'],
+                        'build_number': tag})
+        previous_tag = tag
+
+    return windows
+
+
+def fetch_tags():
+    """Fetches every tag into the repo cache"""
+
+    with update_execution_history.repo_cache_lock():
+        try:
+            git_backend.SubprocessGitBackend(update_execution_history.xhfw_repo).fetch_ref(
+                'origin', '+refs/tags/*:refs/tags/*')
+        except git_backend.GitError as e:
+            raise ExecutionHistoryError(f'error fetching tags: {e}') from e
+
+
+def load_checkpoint(path: str, job: dict) -> dict:
+    """Returns the checkpoint of an interrupted run of the same job, or a new one"""
+
+    checkpoint = {'job': job, 'job_id': job_id(job), 'completed': []}
+    try:
+        with open(path) as json_file:
+            stored = json.load(json_file)
+    except FileNotFoundError:
+        return checkpoint
+    except ValueError:
+        print(f'warning: ignoring unreadable checkpoint {path}.')
+        return checkpoint
+
+    if stored.get('job_id') != checkpoint['job_id']:
+        print(f'warning: checkpoint {path} belongs to another backfill, starting over.')
+        return checkpoint
+
+    return stored
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """Replaces the checkpoint file atomically so a crash never leaves it half written"""
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f'{path}.tmp', 'w') as json_file:
+        json.dump(checkpoint, json_file, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def job_id(job: dict) -> str:
+    return hashlib.sha1(json.dumps(job, sort_keys=True).encode()).hexdigest()
+
+
+def worker_settings(workers: int = 1) -> dict:
+    """Returns the module settings a worker process needs to match this process. The write capacity
+       budget is split evenly between the workers."""
+
+    return {
+        'repo_t_tables': update_execution_history.repo_t_tables,
+        'repo_cache_dir': update_execution_history.repo_cache_dir,
+        'xhfw_repo': update_execution_history.xhfw_repo,
+        'git_backend_name': update_execution_history.git_backend_name,
+        'component_map_file': update_execution_history.component_map_file,
+        'export_destination': export_destination,
+        'write_capacity': write_scheduler.write_capacity,
+        'write_capacity_share': write_scheduler.capacity_share / max(1, workers),
+        'region': aws_session.region_name,
+        'endpoint': aws_session.endpoint_url or ''
+    }
+
+
+def init_worker(settings: dict):
+    """Applies worker_settings in a pool process and drops boto3 state inherited over fork"""
+
+    global export_destination
+
+    export_destination = settings['export_destination']
+    for name in ('repo_t_tables', 'repo_cache_dir', 'xhfw_repo', 'git_backend_name', 'component_map_file'):
+        setattr(update_execution_history, name, settings[name])
+    write_scheduler.configure(settings['write_capacity'], settings['write_capacity_share'])
+    aws_session.reset()
+    aws_session.configure(region=settings['region'], endpoint=settings['endpoint'])
+
+
+def process_window(cpe_branch_details: dict, window: dict) -> dict:
+    """Harvests, builds and merges the items of one window, as parse_git_logs does for new commits"""
+
+    if window['build_number']:
+        cpe_branch_details = dict(cpe_branch_details, build_version=window['build_number'])
+
+    git_log_list, _ = update_execution_history.harvest_git_logs(cpe_branch_details, window['revision_range'])
+    payload = update_execution_history.build_db_item(git_log_list, cpe_branch_details) if git_log_list else []
+    payload += execution_history_table.build_index_records(payload)
+    table_name = update_execution_history.repo_t_tables[1]['table_name']
+    if not export_destination:
+        return update_execution_history.update_dynamodb_table(table_name, payload, 'upsert')
+
+    # each window writes its own shards; the parent lists them all in the manifest
+    writer = export_sink.ShardWriter(export_destination, re.sub(r'[^A-Za-z0-9._-]', '_', window['id']),
+                                     table_name=table_name, manifest=False)
+    with writer:
+        report = update_execution_history.export_payload(writer, table_name, payload)
+    report['shards'] = writer.shards
+
+    return report
+
+
+def backfill(branch_name: str, windows: List[dict], cpe_branch_details: dict, checkpoint: dict,
+             checkpoint_path: str, workers: int = backfill_workers) -> dict:
+    """Processes the windows the checkpoint does not list as completed, recording each window in the
+       checkpoint as soon as all its items are written. Returns reports by window id."""
+
+    pending = [window for window in windows if window['id'] not in checkpoint['completed']]
+    print(f'Backfilling {len(pending)} of {len(windows)} window(s) for {branch_name}.')
+
+    reports = {}
+    for window, report in run_windows(cpe_branch_details, pending, workers):
+        reports[window['id']] = report
+        if not update_execution_history.report_failed(report):
+            checkpoint['completed'].append(window['id'])
+            if 'shards' in report:
+                checkpoint.setdefault('shards', {})[window['id']] = report['shards']
+            save_checkpoint(checkpoint_path, checkpoint)
+            metrics.increment('backfill_windows_completed')
+        else:
+            metrics.increment('backfill_windows_failed')
+        print(f'{window["id"]}: {report["message"]}')
+
+    return reports
+
+
+def run_windows(cpe_branch_details: dict, windows: List[dict], workers: int) -> Iterator[Tuple[dict, dict]]:
+    """Yields (window, report) as windows complete on a process pool, or one after the other in this
+       process for a single worker"""
+
+    if workers <= 1:
+        for window in windows:
+            try:
+                report = process_window(cpe_branch_details, window)
+            except Exception as e:
+                report = update_execution_history.failed_report(f'error processing window {window["id"]}: {e}')
+            yield window, report
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(worker_settings(workers),)) as executor:
+        futures = {executor.submit(process_window, cpe_branch_details, window): window for window in windows}
+        for future in as_completed(futures):
+            window = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                report = update_execution_history.failed_report(f'error processing window {window["id"]}: {e}')
+            yield window, report
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Backfills the Repo_T Execution History table for a gerrit branch over a date or tag range. '
+                    'Rerunning the same command resumes from its checkpoint.',
+        epilog='eg. "$ python backfill_execution_history.py release/10.7 --since 2020-01-01 --until 2021-01-01"')
+    parser.add_argument('gerrit_branch_name')
+    parser.add_argument('--since', help=f'first day of a date range ({date_format.replace("%", "")})')
+    parser.add_argument('--until', help='day after the date range')
+    parser.add_argument('--window-days', type=int, default=window_days, help='days per date window')
+    parser.add_argument('--from-tag', help='tag whose commits are already recorded')
+    parser.add_argument('--to-tag', help='last tag to backfill; each tag in between becomes a build')
+    parser.add_argument('--build-version', default=None,
+                        help='build number for date windows (default: the branch build_version)')
+    parser.add_argument('--workers', type=int, default=backfill_workers,
+                        help='worker processes (1 runs the windows in this process)')
+    parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint file (default: backfill-<branch>.json in the repo cache)')
+    parser.add_argument('--export', default=None, metavar='DESTINATION',
+                        help='write gzip DynamoDB JSON import shards and a manifest to a directory or '
+                             's3://bucket/prefix instead of the table (tag ranges only)')
+    parser.add_argument('--repo-cache', default=update_execution_history.repo_cache_dir,
+                        help='directory holding the persistent partial clone of the gerrit repo')
+    parser.add_argument('--write-capacity', type=update_execution_history.write_capacity_setting,
+                        default=write_scheduler.write_capacity,
+                        help="pace writes to 'auto' (the table's provisioned write capacity), a number of write "
+                             "capacity units per second shared by all workers, or 'off'")
+
+    parsed = parser.parse_args(args)
+    if bool(parsed.since) != bool(parsed.until) or bool(parsed.from_tag) != bool(parsed.to_tag):
+        parser.error('--since needs --until and --from-tag needs --to-tag')
+    if bool(parsed.since) == bool(parsed.from_tag):
+        parser.error('give either a date range (--since/--until) or a tag range (--from-tag/--to-tag)')
+    if parsed.window_days < 1:
+        parser.error('--window-days must be at least 1')
+    if parsed.export and parsed.since:
+        # date windows share one build number, so a jira id spanning windows would repeat its key across
+        # shards, and an import keeps only one of them
+        parser.error('--export needs a tag range (--from-tag/--to-tag); date windows cannot be exported')
+
+    return parsed
+
+
+def main(args: list) -> int:
+    global export_destination
+
+    parsed = parse_args(args)
+    export_destination = parsed.export
+    write_scheduler.configure(parsed.write_capacity)
+    update_execution_history.repo_cache_dir = parsed.repo_cache
+    update_execution_history.xhfw_repo = os.path.join(parsed.repo_cache, 'core')
+    branch_name = parsed.gerrit_branch_name
+    checkpoint_path = parsed.checkpoint or os.path.join(parsed.repo_cache,
+                                                        f'backfill-{branch_name.replace("/", "_")}.json')
+
+    try:
+        cpe_branch_details = update_execution_history.get_branch_details([branch_name]).get(branch_name)
+        if cpe_branch_details is None:
+            raise ExecutionHistoryError(f'error: {branch_name} not found in table. Check value.')
+        if parsed.build_version:
+            cpe_branch_details = dict(cpe_branch_details, build_version=parsed.build_version)
+
+        update_execution_history.clone_repo(cpe_branch_details)
+        if parsed.since:
+            head_commit = update_execution_history.get_head_commit(
+                update_execution_history.remote_branch_ref(branch_name))
+            windows = date_windows(head_commit, parsed.since, parsed.until, parsed.window_days)
+            job = {'branch': branch_name, 'since': parsed.since, 'until': parsed.until,
+                   'window_days': parsed.window_days, 'build_version': cpe_branch_details['build_version']}
+        else:
+            fetch_tags()
+            windows = tag_windows(parsed.from_tag, parsed.to_tag)
+            job = {'branch': branch_name, 'from_tag': parsed.from_tag, 'to_tag': parsed.to_tag}
+        job['export'] = export_destination
+
+        checkpoint = load_checkpoint(checkpoint_path, job)
+        reports = backfill(branch_name, windows, cpe_branch_details, checkpoint, checkpoint_path, parsed.workers)
+        if export_destination:
+            shards = [shard for window in windows for shard in checkpoint.get('shards', {}).get(window['id'], [])]
+            export_sink.write_manifest(export_destination, shards,
+                                       update_execution_history.repo_t_tables[1]['table_name'])
+    except (ExecutionHistoryError, OSError, export_sink.ExportError) as e:
+        print(e)
+        return 1
+
+    failed = [window_id for window_id, report in reports.items() if update_execution_history.report_failed(report)]
+    if failed:
+        print(f'error: {len(failed)} window(s) failed; rerun to resume from {checkpoint_path}.')
+        return 1
+
+    print(f'Backfill of {branch_name} complete.')
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,304 @@
+import os
+import sys
+import argparse
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+import aws_session
+import branch_details_cache
+import execution_history_table
+import git_backend
+import metrics
+import update_execution_history
+
+bench_tables = [
+    {
+        'table_name': 'Bench_Repo_T_Gerrit_CPE_Branch_Details',
+        'p_key': 'gerrit_branch_name'
+    },
+    {
+        'table_name': 'Bench_Repo_T_Execution_History',
+        'p_key': 'build_number',
+        's_key': 'jira_id'
+    }
+]
+
+bench_branch = 'release/bench'
+jira_project = 'XHFW'
+
+
+class CountingPopen(subprocess.Popen):
+    """Popen that counts spawned processes while a benchmark stage runs"""
+
+    count = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingPopen.count += 1
+        super().__init__(*args, **kwargs)
+
+
+@contextmanager
+def count_subprocesses():
+    """Routes subprocess.Popen/run through CountingPopen"""
+
+    popen = subprocess.Popen
+    subprocess.Popen = CountingPopen
+    try:
+        yield
+    finally:
+        subprocess.Popen = popen
+
+
+def generate_repo(path: str, commits: int, developers: int, files_per_commit: int, risk_frequency: float,
+                  seed: int = 0) -> list:
+    """Creates a synthetic git repo with one git fast-import stream. Commits are spread over the last
+       hour so they fall inside the harvest window. Returns the developer names."""
+
+    rng = random.Random(seed)
+    developer_names = [f'Developer {number}' for number in range(developers)]
+    jira_ids = max(1, commits // 4)
+    now = int(time.time())
+
+    stream = []
+    for number in range(commits):
+        name = developer_names[number % developers]
+        email = name.lower().replace(' ', '_') + '@example.com'
+        timestamp = now - 3600 + number * 3600 // max(1, commits)
+        message = f'{jira_project}-{rng.randrange(jira_ids) + 1000} : synthetic change {number}\n\n'
+        if rng.random() < risk_frequency:
+            message += f'Risks: {rng.choice(["Low", "Medium", "High"])}\n'
+        message = message.encode()
+
+        stream.append(f'commit refs/heads/{bench_branch}\nmark :{number + 1}\n'.encode())
+        stream.append(f'author {name} <{email}> {timestamp} +0000\n'.encode())
+        stream.append(f'committer {name} <{email}> {timestamp} +0000\n'.encode())
+        stream.append(f'data {len(message)}\n'.encode() + message)
+        if number > 0:
+            stream.append(f'from :{number}\n'.encode())
+        for _ in range(files_per_commit):
+            content = f'{number} {rng.random()}\n'.encode()
+            filename = f'source/module{rng.randrange(50)}/file{rng.randrange(200)}.c'
+            stream.append(f'M 100644 inline {filename}\ndata {len(content)}\n'.encode() + content)
+        stream.append(b'\n')
+
+    subprocess.run(['git', 'init', '-q', '--bare', path], check=True)
+    subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=path, check=True)
+    subprocess.run(['git', 'fast-import', '--quiet'], input=b''.join(stream), cwd=path, check=True)
+
+    return developer_names
+
+
+def create_tables(dynamodb):
+    """Creates the benchmark branch details and execution history tables"""
+
+    for table in bench_tables:
+        if 's_key' in table:
+            dynamodb.create_table(**execution_history_table.table_definition(table['table_name'], 1000, 1000))
+            continue
+        dynamodb.create_table(
+            TableName=table['table_name'],
+            KeySchema=[{'AttributeName': table['p_key'], 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': table['p_key'], 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 1000, 'WriteCapacityUnits': 1000}
+        )
+
+
+def delete_tables(dynamodb):
+    for table in bench_tables:
+        dynamodb.Table(table['table_name']).delete()
+
+
+def reset_peak_rss() -> bool:
+    """Resets this process's resident set high-water mark (VmHWM) to its current RSS. Returns False
+       where /proc/self/clear_refs is unavailable."""
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_kb() -> Optional[int]:
+    """Returns this process's resident set high-water mark in KB since the last reset, or None"""
+
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def measure(stages: Dict[str, dict], name: str, function: Callable, *args):
+    """Runs one stage and records wall time, spawned processes and the peak RSS of this process during
+       the stage. Peak RSS is None where the high-water mark cannot be reset (non-Linux): getrusage's
+       ru_maxrss only ever grows, so it would report the largest earlier stage instead."""
+
+    count = CountingPopen.count
+    resettable = reset_peak_rss()
+    start = time.perf_counter()
+    result = function(*args)
+    stages[name] = {
+        'seconds': round(time.perf_counter() - start, 6),
+        'subprocesses': CountingPopen.count - count,
+        'peak_rss_kb': peak_rss_kb() if resettable else None
+    }
+    return result
+
+
+def run_benchmark(commits: int, developers: int, files_per_commit: int, risk_frequency: float,
+                  seed: int = 0, git_backend_name: str = 'subprocess') -> dict:
+    """Runs the harvest/build/write pipeline against a synthetic repo and the configured DynamoDB"""
+
+    stages = {}
+    metrics.reset()
+    repo_tables = update_execution_history.repo_t_tables
+    repo_cache_dir = update_execution_history.repo_cache_dir
+    xhfw_repo = update_execution_history.xhfw_repo
+    backend_name = update_execution_history.git_backend_name
+    dynamodb = aws_session.get_resource('dynamodb')
+
+    with tempfile.TemporaryDirectory() as directory, count_subprocesses():
+        origin = os.path.join(directory, 'origin.git')
+        developer_names = measure(stages, 'generate_repo', generate_repo, origin, commits, developers,
+                                  files_per_commit, risk_frequency, seed)
+        cpe_branch_details = {
+            'build_version': '99.00.00.000000',
+            'developers': developer_names,
+            'gerrit_branch_name': bench_branch,
+            'gerrit_url': f'file://{origin}',
+            'inventory_board': 'Bench_Board',
+            'nexus_url': 'https://nexus.example.com'
+        }
+
+        update_execution_history.repo_t_tables = bench_tables
+        update_execution_history.repo_cache_dir = os.path.join(directory, 'cache')
+        update_execution_history.xhfw_repo = os.path.join(directory, 'cache', 'core')
+        update_execution_history.git_backend_name = git_backend_name
+        create_tables(dynamodb)
+        try:
+            dynamodb.Table(bench_tables[0]['table_name']).put_item(Item=cpe_branch_details)
+            branch_details_cache.invalidate(bench_tables[0]['table_name'])
+
+            measure(stages, 'clone_repo', update_execution_history.clone_repo, cpe_branch_details)
+            measure(stages, 'clone_repo_warm', update_execution_history.clone_repo, cpe_branch_details)
+            git_logs, _ = measure(stages, 'harvest_git_logs', update_execution_history.harvest_git_logs,
+                                  cpe_branch_details)
+            payload = measure(stages, 'build_db_item', update_execution_history.build_db_item, git_logs,
+                              cpe_branch_details)
+            report = measure(stages, 'update_dynamodb_table', update_execution_history.update_dynamodb_table,
+                             bench_tables[1]['table_name'], payload)
+            measure(stages, 'build_dynamodb_payload', update_execution_history.build_dynamodb_payload,
+                    cpe_branch_details)
+            measure(stages, 'parse_git_logs', update_execution_history.parse_git_logs, bench_branch)
+        finally:
+            delete_tables(dynamodb)
+            update_execution_history.repo_t_tables = repo_tables
+            update_execution_history.repo_cache_dir = repo_cache_dir
+            update_execution_history.xhfw_repo = xhfw_repo
+            update_execution_history.git_backend_name = backend_name
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'git': subprocess.run(['git', '--version'], capture_output=True, text=True).stdout.strip(),
+        'dynamodb_endpoint': aws_session.endpoint_url or 'moto',
+        'config': {
+            'commits': commits,
+            'developers': developers,
+            'files_per_commit': files_per_commit,
+            'risk_frequency': risk_frequency,
+            'seed': seed,
+            'git_backend': git_backend_name
+        },
+        'results': {
+            'git_logs': len(git_logs),
+            'items': len(payload),
+            'items_written': report['succeeded']
+        },
+        'stages': stages,
+        'metrics': metrics.snapshot()
+    }
+
+
+def compare_results(baseline: dict, current: dict, max_regression: float) -> list:
+    """Returns stages whose wall time grew by more than max_regression (0.2 = 20%) over the baseline"""
+
+    regressions = []
+    for name, stage in current['stages'].items():
+        baseline_stage = baseline['stages'].get(name)
+        if not baseline_stage or baseline_stage['seconds'] <= 0:
+            continue
+        ratio = stage['seconds'] / baseline_stage['seconds']
+        print(f'{name}: {baseline_stage["seconds"]:.3f}s -> {stage["seconds"]:.3f}s ({ratio:.2f}x), '
+              f'subprocesses {baseline_stage["subprocesses"]} -> {stage["subprocesses"]}')
+        if ratio > 1 + max_regression:
+            regressions.append(name)
+
+    return regressions
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Benchmarks update_execution_history against a synthetic git repo and moto or DynamoDB Local.',
+        epilog='eg. "$ python benchmark_execution_history.py --commits 2000 --output bench.json"')
+    parser.add_argument('--commits', type=int, default=500)
+    parser.add_argument('--developers', type=int, default=10)
+    parser.add_argument('--files-per-commit', type=int, default=3)
+    parser.add_argument('--risk-frequency', type=float, default=0.5,
+                        help='fraction of commits with a "Risks:" line')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--git-backend', choices=list(git_backend.backends), default='subprocess')
+    parser.add_argument('--endpoint', default=None,
+                        help='DynamoDB endpoint (eg. http://localhost:8000); moto is used when omitted')
+    parser.add_argument('--output', default=None, help='write results as JSON to this file')
+    parser.add_argument('--baseline', default=None, help='compare against results JSON from a previous run')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed per-stage slowdown against the baseline before exiting 1')
+
+    return parser.parse_args(args)
+
+
+def main(args: list) -> int:
+    parsed = parse_args(args)
+    benchmark_args = (parsed.commits, parsed.developers, parsed.files_per_commit, parsed.risk_frequency,
+                      parsed.seed, parsed.git_backend)
+
+    if parsed.endpoint:
+        aws_session.configure(endpoint=parsed.endpoint)
+        results = run_benchmark(*benchmark_args)
+    else:
+        from moto import mock_dynamodb2
+
+        with mock_dynamodb2():
+            aws_session.reset()
+            results = run_benchmark(*benchmark_args)
+        aws_session.reset()
+
+    print(json.dumps(results, indent=2))
+    if parsed.output:
+        with open(parsed.output, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+    if parsed.baseline:
+        with open(parsed.baseline) as json_file:
+            baseline = json.load(json_file)
+        regressions = compare_results(baseline, results, parsed.max_regression)
+        if regressions:
+            print(f'error: regressions in {", ".join(regressions)}')
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
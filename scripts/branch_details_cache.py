@@ -0,0 +1,154 @@
+import os
+import copy
+import json
+import threading
+import time
+from typing import Callable, Dict, List
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+import metrics
+
+# Read-through cache of Repo_T_Gerrit_CPE_Branch_Details rows. Rows change about once per release,
+# so they are served from memory, and optionally from a file shared by later runs, until ttl expires.
+# A ttl of 0 disables caching.
+ttl = float(os.environ.get('REPO_T_BRANCH_CACHE_TTL', '900'))
+cache_file = os.environ.get('REPO_T_BRANCH_CACHE_FILE') or None
+
+_lock = threading.Lock()
+# (table_name, key) -> (expires_at, item)
+_entries = {}
+_loaded_file = None
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def configure(ttl_seconds: float = None, path: str = None):
+    """Overrides the ttl and the cache file ('' for none). Drops in-memory entries so the next lookup
+       reads the new file."""
+
+    global ttl, cache_file, _loaded_file
+
+    with _lock:
+        if ttl_seconds is not None:
+            ttl = ttl_seconds
+        if path is not None:
+            cache_file = path or None
+        _entries.clear()
+        _loaded_file = None
+
+
+def get(table_name: str, key: str, load: Callable[[str], dict]) -> dict:
+    """Returns the cached item for key, calling load(key) and caching its result on a miss"""
+
+    return get_many(table_name, [key], lambda keys: {keys[0]: load(keys[0])})[key]
+
+
+def get_many(table_name: str, keys: List[str], load_many: Callable[[list], Dict[str, dict]]) -> Dict[str, dict]:
+    """Returns cached items by key, loading every missing or expired key with one load_many(keys) call
+       (eg. a BatchGetItem). Keys load_many does not return are left out of the result."""
+
+    items = {}
+    with _lock:
+        _load_file()
+        now = time.time()
+        for key in dict.fromkeys(keys):
+            entry = _entries.get((table_name, key))
+            if entry and entry[0] > now:
+                items[key] = copy.deepcopy(entry[1])
+    missing = [key for key in dict.fromkeys(keys) if key not in items]
+    metrics.increment('branch_cache_hits', len(items))
+    if not missing:
+        return items
+
+    metrics.increment('branch_cache_misses', len(missing))
+    loaded = load_many(missing)
+    put_many(table_name, loaded)
+    items.update(loaded)
+
+    return items
+
+
+def put_many(table_name: str, items: Dict[str, dict]):
+    """Caches items by key, eg. every row of a table Scan"""
+
+    if ttl <= 0 or not items:
+        return
+
+    with _lock:
+        _load_file()
+        expires_at = time.time() + ttl
+        for key, item in items.items():
+            _entries[(table_name, key)] = (expires_at, copy.deepcopy(item))
+        _save_file()
+
+
+def update(table_name: str, key: str, attributes: dict):
+    """Writes attributes through to a cached item after the table row was updated, keeping its expiry"""
+
+    with _lock:
+        _load_file()
+        entry = _entries.get((table_name, key))
+        if entry is None:
+            return
+        entry[1].update(copy.deepcopy(attributes))
+        _save_file()
+
+
+def invalidate(table_name: str = None, key: str = None):
+    """Drops the cached item for key, every item of table_name, or everything"""
+
+    with _lock:
+        _load_file()
+        for entry_key in list(_entries):
+            if table_name in (None, entry_key[0]) and key in (None, entry_key[1]):
+                del _entries[entry_key]
+        _save_file()
+
+
+def _load_file():
+    """Reads unexpired entries from the cache file once per configured file. Call with _lock held."""
+
+    global _loaded_file
+
+    if not cache_file or _loaded_file == cache_file:
+        return
+    _loaded_file = cache_file
+
+    try:
+        with open(cache_file) as json_file:
+            tables = json.load(json_file)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        print(f'warning: ignoring unreadable branch details cache {cache_file}.')
+        return
+
+    now = time.time()
+    for table_name, entries in tables.items():
+        for key, entry in entries.items():
+            if entry['expires_at'] > now and (table_name, key) not in _entries:
+                item = _deserializer.deserialize({'M': entry['item']})
+                _entries[(table_name, key)] = (entry['expires_at'], item)
+
+
+def _save_file():
+    """Replaces the cache file with the unexpired entries. Call with _lock held."""
+
+    if not cache_file:
+        return
+
+    now = time.time()
+    tables = {}
+    for (table_name, key), (expires_at, item) in _entries.items():
+        if expires_at > now:
+            tables.setdefault(table_name, {})[key] = {
+                'expires_at': expires_at,
+                'item': _serializer.serialize(item)['M']
+            }
+
+    directory = os.path.dirname(cache_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_file = f'{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary_file, 'w') as json_file:
+        json.dump(tables, json_file)
+    os.replace(temporary_file, cache_file)
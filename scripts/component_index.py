@@ -0,0 +1,91 @@
+import json
+import threading
+from typing import Dict, List, Tuple
+
+# A component map is a JSON object of path prefix -> {"package": ..., "component": ...}, eg.
+#   {"source/utils/networkUtil": {"package": "xhNetworkUtil", "component": "Networking"},
+#    "source/*/test": {"component": "Tests"}}
+# Prefixes match whole path segments and '*' matches any one segment. Each field comes from the
+# deepest prefix defining it, so a nested rule can override the component and inherit the package.
+# Between rules of the same depth, the one with more exact segments wins.
+wildcard = '*'
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+class ComponentIndex:
+    """Prefix trie over path segments. Resolving a path only visits the nodes of rules matching one of
+       its prefixes, so the cost depends on path length and wildcards, not on the number of rules."""
+
+    def __init__(self, rules: Dict[str, dict] = None):
+        self.root = {}
+        for prefix, rule in (rules or {}).items():
+            self.add(prefix, rule)
+
+    def add(self, prefix: str, rule: dict):
+        node = self.root
+        for segment in split_path(prefix):
+            node = node.setdefault('children', {}).setdefault(segment, {})
+        node['rule'] = {field: rule[field] for field in ('package', 'component') if rule.get(field)}
+
+    def resolve(self, path: str) -> Tuple[str, str]:
+        """Returns (package, component) of a path; '' where no rule applies. Both the exact segment
+           and '*' are followed at each level, so a deeper wildcard rule is found past an exact one."""
+
+        found = {}
+        self._walk(self.root, split_path(path), 0, 0, found)
+        return found.get('package', (None, ''))[1], found.get('component', (None, ''))[1]
+
+    def _walk(self, node: dict, segments: List[str], depth: int, exact: int, found: dict):
+        """Records in found, per field, the (depth, exact segments) rank and value of the best rule"""
+
+        for field, value in node.get('rule', {}).items():
+            if field not in found or (depth, exact) > found[field][0]:
+                found[field] = ((depth, exact), value)
+        children = node.get('children')
+        if not children or depth == len(segments):
+            return
+        child = children.get(segments[depth])
+        if child is not None:
+            self._walk(child, segments, depth + 1, exact + 1, found)
+        if segments[depth] != wildcard and wildcard in children:
+            self._walk(children[wildcard], segments, depth + 1, exact, found)
+
+    def package(self, filenames: List[str]) -> str:
+        """Returns the package most of a commit's files belong to, the first one seen on a tie"""
+
+        counts = {}
+        for filename in filenames:
+            package, _ = self.resolve(filename)
+            if package:
+                counts[package] = counts.get(package, 0) + 1
+
+        return max(counts, key=counts.get) if counts else ''
+
+    def components(self, filenames: List[str]) -> List[str]:
+        """Returns the distinct components of a commit's files in first seen order"""
+
+        components = {}
+        for filename in filenames:
+            _, component = self.resolve(filename)
+            if component:
+                components[component] = None
+
+        return list(components)
+
+
+def split_path(path: str) -> List[str]:
+    return [segment for segment in path.strip().split('/') if segment and segment != '.']
+
+
+def load(path: str) -> ComponentIndex:
+    """Returns the index compiled from a component map file, compiling each file once per process"""
+
+    with _lock:
+        index = _loaded.get(path)
+        if index is None:
+            with open(path) as json_file:
+                index = _loaded[path] = ComponentIndex(json.load(json_file))
+
+    return index
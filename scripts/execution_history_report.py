@@ -0,0 +1,271 @@
+import sys
+import argparse
+import csv
+import json
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, TextIO
+import aws_session
+import execution_history_table
+import metrics
+from execution_history_table import ExecutionHistoryError, decompress_filenames
+
+# Items are handed from the scan threads to the writer through a bounded queue, so at most queue_size
+# items plus one page per segment are held however large the table is. The per-build aggregates keep
+# each build's distinct commits, developers and files until the end, since a parallel scan can return
+# a build's items at any point; their memory grows with those distinct values, not with the items.
+total_segments = 4
+queue_size = 1000
+item_fields = ['build_number', 'jira_id', 'branch_name', 'inventory_board', 'developers', 'commits',
+               'files', 'risks']
+aggregate_fields = ['build_number', 'branch_names', 'items', 'commits', 'developers', 'files_touched',
+                    'risk_high', 'risk_medium', 'risk_low', 'risk_none', 'risk_other']
+risk_levels = ['high', 'medium', 'low', 'none']
+
+_done = object()
+
+
+def scan_segment(table_name: str, segment: int, segments: int, page_size: int = None) -> Iterator[dict]:
+    """Yields the execution history items of one Scan segment, leaving developer and jira records out"""
+
+    table = aws_session.get_resource('dynamodb').Table(table_name)
+    kwargs = {'Segment': segment, 'TotalSegments': segments,
+              'FilterExpression': execution_history_table.items_filter()}
+    if page_size:
+        kwargs['Limit'] = page_size
+    for item in execution_history_table.paginate(table.scan, **kwargs):
+        metrics.increment('report_items_scanned')
+        yield item
+
+
+def parallel_scan(table_name: str, segments: int = total_segments, page_size: int = None,
+                  max_queued: int = queue_size) -> Iterator[dict]:
+    """Yields every execution history item, scanning segments concurrently. Items arrive in no
+       particular order. Closing the iterator early stops the scan threads."""
+
+    items = queue.Queue(maxsize=max_queued)
+    stop = threading.Event()
+
+    def put(value) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan(segment: int):
+        try:
+            for item in scan_segment(table_name, segment, segments, page_size):
+                if not put(item):
+                    return
+        except Exception as e:
+            put(ExecutionHistoryError(f'error scanning segment {segment} of {table_name}: {e}'))
+        finally:
+            put(_done)
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        for segment in range(segments):
+            executor.submit(scan, segment)
+        try:
+            remaining = segments
+            while remaining:
+                item = items.get()
+                if item is _done:
+                    remaining -= 1
+                elif isinstance(item, ExecutionHistoryError):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+
+
+def query_items(build_number: str = None, jira_id: str = None, developer: str = None,
+                table_name: str = execution_history_table.default_table_name,
+                page_size: int = None) -> Iterator[dict]:
+    """Yields the items of one build, jira id or developer through the table's key and indexes"""
+
+    if build_number and not jira_id and not developer:
+        return execution_history_table.query_build(build_number, table_name, page_size)
+    if jira_id:
+        items = execution_history_table.query_jira(jira_id, table_name, page_size)
+        return (item for item in items if not build_number or item['build_number'] == build_number)
+    if developer:
+        return execution_history_table.query_developer(developer, table_name, build_number, page_size)
+
+    raise ExecutionHistoryError('a build number, jira id or developer is required to query')
+
+
+def new_aggregate(build_number: str) -> dict:
+    return {
+        'build_number': build_number,
+        'branch_names': set(),
+        'items': 0,
+        'commits': set(),
+        'developers': set(),
+        'files_touched': set(),
+        'risks': Counter()
+    }
+
+
+def add_to_aggregates(aggregates: Dict[str, dict], item: dict):
+    """Folds one item into the running aggregate of its build. Later pages of an item add their
+       commits to the same build, so only distinct values are kept."""
+
+    aggregate = aggregates.get(item['build_number'])
+    if aggregate is None:
+        aggregate = aggregates[item['build_number']] = new_aggregate(item['build_number'])
+
+    aggregate['items'] += 1
+    aggregate['branch_names'].add(item.get('branch_name', ''))
+    aggregate['developers'].update(item.get('developers', []))
+    for git_log in item.get('git_logs', []):
+        if git_log['commit'] in aggregate['commits']:
+            continue
+        aggregate['commits'].add(git_log['commit'])
+        aggregate['files_touched'].update(decompress_filenames(git_log))
+        aggregate['risks'][git_log.get('risk', '') or 'none'] += 1
+
+
+def aggregate_row(aggregate: dict) -> dict:
+    """Returns the counts of a build aggregate. Risks outside risk_levels (eg. 'Very High') are
+       counted as risk_other, so every commit is counted once."""
+
+    risks = Counter()
+    for risk, count in aggregate['risks'].items():
+        risk = risk.strip().lower() or 'none'
+        risks[risk if risk in risk_levels else 'other'] += count
+    return {
+        'build_number': aggregate['build_number'],
+        'branch_names': sorted(aggregate['branch_names']),
+        'items': aggregate['items'],
+        'commits': len(aggregate['commits']),
+        'developers': len(aggregate['developers']),
+        'files_touched': len(aggregate['files_touched']),
+        'risk_high': risks['high'],
+        'risk_medium': risks['medium'],
+        'risk_low': risks['low'],
+        'risk_none': risks['none'],
+        'risk_other': risks['other']
+    }
+
+
+def item_row(item: dict) -> dict:
+    """Returns the flat CSV row of an item"""
+
+    git_logs = item.get('git_logs', [])
+    return {
+        'build_number': item['build_number'],
+        'jira_id': item['jira_id'],
+        'branch_name': item.get('branch_name', ''),
+        'inventory_board': item.get('inventory_board', ''),
+        'developers': ';'.join(item.get('developers', [])),
+        'commits': len(git_logs),
+        'files': sum(len(decompress_filenames(git_log)) for git_log in git_logs),
+        'risks': ';'.join(sorted({git_log['risk'] for git_log in git_logs if git_log.get('risk')}))
+    }
+
+
+class ReportWriter:
+    """Writes rows to a file as they arrive, as NDJSON or CSV"""
+
+    def __init__(self, output: TextIO, output_format: str, fields: list):
+        self.output = output
+        self.output_format = output_format
+        self.csv_writer = None
+        if output_format == 'csv':
+            self.csv_writer = csv.DictWriter(output, fieldnames=fields, extrasaction='ignore')
+            self.csv_writer.writeheader()
+
+    def write(self, row: dict):
+        if self.csv_writer:
+            self.csv_writer.writerow({key: ';'.join(value) if isinstance(value, list) else value
+                                      for key, value in row.items()})
+        else:
+            self.output.write(json.dumps(row, default=execution_history_table.json_default) + '\n')
+
+
+@metrics.timed('report')
+def write_report(items: Iterator[dict], output: TextIO, output_format: str = 'ndjson',
+                 aggregates_output: TextIO = None) -> Dict[str, dict]:
+    """Streams items to output (whole items as NDJSON, or one summary row each as CSV) while
+       aggregating per build, then writes the build aggregates to aggregates_output.
+       Returns the aggregate rows by build number."""
+
+    writer = ReportWriter(output, output_format, item_fields) if output else None
+    aggregates = {}
+    for item in items:
+        if execution_history_table.is_index_record(item):
+            continue
+        add_to_aggregates(aggregates, item)
+        if writer:
+            writer.write(item_row(item) if output_format == 'csv' else item)
+
+    rows = {build_number: aggregate_row(aggregate) for build_number, aggregate in sorted(aggregates.items())}
+    if aggregates_output:
+        aggregates_writer = ReportWriter(aggregates_output, output_format, aggregate_fields)
+        for row in rows.values():
+            aggregates_writer.write(row)
+
+    return rows
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Streams the Repo_T Execution History table as NDJSON or CSV with per-build aggregates. '
+                    'Scans the whole table unless a build, jira id or developer is given.',
+        epilog='eg. "$ python execution_history_report.py --format csv --output items.csv --aggregates builds.csv"')
+    parser.add_argument('--build', help='only items of this build number')
+    parser.add_argument('--jira', help='only items of this jira id')
+    parser.add_argument('--developer', help='only items this developer contributed to')
+    parser.add_argument('--table', default=execution_history_table.default_table_name)
+    parser.add_argument('--segments', type=int, default=total_segments,
+                        help='parallel Scan segments (TotalSegments) for a full table report')
+    parser.add_argument('--page-size', type=int, default=None, help='items per Scan/Query request')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('--output', default='-', help='items file, "-" for stdout, "" to skip items')
+    parser.add_argument('--aggregates', default=None, help='per-build aggregates file, "-" for stdout')
+
+    parsed = parser.parse_args(args)
+    if parsed.segments < 1:
+        parser.error('--segments must be at least 1')
+
+    return parsed
+
+
+def open_output(path: str) -> TextIO:
+    if path is None or path == '':
+        return None
+    if path == '-':
+        return sys.stdout
+    return open(path, 'w', newline='')
+
+
+def main(args: list) -> int:
+    parsed = parse_args(args)
+    if parsed.build or parsed.jira or parsed.developer:
+        items = query_items(parsed.build, parsed.jira, parsed.developer, parsed.table, parsed.page_size)
+    else:
+        items = parallel_scan(parsed.table, parsed.segments, parsed.page_size)
+
+    output = open_output(parsed.output)
+    aggregates_output = open_output(parsed.aggregates)
+    try:
+        write_report(items, output, parsed.format, aggregates_output)
+    except ExecutionHistoryError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        for stream in (output, aggregates_output):
+            if stream and stream is not sys.stdout:
+                stream.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
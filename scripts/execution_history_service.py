@@ -0,0 +1,227 @@
+import os
+import sys
+import argparse
+import json
+import random
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+import branch_details_cache
+import metrics
+import update_execution_history
+from update_execution_history import ExecutionHistoryError
+
+# One process polls the branches every interval, so boto3 clients, the repo cache, compiled component
+# maps and the branch details cache stay warm between cycles and a cycle only fetches and writes what
+# is new. Each wait is jittered so several services do not poll gerrit and DynamoDB in lockstep.
+poll_interval = float(os.environ.get('REPO_T_POLL_INTERVAL', 300))
+poll_jitter = 0.1
+health_host = '127.0.0.1'
+health_port = int(os.environ.get('REPO_T_HEALTH_PORT', 8089))
+# /healthz turns unhealthy once no cycle has succeeded for this many intervals
+stale_intervals = 3
+metric_labels = {'job': 'execution_history_service'}
+
+
+class Service:
+    """Polls branches on a schedule and keeps the state the health endpoint reports. stop() ends run()
+       from another thread or a signal handler without waiting out the interval."""
+
+    def __init__(self, branch_names: List[str] = None, interval: float = poll_interval, jitter: float = poll_jitter,
+                 workers: int = update_execution_history.branch_workers, metrics_file: str = None,
+                 metrics_format: str = 'prometheus'):
+        self.branch_names = branch_names
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = workers
+        self.metrics_file = metrics_file
+        self.metrics_format = metrics_format
+        self.started = time.time()
+        self.cycles = 0
+        self.last_cycle = None
+        self.last_success = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._all_branches = []
+        self._all_branches_expire = 0.0
+
+    def run(self, max_cycles: int = None):
+        """Runs cycles until stopped, or until max_cycles have run"""
+
+        while not self._stop.is_set():
+            start = time.monotonic()
+            self.run_cycle()
+            if max_cycles is not None and self.cycles >= max_cycles:
+                break
+            self._stop.wait(max(0.0, self.next_delay() - (time.monotonic() - start)))
+
+    def stop(self):
+        self._stop.set()
+
+    def next_delay(self) -> float:
+        """Returns the interval from one cycle start to the next, jittered by up to +/- jitter of it"""
+
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def run_cycle(self) -> Dict[str, dict]:
+        """Parses every branch once. Returns the report per branch."""
+
+        start = time.time()
+        error = ''
+        try:
+            with metrics.timer('service_cycle'):
+                reports = update_execution_history.parse_branches(self.cycle_branches(), self.workers)
+        except ExecutionHistoryError as e:
+            reports = {}
+            error = str(e)
+            print(e)
+        except Exception as e:
+            # a daemon outlives a bad cycle: record it as failed and poll again next interval
+            reports = {}
+            error = f'error running cycle: {type(e).__name__}: {e}'
+            print(error)
+
+        for branch_name, response in reports.items():
+            update_execution_history.print_report(branch_name, response)
+
+        failed = sorted(branch_name for branch_name, response in reports.items()
+                        if update_execution_history.report_failed(response))
+        metrics.increment('service_cycles')
+        metrics.increment('service_branch_failures', len(failed))
+        with self._lock:
+            self.cycles += 1
+            self.last_cycle = {'started': start, 'seconds': time.time() - start, 'branches': len(reports),
+                               'failed_branches': failed, 'error': error}
+            if not error and not failed:
+                self.last_success = time.time()
+
+        if self.metrics_file:
+            try:
+                metrics.write(self.metrics_file, self.metrics_format, metric_labels)
+            except OSError as e:
+                print(f'warning: could not write metrics to {self.metrics_file}: {e}')
+
+        return reports
+
+    def cycle_branches(self) -> List[str]:
+        """Returns the branches to poll. Without configured names every row of the branch details table
+           is polled; the table is only rescanned once the branch details cache ttl has passed, in
+           between the names come from the last scan and their details from the cache."""
+
+        if self.branch_names:
+            return self.branch_names
+
+        if time.monotonic() >= self._all_branches_expire:
+            self._all_branches = list(update_execution_history.get_branch_details())
+            self._all_branches_expire = time.monotonic() + branch_details_cache.ttl
+
+        return self._all_branches
+
+    def health(self) -> dict:
+        """Returns the service state; 'healthy' is False once no cycle has succeeded for stale_intervals"""
+
+        now = time.time()
+        with self._lock:
+            last_ok = self.last_success or self.started
+            return {
+                'healthy': now - last_ok <= self.interval * stale_intervals,
+                'uptime_seconds': now - self.started,
+                'cycles': self.cycles,
+                'seconds_since_success': now - self.last_success if self.last_success else None,
+                'last_cycle': dict(self.last_cycle) if self.last_cycle else None
+            }
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Serves /healthz (JSON, 503 when unhealthy) and /metrics (Prometheus text)"""
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            health = self.server.service.health()
+            self.respond(200 if health['healthy'] else 503, 'application/json', json.dumps(health))
+        elif self.path == '/metrics':
+            self.respond(200, 'text/plain; version=0.0.4', metrics.to_prometheus(metric_labels))
+        else:
+            self.respond(404, 'text/plain', 'not found\n')
+
+    def respond(self, status: int, content_type: str, body: str):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_health_server(service: Service, host: str = health_host, port: int = health_port) -> ThreadingHTTPServer:
+    """Serves the health endpoint on a daemon thread. Port 0 picks a free port (see server_address)."""
+
+    server = ThreadingHTTPServer((host, port), HealthHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = update_execution_history.build_parser(
+        description='Polls gerrit branches on a schedule and uploads new git commits to the Repo_T Execution '
+                    'History table, serving /healthz and /metrics on a local port.',
+        epilog='eg. "$ python execution_history_service.py --all --interval 120 --port 8089"')
+    parser.add_argument('--interval', type=float, default=poll_interval, help='seconds between cycle starts')
+    parser.add_argument('--jitter', type=float, default=poll_jitter,
+                        help='fraction of the interval each wait is randomly lengthened or shortened by')
+    parser.add_argument('--host', default=health_host, help='address the health endpoint listens on')
+    parser.add_argument('--port', type=int, default=health_port, help='health endpoint port (0 disables it)')
+    parser.add_argument('--max-cycles', type=int, default=None, help='exit after this many cycles')
+    parser.set_defaults(metrics_format='prometheus')
+
+    parsed = parser.parse_args(args)
+    if not parsed.gerrit_branch_names and not parsed.all:
+        parser.error('give at least one gerrit branch name, or --all')
+    if parsed.export or parsed.delete_repo or parsed.profile:
+        parser.error('--export, --delete-repo and --profile apply to single runs only')
+    if parsed.interval <= 0 or not 0 <= parsed.jitter < 1:
+        parser.error('--interval must be positive and --jitter in [0, 1)')
+
+    return parsed
+
+
+def main(args: list) -> int:
+    parsed = parse_args(args)
+    update_execution_history.apply_args(parsed)
+    service = Service(None if parsed.all else parsed.gerrit_branch_names, parsed.interval, parsed.jitter,
+                      parsed.workers, parsed.metrics_file, parsed.metrics_format)
+
+    def stop(signum, frame):
+        print(f'Received signal {signum}, stopping after the current cycle.')
+        service.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    server = None
+    if parsed.port:
+        try:
+            server = start_health_server(service, parsed.host, parsed.port)
+        except OSError as e:
+            print(f'error: could not serve health endpoint on {parsed.host}:{parsed.port}: {e}')
+            return 1
+    try:
+        service.run(parsed.max_cycles)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,327 @@
+import sys
+import argparse
+import json
+import random
+import time
+import zlib
+from decimal import Decimal
+from typing import Iterator, List
+from boto3.dynamodb.conditions import Attr, Key
+import aws_session
+
+# Repo_T_Execution_History holds one item per (build_number, jira_id). Items split across pages
+# carry a '#<page>' suffix on jira_id after the first page. Because a GSI cannot index the
+# developers list, every item also gets one small developer record per developer, keyed
+# (build_number, 'developer#<jira_id>#<name>'), which the developer GSI indexes. Keying them under the
+# item's jira id lets a rewrite of the item find and delete the records of developers it no longer has. Items of commits
+# referencing several jira ids are keyed by the ids joined with '_' (eg. XHFW-1565_XHFW-1566), so they
+# likewise get one jira record per id, keyed (build_number, 'jira#<id>#<jira_id>'), which the linked
+# jira GSI indexes.
+default_table_name = 'Repo_T_Execution_History'
+partition_key = 'build_number'
+sort_key = 'jira_id'
+jira_index = 'jira_id-index'
+developer_index = 'developer-index'
+linked_jira_index = 'linked_jira_id-index'
+developer_record_prefix = 'developer#'
+jira_record_prefix = 'jira#'
+page_separator = '#'
+jira_id_separator = '_'
+# BatchGetItem retry policy for unprocessed keys
+batch_get_max_attempts = 8
+backoff_base = 0.05
+backoff_cap = 5.0
+
+
+class ExecutionHistoryError(Exception):
+    """Raised when a branch cannot be processed. Isolates failures to the branch that hit them."""
+
+
+def decompress_filenames(git_log: dict) -> list:
+    """Returns a git log's file list whether it is stored plain or zlib-compressed"""
+
+    if 'filenames_zlib' in git_log:
+        data = git_log['filenames_zlib']
+        data = data.value if hasattr(data, 'value') else data
+        filenames = zlib.decompress(bytes(data)).decode()
+        return filenames.split('\n') if filenames else []
+
+    return list(git_log.get('filenames', []))
+
+
+def table_definition(table_name: str = default_table_name, read_capacity: int = 5, write_capacity: int = 5) -> dict:
+    """Returns create_table arguments for the composite key schema and its jira_id/developer/linked jira GSIs"""
+
+    throughput = {'ReadCapacityUnits': read_capacity, 'WriteCapacityUnits': write_capacity}
+    return {
+        'TableName': table_name,
+        'KeySchema': [
+            {'AttributeName': partition_key, 'KeyType': 'HASH'},
+            {'AttributeName': sort_key, 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': partition_key, 'AttributeType': 'S'},
+            {'AttributeName': sort_key, 'AttributeType': 'S'},
+            {'AttributeName': 'developer', 'AttributeType': 'S'},
+            {'AttributeName': 'linked_jira_id', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': jira_index,
+                'KeySchema': [
+                    {'AttributeName': sort_key, 'KeyType': 'HASH'},
+                    {'AttributeName': partition_key, 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': dict(throughput)
+            },
+            {
+                'IndexName': developer_index,
+                'KeySchema': [
+                    {'AttributeName': 'developer', 'KeyType': 'HASH'},
+                    {'AttributeName': partition_key, 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['item_jira_id', 'branch_name']},
+                'ProvisionedThroughput': dict(throughput)
+            },
+            {
+                'IndexName': linked_jira_index,
+                'KeySchema': [
+                    {'AttributeName': 'linked_jira_id', 'KeyType': 'HASH'},
+                    {'AttributeName': partition_key, 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['item_jira_id', 'branch_name']},
+                'ProvisionedThroughput': dict(throughput)
+            }
+        ],
+        'ProvisionedThroughput': throughput
+    }
+
+
+def create_table(table_name: str = default_table_name, read_capacity: int = 5, write_capacity: int = 5,
+                 wait: bool = True):
+    """Creates the execution history table and waits until it is active"""
+
+    dynamo_db = aws_session.get_resource('dynamodb')
+    table = dynamo_db.create_table(**table_definition(table_name, read_capacity, write_capacity))
+    if wait:
+        table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+
+    return table
+
+
+def build_developer_records(payload: list) -> list:
+    """Returns the developer records indexing each payload item by developer"""
+
+    records = []
+    for db_item in payload:
+        for developer in db_item.get('developers', []):
+            records.append({
+                partition_key: db_item[partition_key],
+                sort_key: f'{developer_record_prefix}{db_item[sort_key]}{page_separator}{developer}',
+                'developer': developer,
+                'item_jira_id': db_item[sort_key],
+                'branch_name': db_item.get('branch_name', '')
+            })
+
+    return records
+
+
+def build_jira_records(payload: list) -> list:
+    """Returns the jira records indexing each payload item keyed by several jira ids under each of them.
+       Later pages are left out; readers reach them through the first page's pagination block."""
+
+    records = []
+    for db_item in payload:
+        if page_separator in db_item[sort_key] or is_index_record(db_item):
+            continue
+        jira_ids = db_item[sort_key].split(jira_id_separator)
+        if len(jira_ids) < 2:
+            continue
+        for jira_id in jira_ids:
+            records.append({
+                partition_key: db_item[partition_key],
+                sort_key: f'{jira_record_prefix}{jira_id}{page_separator}{db_item[sort_key]}',
+                'linked_jira_id': jira_id,
+                'item_jira_id': db_item[sort_key],
+                'branch_name': db_item.get('branch_name', '')
+            })
+
+    return records
+
+
+def build_index_records(payload: list) -> list:
+    """Returns the developer and jira records of the payload items"""
+
+    return build_developer_records(payload) + build_jira_records(payload)
+
+
+def is_developer_record(item: dict) -> bool:
+    return item.get(sort_key, '').startswith(developer_record_prefix)
+
+
+def is_jira_record(item: dict) -> bool:
+    return item.get(sort_key, '').startswith(jira_record_prefix)
+
+
+def is_index_record(item: dict) -> bool:
+    return is_developer_record(item) or is_jira_record(item)
+
+
+def items_filter():
+    """Returns the Query/Scan filter leaving developer and jira records out"""
+
+    return Attr('developer').not_exists() & Attr('linked_jira_id').not_exists()
+
+
+def paginate(operation, **kwargs) -> Iterator[dict]:
+    """Yields items from a Query or Scan, requesting the next page only when the previous one is consumed"""
+
+    while True:
+        response = operation(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def query_build(build_number: str, table_name: str = default_table_name, page_size: int = None) -> Iterator[dict]:
+    """Yields every execution history item of a build ("what went into build X")"""
+
+    table = aws_session.get_resource('dynamodb').Table(table_name)
+    kwargs = {'KeyConditionExpression': Key(partition_key).eq(build_number), 'FilterExpression': items_filter()}
+    if page_size:
+        kwargs['Limit'] = page_size
+    yield from paginate(table.query, **kwargs)
+
+
+def query_jira(jira_id: str, table_name: str = default_table_name, page_size: int = None) -> Iterator[dict]:
+    """Yields the items of every build containing a jira id ("which builds contain XHFW-1234"),
+       including items shared with other jira ids and the later pages of paginated items"""
+
+    table = aws_session.get_resource('dynamodb').Table(table_name)
+    kwargs = {'IndexName': jira_index, 'KeyConditionExpression': Key(sort_key).eq(jira_id.upper())}
+    if page_size:
+        kwargs['Limit'] = page_size
+    for item in paginate(table.query, **kwargs):
+        yield from with_pages(item, table_name)
+
+    kwargs = dict(kwargs, IndexName=linked_jira_index, KeyConditionExpression=Key('linked_jira_id').eq(jira_id.upper()))
+    keys = []
+    for record in paginate(table.query, **kwargs):
+        keys.append({partition_key: record[partition_key], sort_key: record['item_jira_id']})
+        if len(keys) == 100:
+            for item in get_items(keys, table_name):
+                yield from with_pages(item, table_name)
+            keys = []
+    if keys:
+        for item in get_items(keys, table_name):
+            yield from with_pages(item, table_name)
+
+
+def with_pages(item: dict, table_name: str = default_table_name) -> Iterator[dict]:
+    """Yields an item followed by its later pages"""
+
+    yield item
+    total_pages = int(item.get('pagination', {}).get('total_pages', 0))
+    if total_pages > 1:
+        keys = [{partition_key: item[partition_key], sort_key: f'{item[sort_key]}{page_separator}{page}'}
+                for page in range(2, total_pages + 1)]
+        yield from get_items(keys, table_name)
+
+
+def query_developer(developer: str, table_name: str = default_table_name, build_number: str = None,
+                    page_size: int = None) -> Iterator[dict]:
+    """Yields the items a developer contributed to, optionally limited to one build"""
+
+    table = aws_session.get_resource('dynamodb').Table(table_name)
+    condition = Key('developer').eq(developer)
+    if build_number:
+        condition = condition & Key(partition_key).eq(build_number)
+    kwargs = {'IndexName': developer_index, 'KeyConditionExpression': condition}
+    if page_size:
+        kwargs['Limit'] = page_size
+
+    keys = []
+    for record in paginate(table.query, **kwargs):
+        keys.append({partition_key: record[partition_key], sort_key: record['item_jira_id']})
+        if len(keys) == 100:
+            yield from get_items(keys, table_name)
+            keys = []
+    if keys:
+        yield from get_items(keys, table_name)
+
+
+def get_items(keys: List[dict], table_name: str = default_table_name) -> Iterator[dict]:
+    """Yields items for up to 100 keys with BatchGetItem, re-requesting unprocessed keys with jittered
+       exponential backoff"""
+
+    dynamo_db = aws_session.get_resource('dynamodb')
+    request = {table_name: {'Keys': keys}}
+    for attempt in range(batch_get_max_attempts):
+        if attempt > 0:
+            time.sleep(backoff_delay(attempt))
+        response = dynamo_db.batch_get_item(RequestItems=request)
+        yield from response['Responses'].get(table_name, [])
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return
+
+    raise ExecutionHistoryError(f'unprocessed keys remain after {batch_get_max_attempts} attempts')
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """Returns full jitter exponential backoff delay in seconds for a retry attempt"""
+
+    base = backoff_base if base is None else base
+    cap = backoff_cap if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    if hasattr(value, 'value'):
+        return value.value.hex()
+    raise TypeError(f'{type(value)} is not JSON serializable')
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Queries the Repo_T Execution History table, printing one JSON item per line.',
+        epilog='eg. "$ python execution_history_table.py --jira XHFW-1234"')
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--build', help='items of a build number')
+    query.add_argument('--jira', help='items of every build containing a jira id')
+    query.add_argument('--developer', help='items a developer contributed to')
+    query.add_argument('--create-table', action='store_true', help='provision the table and its indexes')
+    parser.add_argument('--table', default=default_table_name)
+    parser.add_argument('--page-size', type=int, default=None, help='items per Query request')
+
+    return parser.parse_args(args)
+
+
+def main(args: list) -> int:
+    parsed = parse_args(args)
+    if parsed.create_table:
+        create_table(parsed.table)
+        print(f'Created {parsed.table} table.')
+        return 0
+
+    if parsed.build:
+        items = query_build(parsed.build, parsed.table, parsed.page_size)
+    elif parsed.jira:
+        items = query_jira(parsed.jira, parsed.table, parsed.page_size)
+    else:
+        items = query_developer(parsed.developer, parsed.table, page_size=parsed.page_size)
+
+    for item in items:
+        print(json.dumps(item, default=json_default))
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
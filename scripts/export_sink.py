@@ -0,0 +1,187 @@
+import os
+import base64
+import gzip
+import hashlib
+import json
+import tempfile
+import threading
+from typing import List
+from boto3.dynamodb.types import TypeSerializer
+import aws_session
+import execution_history_table
+import metrics
+
+# Payloads exported for DynamoDB import from S3: gzip-compressed shards of DynamoDB JSON lines
+# ({"Item": {...}}), rotated once a shard holds max_shard_bytes of uncompressed JSON, plus a
+# manifest.json listing the shards and the table definition to import them into. Shards go under
+# data/, since ImportTable reads every object below its key prefix. Shards are written to a temporary
+# file and uploaded when complete, so memory stays flat.
+max_shard_bytes = 64 * 1024 * 1024
+manifest_name = 'manifest.json'
+data_directory = 'data'
+
+_serializer = TypeSerializer()
+
+
+class ExportError(Exception):
+    """Raised when a shard or manifest cannot be written"""
+
+
+def to_dynamodb_json(item: dict) -> dict:
+    """Returns an item in DynamoDB JSON, binary values base64 encoded as the import format expects"""
+
+    return {attribute: encode_binary(_serializer.serialize(value)) for attribute, value in item.items()}
+
+
+def encode_binary(value: dict) -> dict:
+    (data_type, data), = value.items()
+    if data_type == 'B':
+        return {'B': base64.b64encode(bytes(data)).decode()}
+    if data_type == 'BS':
+        return {'BS': [base64.b64encode(bytes(item)).decode() for item in data]}
+    if data_type == 'M':
+        return {'M': {key: encode_binary(item) for key, item in data.items()}}
+    if data_type == 'L':
+        return {'L': [encode_binary(item) for item in data]}
+    return value
+
+
+def split_destination(destination: str) -> tuple:
+    """Returns (bucket, key prefix) of an s3://bucket/prefix destination, or (None, directory)"""
+
+    if destination.startswith('s3://'):
+        bucket, _, prefix = destination[len('s3://'):].partition('/')
+        return bucket, prefix.strip('/')
+    return None, destination
+
+
+class ShardWriter:
+    """Writes items to gzip DynamoDB JSON shards in a local directory or under an s3://bucket/prefix.
+       Safe to share between threads."""
+
+    def __init__(self, destination: str, shard_prefix: str = 'items', max_bytes: int = None,
+                 table_name: str = execution_history_table.default_table_name, manifest: bool = True):
+        self.destination = destination
+        self.bucket, self.prefix = split_destination(destination)
+        self.shard_prefix = shard_prefix
+        self.max_bytes = max_bytes or max_shard_bytes
+        self.table_name = table_name
+        self.manifest = manifest
+        self.shards = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._name = None
+        self._items = 0
+        self._bytes = 0
+        if not self.bucket:
+            os.makedirs(os.path.join(self.prefix, data_directory), exist_ok=True)
+
+    def write(self, items: list) -> int:
+        """Appends items to the current shard, starting a new shard whenever it is full"""
+
+        with self._lock:
+            for item in items:
+                line = (json.dumps({'Item': to_dynamodb_json(item)}, separators=(',', ':')) + '\n').encode()
+                if self._file is not None and self._bytes + len(line) > self.max_bytes:
+                    self._finish_shard()
+                if self._file is None:
+                    self._start_shard()
+                self._file.write(line)
+                self._items += 1
+                self._bytes += len(line)
+            metrics.increment('export_items', len(items))
+
+        return len(items)
+
+    def close(self) -> List[dict]:
+        """Finishes the last shard and writes the manifest. Returns the shards written."""
+
+        with self._lock:
+            if self._file is not None:
+                self._finish_shard()
+            if self.manifest:
+                write_manifest(self.destination, self.shards, self.table_name)
+
+        return self.shards
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _start_shard(self):
+        name = f'{data_directory}/{self.shard_prefix}-{len(self.shards):05}.json.gz'
+        if self.bucket:
+            handle, self._path = tempfile.mkstemp(suffix='.json.gz')
+            os.close(handle)
+        else:
+            self._path = os.path.join(self.prefix, name)
+        self._name = name
+        self._file = gzip.open(self._path, 'wb')
+        self._items = 0
+        self._bytes = 0
+
+    def _finish_shard(self):
+        self._file.close()
+        self._file = None
+        sha256 = hashlib.sha256()
+        with open(self._path, 'rb') as shard_file:
+            for block in iter(lambda: shard_file.read(1024 * 1024), b''):
+                sha256.update(block)
+        shard = {'key': self._name, 'items': self._items, 'uncompressed_bytes': self._bytes,
+                 'compressed_bytes': os.path.getsize(self._path), 'sha256': sha256.hexdigest()}
+
+        if self.bucket:
+            key = f'{self.prefix}/{self._name}' if self.prefix else self._name
+            try:
+                aws_session.get_client('s3').upload_file(self._path, self.bucket, key)
+            except Exception as e:
+                raise ExportError(f'error uploading shard s3://{self.bucket}/{key}: {e}') from e
+            finally:
+                os.remove(self._path)
+
+        self.shards.append(shard)
+        metrics.increment('export_shards')
+        metrics.increment('export_compressed_bytes', shard['compressed_bytes'])
+
+
+def write_manifest(destination: str, shards: List[dict],
+                   table_name: str = execution_history_table.default_table_name):
+    """Writes manifest.json describing the shards and the ImportTable parameters for them"""
+
+    bucket, prefix = split_destination(destination)
+    data_prefix = f'{prefix}/{data_directory}/' if bucket and prefix else f'{data_directory}/'
+    definition = execution_history_table.table_definition(table_name)
+    for index in definition['GlobalSecondaryIndexes']:
+        del index['ProvisionedThroughput']
+    del definition['ProvisionedThroughput']
+    manifest = {
+        'items': sum(shard['items'] for shard in shards),
+        'shards': shards,
+        'import_table': {
+            'S3BucketSource': {'S3Bucket': bucket or '', 'S3KeyPrefix': data_prefix},
+            'InputFormat': 'DYNAMODB_JSON',
+            'InputCompressionType': 'GZIP',
+            'TableCreationParameters': dict(definition, BillingMode='PAY_PER_REQUEST')
+        }
+    }
+    body = json.dumps(manifest, indent=2)
+
+    if bucket:
+        key = f'{prefix}/{manifest_name}' if prefix else manifest_name
+        try:
+            aws_session.get_client('s3').put_object(Bucket=bucket, Key=key, Body=body.encode())
+        except Exception as e:
+            raise ExportError(f'error writing manifest s3://{bucket}/{key}: {e}') from e
+    else:
+        with open(os.path.join(prefix, manifest_name), 'w') as manifest_file:
+            manifest_file.write(body)
+
+
+def read_items(path: str) -> List[dict]:
+    """Returns the DynamoDB JSON items of a local shard, eg. to inspect a dry run"""
+
+    with gzip.open(path, 'rt') as shard_file:
+        return [json.loads(line)['Item'] for line in shard_file]
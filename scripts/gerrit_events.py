@@ -0,0 +1,297 @@
+import sys
+import argparse
+import json
+import queue
+import signal
+import socket
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import metrics
+import update_execution_history
+from update_execution_history import ExecutionHistoryError
+
+# Ingests gerrit stream-events output: one JSON event per line, eg. from
+#   ssh -p 29418 gerrit stream-events -s ref-updated -s change-merged | python gerrit_events.py --all
+# Events only say which branches moved; each branch run still harvests from its watermark to the fetched
+# head, so events lost while nothing was listening are picked up by the next event on that branch.
+# A burst of merges on a branch is coalesced into one run once the branch has been quiet for
+# quiet_seconds, or max_delay_seconds after its first event at the latest.
+quiet_seconds = 5.0
+max_delay_seconds = 60.0
+poll_interval = 1.0
+branch_ref_prefix = 'refs/heads/'
+queue_size = 1024
+
+_end = object()
+
+
+def parse_event(line: str) -> Optional[dict]:
+    """Returns the event on a stream-events line, or None for blank or malformed lines"""
+
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        event = json.loads(line)
+    except ValueError:
+        print(f'warning: ignoring malformed event {line[:200]}')
+        metrics.increment('gerrit_events_malformed')
+        return None
+
+    return event if isinstance(event, dict) else None
+
+
+def branch_update(event: dict, project: str = None) -> Optional[Tuple[str, str]]:
+    """Returns (branch name, new revision) of a ref-updated or change-merged event on a branch,
+       or None for other events, other projects and refs that are not branches"""
+
+    if event.get('type') == 'ref-updated':
+        ref_update = event.get('refUpdate') or {}
+        ref_name = ref_update.get('refName', '')
+        event_project = ref_update.get('project')
+        revision = ref_update.get('newRev', '')
+        if ref_name.startswith(branch_ref_prefix):
+            branch_name = ref_name[len(branch_ref_prefix):]
+        elif ref_name.startswith('refs/'):
+            return None
+        else:
+            # older gerrit versions send branch names without refs/heads/
+            branch_name = ref_name
+        if set(revision) == {'0'}:
+            return None
+    elif event.get('type') == 'change-merged':
+        change = event.get('change') or {}
+        branch_name = change.get('branch', '')
+        event_project = change.get('project')
+        revision = event.get('newRev') or (event.get('patchSet') or {}).get('revision', '')
+    else:
+        return None
+
+    if not branch_name or (project and event_project != project):
+        return None
+
+    return branch_name, revision
+
+
+class Coalescer:
+    """Collects branch updates until each branch is due for a run"""
+
+    def __init__(self, quiet: float = quiet_seconds, max_delay: float = max_delay_seconds):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.pending = {}
+
+    def add(self, branch_name: str, revision: str, now: float):
+        update = self.pending.get(branch_name)
+        if update is None:
+            self.pending[branch_name] = {'first': now, 'last': now, 'events': 1, 'revision': revision}
+        else:
+            update.update(last=now, revision=revision, events=update['events'] + 1)
+            metrics.increment('gerrit_events_coalesced')
+
+    def due_at(self, branch_name: str) -> float:
+        update = self.pending[branch_name]
+        return min(update['last'] + self.quiet, update['first'] + self.max_delay)
+
+    def next_due(self) -> Optional[float]:
+        return min((self.due_at(branch_name) for branch_name in self.pending), default=None)
+
+    def pop_due(self, now: float) -> Dict[str, dict]:
+        """Removes and returns the updates of every branch that is due"""
+
+        due = [branch_name for branch_name in self.pending if self.due_at(branch_name) <= now]
+        return {branch_name: self.pending.pop(branch_name) for branch_name in due}
+
+    def pop_all(self) -> Dict[str, dict]:
+        pending, self.pending = self.pending, {}
+        return pending
+
+
+def open_source(source: str, follow: bool = False, stop: threading.Event = None) -> Iterator[str]:
+    """Yields the lines of stdin ('-'), a tcp://host:port socket or a file, which with follow is read
+       like tail -f until stop is set"""
+
+    if source == '-':
+        yield from sys.stdin
+    elif source.startswith('tcp://'):
+        host, _, port = source[len('tcp://'):].rpartition(':')
+        try:
+            connection = socket.create_connection((host, int(port)))
+        except (OSError, ValueError) as e:
+            raise ExecutionHistoryError(f'error connecting to event stream {source}: {e}') from e
+        with connection, connection.makefile('r', encoding='utf-8') as stream:
+            yield from stream
+    else:
+        try:
+            stream = open(source, encoding='utf-8')
+        except OSError as e:
+            raise ExecutionHistoryError(f'error opening event stream {source}: {e}') from e
+        with stream:
+            partial = ''
+            while True:
+                line = stream.readline()
+                if line.endswith('\n'):
+                    yield partial + line
+                    partial = ''
+                elif line:
+                    # a writer is midway through a line
+                    partial += line
+                elif not follow or (stop is not None and stop.is_set()):
+                    break
+                else:
+                    time.sleep(poll_interval / 10)
+            if partial:
+                yield partial
+
+
+def read_lines(lines: Iterable[str], events: queue.Queue, errors: list):
+    try:
+        for line in lines:
+            events.put(line)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        events.put(_end)
+
+
+class Ingester:
+    """Runs branches as their coalesced events come due. Branch runs happen on the calling thread while
+       a reader thread keeps queueing events, so events arriving during a run coalesce for the next one."""
+
+    def __init__(self, branch_names: List[str] = None, project: str = None, quiet: float = quiet_seconds,
+                 max_delay: float = max_delay_seconds, workers: int = update_execution_history.branch_workers):
+        self.branch_names = set(branch_names) if branch_names else None
+        self.project = project
+        self.coalescer = Coalescer(quiet, max_delay)
+        self.workers = workers
+        self.reports = {}
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, lines: Iterable[str], catch_up: bool = False) -> Dict[str, dict]:
+        """Consumes lines until they end or stop() is called, then runs whatever is still pending.
+           With catch_up the configured branches are run once first. Returns the last report per branch."""
+
+        if catch_up:
+            for branch_name in sorted(self.branch_names or update_execution_history.get_branch_details()):
+                self.coalescer.add(branch_name, '', float('-inf'))
+
+        events = queue.Queue(maxsize=queue_size)
+        errors = []
+        threading.Thread(target=read_lines, args=(lines, events, errors), daemon=True).start()
+        while not self._stop.is_set():
+            self.run_branches(self.coalescer.pop_due(time.monotonic()))
+            next_due = self.coalescer.next_due()
+            timeout = poll_interval if next_due is None else min(poll_interval, next_due - time.monotonic())
+            try:
+                line = events.get(timeout=max(0.0, timeout))
+            except queue.Empty:
+                continue
+            if line is _end:
+                break
+            self.add_event(line)
+
+        self.run_branches(self.coalescer.pop_all())
+        if errors:
+            raise ExecutionHistoryError(f'error reading event stream: {errors[0]}')
+
+        return self.reports
+
+    def add_event(self, line: str):
+        event = parse_event(line)
+        update = branch_update(event, self.project) if event else None
+        if update is None or (self.branch_names is not None and update[0] not in self.branch_names):
+            metrics.increment('gerrit_events_ignored')
+            return
+
+        metrics.increment('gerrit_events')
+        self.coalescer.add(*update, time.monotonic())
+
+    def run_branches(self, updates: Dict[str, dict]):
+        if not updates:
+            return
+
+        branch_names = list(updates)
+        if self.branch_names is None:
+            # with --all only branches in the branch details table are tracked
+            branch_names = [name for name in branch_names
+                            if name in update_execution_history.get_branch_details(branch_names)]
+            metrics.increment('gerrit_events_untracked', len(updates) - len(branch_names))
+            if not branch_names:
+                return
+
+        for branch_name in branch_names:
+            print(f'{branch_name}: {updates[branch_name]["events"]} event(s), '
+                  f'head {updates[branch_name]["revision"][:12] or "unknown"}')
+        try:
+            with metrics.timer('gerrit_event_run'):
+                reports = update_execution_history.parse_branches(branch_names, self.workers)
+        except ExecutionHistoryError as e:
+            print(e)
+            reports = {branch_name: update_execution_history.failed_report(str(e)) for branch_name in branch_names}
+
+        metrics.increment('gerrit_branch_runs', len(reports))
+        for branch_name, response in reports.items():
+            update_execution_history.print_report(branch_name, response)
+        self.reports.update(reports)
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = update_execution_history.build_parser(
+        description='Uploads new git commits to the Repo_T Execution History table as gerrit ref-updated and '
+                    'change-merged events arrive on a stream-events JSON line stream.',
+        epilog='eg. "$ ssh -p 29418 gerrit stream-events | python gerrit_events.py --all --source -"')
+    parser.add_argument('--source', default='-',
+                        help='event stream: - for stdin, tcp://host:port or a file (default: stdin)')
+    parser.add_argument('--follow', action='store_true', help='keep reading a file source as it grows')
+    parser.add_argument('--project', default=None, help='only take events of this gerrit project')
+    parser.add_argument('--quiet-seconds', type=float, default=quiet_seconds,
+                        help='run a branch once it has had no event for this long')
+    parser.add_argument('--max-delay', type=float, default=max_delay_seconds,
+                        help='run a branch at most this long after its first pending event')
+    parser.add_argument('--catch-up', action='store_true',
+                        help='run every branch once at startup for events missed while not listening')
+
+    parsed = parser.parse_args(args)
+    if not parsed.gerrit_branch_names and not parsed.all:
+        parser.error('give the gerrit branch names to follow, or --all')
+    if parsed.export or parsed.delete_repo:
+        parser.error('--export and --delete-repo apply to single runs only')
+
+    return parsed
+
+
+def main(args: list) -> int:
+    parsed = parse_args(args)
+    update_execution_history.apply_args(parsed)
+    ingester = Ingester(None if parsed.all else parsed.gerrit_branch_names, parsed.project, parsed.quiet_seconds,
+                        parsed.max_delay, parsed.workers)
+
+    stop_reading = threading.Event()
+
+    def stop(signum, frame):
+        print(f'Received signal {signum}, stopping after pending branches.')
+        stop_reading.set()
+        ingester.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        with metrics.profile(parsed.profile), metrics.timer('run'):
+            reports = ingester.run(open_source(parsed.source, parsed.follow, stop_reading), parsed.catch_up)
+    except ExecutionHistoryError as e:
+        print(e)
+        return 1
+    finally:
+        if parsed.metrics_file:
+            metrics.write(parsed.metrics_file, parsed.metrics_format, {'job': 'gerrit_events'})
+
+    return 1 if any(update_execution_history.report_failed(response) for response in reports.values()) else 0
+
+
+if __name__ == '__main__':
+    exit(main(sys.argv[1:]))
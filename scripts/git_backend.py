@@ -0,0 +1,412 @@
+import os
+import subprocess
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, Tuple
+import metrics
+
+# git log framing: records start with RS (0x1e), fields separated by US (0x1f). The body is
+# followed by a trailing US so the --name-only file list lands in the last field of its record.
+field_separator = '\x1f'
+record_separator = '\x1e'
+log_format = '%x1e%h%x1f%ad%x1f%s%x1f%an%x1f%aE%x1f%b%x1f'
+# rename detection compares file contents, which makes a blobless partial clone fetch the blobs from the
+# remote mid-harvest; without it a rename is listed as its deleted and added paths
+no_renames = '--no-renames'
+
+tree_mode = '40000'
+
+
+class GitError(Exception):
+    """Raised when a git command or object lookup fails"""
+
+
+class GitBackend(ABC):
+    """Read access to the history of one repository, plus fetching refs into it"""
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+
+    @abstractmethod
+    def list_commits(self, revision_args: list) -> Iterator[dict]:
+        """Yields git logs (commit, date, summary, author, body, filenames) for a git log revision range"""
+
+    @abstractmethod
+    def read_commit_body(self, commit: str) -> str:
+        pass
+
+    @abstractmethod
+    def list_changed_files(self, commit: str) -> list:
+        pass
+
+    @abstractmethod
+    def resolve_commit(self, ref: str) -> str:
+        """Returns the full sha of the commit ref points to"""
+
+    @abstractmethod
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        pass
+
+    def fetch_ref(self, remote: str, refspec: str, extra_args: list = None):
+        self.fetch_refs(remote, [refspec], extra_args)
+
+    @abstractmethod
+    def fetch_refs(self, remote: str, refspecs: list, extra_args: list = None):
+        """Fetches every refspec from remote in one negotiation"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SubprocessGitBackend(GitBackend):
+    """Runs one git process per operation, without a shell"""
+
+    def run(self, args: list) -> subprocess.CompletedProcess:
+        return subprocess.run(['git'] + args, cwd=self.repo_path, capture_output=True, text=True)
+
+    def list_commits(self, revision_args: list) -> Iterator[dict]:
+        args = revision_args + ['--name-only', no_renames, f'--format={log_format}']
+        for record in stream_git_log(self.repo_path, args):
+            yield parse_git_log_record(record)
+
+    def read_commit_body(self, commit: str) -> str:
+        process = self.run(['show', '-s', '--format=%b', commit])
+        if process.returncode != 0:
+            raise GitError(f'error reading commit {commit}: {process.stderr.strip()}')
+        return process.stdout
+
+    def list_changed_files(self, commit: str) -> list:
+        process = self.run(['show', '--pretty=format:', '--name-only', no_renames, commit])
+        if process.returncode != 0:
+            raise GitError(f'error listing files of {commit}: {process.stderr.strip()}')
+        return [filename for filename in process.stdout.splitlines() if filename]
+
+    def resolve_commit(self, ref: str) -> str:
+        process = self.run(['rev-parse', '--verify', f'{ref}^{{commit}}'])
+        if process.returncode != 0:
+            raise GitError(f'error resolving {ref}: {process.stderr.strip()}')
+        return process.stdout.strip()
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        return self.run(['merge-base', '--is-ancestor', ancestor, descendant]).returncode == 0
+
+    def fetch_refs(self, remote: str, refspecs: list, extra_args: list = None):
+        process = self.run(['fetch', '--quiet'] + (extra_args or []) + [remote] + list(refspecs))
+        if process.returncode != 0:
+            raise GitError(f'error fetching {" ".join(refspecs)}: {process.stderr.strip()}')
+
+
+class CatFileGitBackend(SubprocessGitBackend):
+    """Answers commit and tree lookups through long-lived git cat-file --batch / --batch-check
+       co-processes, so enriching a commit costs pipe round-trips instead of process spawns.
+       Changed files come from diffing the commit tree against its parent tree, skipping unchanged
+       subtrees; a rename is reported as its deleted and added paths. Author emails go through the
+       repository's mailmap, as git log's %aE does, and the boundary commits of a shallow clone diff
+       against an empty tree, as git log does."""
+
+    def __init__(self, repo_path: str):
+        super().__init__(repo_path)
+        self._lock = threading.Lock()
+        self._batch = None
+        self._batch_check = None
+        self._trees = {}
+        self._emails = {}
+        self._shallow = None
+
+    def _start(self, mode: str) -> subprocess.Popen:
+        return subprocess.Popen(['git', 'cat-file', mode], cwd=self.repo_path, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _request(self, process: subprocess.Popen, name: str) -> Tuple[str, str, int]:
+        process.stdin.write(f'{name}\n'.encode())
+        process.stdin.flush()
+        header = process.stdout.readline().decode().split()
+        if len(header) != 3:
+            raise GitError(f'object {name} not found')
+        return header[0], header[1], int(header[2])
+
+    def read_object(self, name: str) -> Tuple[str, str, bytes]:
+        """Returns sha, type and content of an object"""
+
+        with self._lock:
+            if self._batch is None:
+                self._batch = self._start('--batch')
+            sha, object_type, size = self._request(self._batch, name)
+            content = self._batch.stdout.read(size + 1)[:size]
+        metrics.increment('git_bytes_read', size)
+        return sha, object_type, content
+
+    def check_object(self, name: str) -> Tuple[str, str]:
+        """Returns sha and type of an object without reading its content"""
+
+        with self._lock:
+            if self._batch_check is None:
+                self._batch_check = self._start('--batch-check')
+            sha, object_type, _ = self._request(self._batch_check, name)
+        return sha, object_type
+
+    def read_commit(self, name: str) -> dict:
+        sha, object_type, content = self.read_object(name)
+        if object_type != 'commit':
+            raise GitError(f'{name} is a {object_type}, not a commit')
+        return parse_commit_object(sha, content)
+
+    def list_commits(self, revision_args: list) -> Iterator[dict]:
+        stderr = tempfile.TemporaryFile()
+        process = subprocess.Popen(['git', 'rev-list', '--abbrev-commit'] + revision_args, cwd=self.repo_path,
+                                   stdout=subprocess.PIPE, stderr=stderr, text=True)
+        try:
+            for line in process.stdout:
+                abbreviated = line.strip()
+                if not abbreviated:
+                    continue
+                commit = self.read_commit(abbreviated)
+                yield {
+                    'commit': abbreviated,
+                    'date': commit['date'],
+                    'summary': commit['summary'],
+                    'author': dict(commit['author'], email=self.mailmap_email(**commit['author'])),
+                    'body': commit['body'],
+                    'filenames': self.diff_commit(commit)
+                }
+            check_process(process, stderr, 'rev-list', revision_args)
+        finally:
+            process.stdout.close()
+            process.wait()
+            stderr.close()
+
+    def read_commit_body(self, commit: str) -> str:
+        return self.read_commit(commit)['body']
+
+    def list_changed_files(self, commit: str) -> list:
+        return self.diff_commit(self.read_commit(commit))
+
+    def resolve_commit(self, ref: str) -> str:
+        try:
+            sha, _ = self.check_object(f'{ref}^{{commit}}')
+        except GitError as e:
+            raise GitError(f'error resolving {ref}: {e}') from e
+        return sha
+
+    def diff_commit(self, commit: dict) -> list:
+        """Returns files changed by a commit. Merges list nothing, as git log --name-only does by default."""
+
+        if len(commit['parents']) > 1:
+            return []
+        parent_tree = None
+        if commit['parents'] and commit['sha'] not in self.shallow_commits():
+            parent_tree = self.read_commit(commit['parents'][0])['tree']
+        return self.diff_trees(parent_tree, commit['tree'])
+
+    def shallow_commits(self) -> set:
+        """Returns the boundary commits of a shallow clone, whose parents are not in the repository"""
+
+        if self._shallow is None:
+            process = self.run(['rev-parse', '--git-path', 'shallow'])
+            if process.returncode != 0:
+                raise GitError(f'error locating shallow file: {process.stderr.strip()}')
+            path = os.path.join(self.repo_path, process.stdout.strip())
+            self._shallow = set()
+            if os.path.exists(path):
+                with open(path) as shallow_file:
+                    self._shallow = {line.strip() for line in shallow_file if line.strip()}
+        return self._shallow
+
+    def mailmap_email(self, name: str, email: str) -> str:
+        """Returns an author email as mapped by the repository's mailmap. Each author is looked up once."""
+
+        if (name, email) not in self._emails:
+            process = self.run(['check-mailmap', f'{name} <{email}>' if name else f'<{email}>'])
+            if process.returncode != 0:
+                raise GitError(f'error reading mailmap: {process.stderr.strip()}')
+            self._emails[name, email] = process.stdout.strip().rpartition('<')[2].rstrip('>')
+        return self._emails[name, email]
+
+    def read_tree(self, sha: str) -> Dict[str, Tuple[str, str]]:
+        """Returns tree entries as name -> (mode, sha). Trees are immutable, so they are cached."""
+
+        tree = self._trees.get(sha)
+        if tree is None:
+            _, _, content = self.read_object(sha)
+            tree = self._trees[sha] = parse_tree_object(content)
+        return tree
+
+    def diff_trees(self, old_sha: str, new_sha: str, prefix: str = '') -> list:
+        if old_sha == new_sha:
+            return []
+        old_tree = self.read_tree(old_sha) if old_sha else {}
+        new_tree = self.read_tree(new_sha) if new_sha else {}
+
+        filenames = []
+        for name in sorted(set(old_tree) | set(new_tree), key=lambda name: tree_sort_key(name, old_tree, new_tree)):
+            old_mode, old_entry = old_tree.get(name, (None, None))
+            new_mode, new_entry = new_tree.get(name, (None, None))
+            if old_entry == new_entry and old_mode == new_mode:
+                continue
+            path = f'{prefix}{name}'
+            old_subtree = old_entry if old_mode == tree_mode else None
+            new_subtree = new_entry if new_mode == tree_mode else None
+            if old_subtree or new_subtree:
+                filenames.extend(self.diff_trees(old_subtree, new_subtree, f'{path}/'))
+            if (old_entry and not old_subtree) or (new_entry and not new_subtree):
+                filenames.append(path)
+
+        return filenames
+
+    def close(self):
+        with self._lock:
+            for process in (self._batch, self._batch_check):
+                if process is not None:
+                    process.stdin.close()
+                    process.stdout.close()
+                    process.wait()
+            self._batch = None
+            self._batch_check = None
+
+
+backends = {
+    'subprocess': SubprocessGitBackend,
+    'cat-file': CatFileGitBackend
+}
+
+
+def get_backend(name: str, repo_path: str) -> GitBackend:
+    """Returns a new backend by name ('subprocess' or 'cat-file') for a repository"""
+
+    try:
+        return backends[name](repo_path)
+    except KeyError:
+        raise GitError(f'unknown git backend {name}, expected one of {", ".join(backends)}')
+
+
+def stream_git_log(repo_path: str, args: list) -> Iterator[str]:
+    """Yields record separator framed git log records without buffering the full history. Raises GitError
+       once the records are exhausted if git log failed, so a failure is never mistaken for no commits."""
+
+    separator = record_separator.encode()
+    # stderr goes to a file: a pipe could fill up and block git while stdout is still being read
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(['git', 'log'] + args, cwd=repo_path, stdout=subprocess.PIPE, stderr=stderr)
+    buffer = b''
+    try:
+        for chunk in iter(lambda: process.stdout.read(65536), b''):
+            metrics.increment('git_bytes_read', len(chunk))
+            buffer += chunk
+            *records, buffer = buffer.split(separator)
+            for record in records:
+                record = record.strip(b'\n')
+                if record:
+                    yield record.decode('utf-8', errors='replace')
+        buffer = buffer.strip(b'\n')
+        if buffer:
+            yield buffer.decode('utf-8', errors='replace')
+        check_process(process, stderr, 'log', args)
+    finally:
+        process.stdout.close()
+        process.wait()
+        stderr.close()
+
+
+def check_process(process: subprocess.Popen, stderr, command: str, args: list):
+    """Waits for a streaming git process whose output was read to the end and raises GitError with its
+       stderr if it failed"""
+
+    process.stdout.close()
+    if process.wait() != 0:
+        stderr.seek(0)
+        message = stderr.read().decode('utf-8', errors='replace').strip()
+        raise GitError(f'error running git {command} {" ".join(args)}: {message or f"exit {process.returncode}"}')
+
+
+def parse_git_log_record(record: str) -> dict:
+    """Converts a framed git log record to a git log dict with commit body and changed files"""
+
+    fields, _, filenames = record.rpartition(field_separator)
+    commit, date, summary, name, email, body = fields.split(field_separator, 5)
+    return {
+        'commit': commit,
+        'date': date,
+        'summary': summary,
+        'author': {'name': name, 'email': email},
+        'body': body,
+        'filenames': [filename for filename in filenames.splitlines() if filename]
+    }
+
+
+def parse_commit_object(sha: str, content: bytes) -> dict:
+    """Parses a raw commit object into tree, parents, author, date (git's default format), summary and body"""
+
+    headers, _, message = content.decode('utf-8', errors='replace').partition('\n\n')
+    tree = None
+    parents = []
+    author = ''
+    for line in headers.splitlines():
+        if line.startswith('tree '):
+            tree = line[5:]
+        elif line.startswith('parent '):
+            parents.append(line[7:])
+        elif line.startswith('author '):
+            author = line[7:]
+
+    identity, _, when = author.rpartition('> ')
+    name, _, email = identity.partition(' <')
+    timestamp, _, offset = when.partition(' ')
+
+    paragraphs = message.strip('\n').split('\n\n', 1)
+    summary = ' '.join(line.strip() for line in paragraphs[0].splitlines())
+    body = paragraphs[1].lstrip('\n') if len(paragraphs) > 1 else ''
+
+    return {
+        'sha': sha,
+        'tree': tree,
+        'parents': parents,
+        'author': {'name': name.strip(), 'email': email},
+        'date': format_git_date(int(timestamp), offset),
+        'summary': summary,
+        'body': body
+    }
+
+
+def format_git_date(timestamp: int, offset: str) -> str:
+    """Formats a timestamp like git's default date format, eg. 'Mon Aug 9 18:45:20 2021 -0500'"""
+
+    sign = -1 if offset.startswith('-') else 1
+    minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+    date = datetime.fromtimestamp(timestamp, timezone(sign * timedelta(minutes=minutes)))
+    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+    return (f'{days[date.weekday()]} {months[date.month - 1]} {date.day} '
+            f'{date.hour:02d}:{date.minute:02d}:{date.second:02d} {date.year} {offset}')
+
+
+def parse_tree_object(content: bytes) -> Dict[str, Tuple[str, str]]:
+    """Parses a raw tree object ('<mode> <name>\\0<20 byte sha>' entries)"""
+
+    entries = {}
+    position = 0
+    while position < len(content):
+        space = content.index(b' ', position)
+        null = content.index(b'\0', space)
+        mode = content[position:space].decode()
+        name = content[space + 1:null].decode('utf-8', errors='replace')
+        entries[name] = (mode, content[null + 1:null + 21].hex())
+        position = null + 21
+
+    return entries
+
+
+def tree_sort_key(name: str, *trees: Dict[str, Tuple[str, str]]) -> str:
+    """Sorts entries the way git orders tree entries: subtrees compare as if suffixed with '/'"""
+
+    for tree in trees:
+        if name in tree:
+            return f'{name}/' if tree[name][0] == tree_mode else name
+    return name
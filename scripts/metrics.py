@@ -0,0 +1,178 @@
+import os
+import cProfile
+import functools
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+metric_prefix = 'repo_t'
+
+_lock = threading.Lock()
+_counters = {}
+_timers = {}
+# profilers of worker threads while profile() is active, merged into its dump
+_thread_profilers = None
+
+
+def increment(name: str, value: float = 1):
+    """Adds value to a counter (eg. commits harvested, bytes read from git, dynamodb retries)"""
+
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, seconds: float):
+    """Records one duration for a timer"""
+
+    with _lock:
+        timer = _timers.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0})
+        timer['count'] += 1
+        timer['sum'] += seconds
+        timer['max'] = max(timer['max'], seconds)
+
+
+@contextmanager
+def timer(name: str):
+    """Times the enclosed block"""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of the wrapped function"""
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def snapshot() -> Dict[str, dict]:
+    """Returns a copy of every counter and timer"""
+
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timers': {name: dict(timer) for name, timer in _timers.items()}
+        }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def to_json_lines(labels: dict = None) -> str:
+    """Returns metrics as one JSON object per line"""
+
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    labels = labels or {}
+    metrics = snapshot()
+    lines = []
+    for name, value in sorted(metrics['counters'].items()):
+        lines.append(json.dumps({'timestamp': timestamp, 'name': name, 'type': 'counter', 'value': value,
+                                 'labels': labels}))
+    for name, timer in sorted(metrics['timers'].items()):
+        lines.append(json.dumps({'timestamp': timestamp, 'name': name, 'type': 'timer', 'count': timer['count'],
+                                 'sum_seconds': timer['sum'], 'max_seconds': timer['max'], 'labels': labels}))
+
+    return ''.join(f'{line}\n' for line in lines)
+
+
+def to_prometheus(labels: dict = None) -> str:
+    """Returns metrics in the Prometheus text exposition format (for the node exporter textfile collector)"""
+
+    label_text = ','.join(f'{key}="{value}"' for key, value in sorted((labels or {}).items()))
+    label_text = f'{{{label_text}}}' if label_text else ''
+    metrics = snapshot()
+    lines = []
+    for name, value in sorted(metrics['counters'].items()):
+        lines.append(f'# TYPE {metric_prefix}_{name}_total counter')
+        lines.append(f'{metric_prefix}_{name}_total{label_text} {value}')
+    for name, timer in sorted(metrics['timers'].items()):
+        lines.append(f'# TYPE {metric_prefix}_{name}_seconds summary')
+        lines.append(f'{metric_prefix}_{name}_seconds_count{label_text} {timer["count"]}')
+        lines.append(f'{metric_prefix}_{name}_seconds_sum{label_text} {timer["sum"]}')
+        lines.append(f'# TYPE {metric_prefix}_{name}_seconds_max gauge')
+        lines.append(f'{metric_prefix}_{name}_seconds_max{label_text} {timer["max"]}')
+
+    return ''.join(f'{line}\n' for line in lines)
+
+
+def write(path: str, output_format: str = 'jsonl', labels: dict = None):
+    """Writes metrics to path. JSON lines are appended so runs accumulate; the Prometheus textfile is
+       replaced atomically as the textfile collector expects."""
+
+    if output_format == 'prometheus':
+        with open(f'{path}.tmp', 'w') as metrics_file:
+            metrics_file.write(to_prometheus(labels))
+        os.replace(f'{path}.tmp', path)
+    else:
+        with open(path, 'a') as metrics_file:
+            metrics_file.write(to_json_lines(labels))
+
+
+@contextmanager
+def profile(path: str = None):
+    """Dumps cProfile stats for the enclosed block to path; does nothing when path is None. cProfile only
+       sees the thread that enables it, so worker threads wrap their work in profile_thread() and their
+       stats are merged into the dump."""
+
+    global _thread_profilers
+
+    if not path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    with _lock:
+        _thread_profilers = []
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _lock:
+            thread_profilers, _thread_profilers = _thread_profilers, None
+        stats = pstats.Stats(profiler)
+        for thread_profiler in thread_profilers:
+            stats.add(thread_profiler)
+        stats.dump_stats(path)
+
+
+@contextmanager
+def profile_thread():
+    """Profiles the enclosed block of a worker thread while profile() is active in the process"""
+
+    with _lock:
+        active = _thread_profilers is not None
+    if not active:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # python 3.12+ profiles every thread from the profiler already enabled
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _lock:
+            if _thread_profilers is not None:
+                _thread_profilers.append(profiler)
@@ -0,0 +1,86 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Tuple
+import metrics
+
+# Stages hand values downstream through bounded queues: a stage that gets ahead of the next one
+# blocks on put (backpressure) instead of buffering the whole stream.
+queue_size = 256
+poll_interval = 0.1
+
+_done = object()
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage thread when the pipeline is shutting down"""
+
+
+def run(source: Iterable, stages: List[Tuple[str, Callable[[Iterator], Iterator]]],
+        max_queued: int = queue_size) -> Iterator:
+    """Yields the output of the last stage. The source and every stage run in their own thread,
+       each stage a generator function over the previous stage's output. The first exception raised
+       by any thread stops the others and is re-raised here; closing the iterator early stops them too."""
+
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=max_queued) for _ in range(len(stages) + 1)]
+
+    def put(output: queue.Queue, value):
+        while True:
+            if stop.is_set():
+                raise PipelineStopped()
+            try:
+                output.put(value, timeout=poll_interval)
+                return
+            except queue.Full:
+                metrics.increment('pipeline_blocked_puts')
+
+    def drain(source_queue: queue.Queue) -> Iterator:
+        while True:
+            if stop.is_set():
+                raise PipelineStopped()
+            try:
+                value = source_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+            if value is _done:
+                return
+            yield value
+
+    def work(name: str, values: Iterable, output: queue.Queue):
+        start = time.perf_counter()
+        iterator = iter(values)
+        try:
+            with metrics.profile_thread():
+                for value in iterator:
+                    put(output, value)
+                put(output, _done)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            metrics.observe(f'pipeline_{name}', time.perf_counter() - start)
+
+    threads = [threading.Thread(target=work, args=('source', source, queues[0]), daemon=True)]
+    for number, (name, stage) in enumerate(stages):
+        threads.append(threading.Thread(target=work, args=(name, stage(drain(queues[number])), queues[number + 1]),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        try:
+            yield from drain(queues[-1])
+        except PipelineStopped:
+            pass
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+import threading
+import aws_session
+
+
+class TestAwsSession(unittest.TestCase):
+
+    def setUp(self):
+        aws_session.reset()
+        aws_session.configure(region='us-east-2', endpoint='http://localhost:8000', pool_connections=10)
+
+    def tearDown(self):
+        aws_session.reset()
+
+    def test_get_resource_per_thread(self):
+        resources = []
+        session = aws_session.get_session()
+        build_resource = mock.patch.object(session, 'resource', wraps=session.resource)
+        threads = [threading.Thread(target=lambda: resources.extend([aws_session.get_resource('dynamodb')] * 2))
+                   for _ in range(8)]
+        with build_resource as session_resource:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # only the first thread's resource is built by the session
+        self.assertEqual(1, session_resource.call_count)
+
+        # one resource per thread, reused within the thread, all on the one shared client
+        self.assertEqual(16, len(resources))
+        self.assertEqual(8, len({id(resource) for resource in resources}))
+        self.assertIs(aws_session.get_resource('dynamodb'), aws_session.get_resource('dynamodb'))
+        client = aws_session.get_client('dynamodb')
+        self.assertTrue(all(resource.meta.client is client for resource in resources))
+        self.assertIs(client, aws_session.get_resource('dynamodb').Table('Table').meta.client)
+
+    def test_configure(self):
+        client = aws_session.get_client('dynamodb')
+        self.assertEqual('http://localhost:8000', client.meta.endpoint_url)
+        self.assertEqual(10, client.meta.config.max_pool_connections)
+
+        resource = aws_session.get_resource('dynamodb')
+        aws_session.configure(pool_connections=20)
+        self.assertIsNot(resource, aws_session.get_resource('dynamodb'))
+        reconfigured = aws_session.get_client('dynamodb')
+        self.assertIsNot(client, reconfigured)
+        self.assertEqual(20, reconfigured.meta.config.max_pool_connections)
+        self.assertEqual('http://localhost:8000', reconfigured.meta.endpoint_url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import io
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+import warnings
+from contextlib import redirect_stderr, redirect_stdout
+from moto import mock_dynamodb2
+import aws_session
+import backfill_execution_history
+import branch_details_cache
+import execution_history_table
+import update_execution_history
+
+
+@mock_dynamodb2
+class TestBackfillExecutionHistory(unittest.TestCase):
+
+    repo_t_tables = [
+        {
+            'table_name': 'Test_Backfill_Repo_T_Gerrit_CPE_Branch_Details',
+            'p_key': 'gerrit_branch_name'
+        },
+        {
+            'table_name': 'Test_Backfill_Repo_T_Execution_History',
+            'p_key': 'build_number',
+            's_key': 'jira_id'
+        }
+    ]
+
+    def setUp(self):
+        warnings.filterwarnings(action='ignore', message='unclosed', category=ResourceWarning)
+        aws_session.configure(endpoint='')
+        branch_details_cache.configure(path='')
+        self.directory = tempfile.TemporaryDirectory()
+        self.origin = os.path.join(self.directory.name, 'origin')
+
+        # one commit a day from 2021-01-01, tagged 10.07.00.00000<n> every third commit
+        subprocess.run(['git', 'init', '-q', '-b', 'release/10.7', self.origin], check=True)
+        subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=self.origin, check=True)
+        for number in range(9):
+            date = f'2021-01-{number + 1:02}T12:00:00+0000'
+            environment = dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+            git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+            message = f'XHFW-{1000 + number % 2} : change {number}'
+            subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', message], cwd=self.origin,
+                           env=environment, check=True)
+            if number % 3 == 0:
+                subprocess.run(git + ['tag', f'10.07.00.00000{number // 3}'], cwd=self.origin,
+                               env=environment, check=True)
+
+        dynamo_db = aws_session.get_resource('dynamodb')
+        dynamo_db.create_table(
+            TableName=self.repo_t_tables[0]['table_name'],
+            KeySchema=[{'AttributeName': 'gerrit_branch_name', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'gerrit_branch_name', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+        )
+        dynamo_db.create_table(**execution_history_table.table_definition(self.repo_t_tables[1]['table_name']))
+        dynamo_db.Table(self.repo_t_tables[0]['table_name']).put_item(Item={
+            'build_version': '10.07.00.000000', 'developers': ['Weston Boyd'], 'gerrit_branch_name': 'release/10.7',
+            'gerrit_url': f'file://{self.origin}', 'inventory_board': 'Onsite_Rack_8_Board_3',
+            'nexus_url': 'https://nexus.comcast.com'
+        })
+
+        self.settings = (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                         update_execution_history.xhfw_repo)
+        update_execution_history.repo_t_tables = self.repo_t_tables
+
+    def tearDown(self):
+        (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+         update_execution_history.xhfw_repo) = self.settings
+        dynamo_db = aws_session.get_resource('dynamodb')
+        for repo_t_table in self.repo_t_tables:
+            dynamo_db.Table(repo_t_table['table_name']).delete()
+        aws_session.reset()
+        self.directory.cleanup()
+
+    def run_backfill(self, *args, workers: int = 1) -> tuple:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            status = backfill_execution_history.main(['release/10.7', '--repo-cache',
+                                                      os.path.join(self.directory.name, 'cache'),
+                                                      '--workers', str(workers)] + list(args))
+        return status, output.getvalue()
+
+    def commits(self, build_number: str) -> dict:
+        items = execution_history_table.query_build(build_number, self.repo_t_tables[1]['table_name'])
+        return {item['jira_id']: sorted(log['summary'][-1] for log in item['git_logs']) for item in items}
+
+    def test_date_windows(self):
+        windows = backfill_execution_history.date_windows('a' * 40, '2021-01-01', '2021-01-10', 4)
+        self.assertEqual(['2021-01-01..2021-01-05', '2021-01-05..2021-01-09', '2021-01-09..2021-01-10'],
+                         [window['id'] for window in windows])
+        self.assertEqual(['a' * 40, '--since', '2021-01-01T00:00:00', '--until', '2021-01-05T00:00:00'],
+                         windows[0]['revision_range'])
+
+    def test_backfill_date_range_resumes(self):
+        checkpoint_path = os.path.join(self.directory.name, 'checkpoint.json')
+        args = ['--since', '2021-01-01', '--until', '2021-01-07', '--window-days', '2', '--checkpoint',
+                checkpoint_path]
+        job = {'branch': 'release/10.7', 'since': '2021-01-01', 'until': '2021-01-07', 'window_days': 2,
+               'build_version': '10.07.00.000000', 'export': None}
+        # an interrupted run finished the first window
+        backfill_execution_history.save_checkpoint(checkpoint_path, {
+            'job': job, 'job_id': backfill_execution_history.job_id(job), 'completed': ['2021-01-01..2021-01-03']})
+
+        status, output = self.run_backfill(*args)
+        self.assertEqual(0, status, output)
+        self.assertIn('Backfilling 2 of 3 window(s)', output)
+        self.assertEqual({'XHFW-1000': ['2', '4'], 'XHFW-1001': ['3', '5']}, self.commits('10.07.00.000000'))
+        with open(checkpoint_path) as json_file:
+            self.assertEqual(3, len(json.load(json_file)['completed']))
+
+        status, output = self.run_backfill(*args)
+        self.assertEqual(0, status, output)
+        self.assertIn('Backfilling 0 of 3 window(s)', output)
+
+    def test_backfill_tag_range(self):
+        status, output = self.run_backfill('--from-tag', '10.07.00.000000', '--to-tag', '10.07.00.000002')
+
+        self.assertEqual(0, status, output)
+        self.assertEqual({'XHFW-1000': ['2'], 'XHFW-1001': ['1', '3']}, self.commits('10.07.00.000001'))
+        self.assertEqual({'XHFW-1000': ['4', '6'], 'XHFW-1001': ['5']}, self.commits('10.07.00.000002'))
+        self.assertEqual({}, self.commits('10.07.00.000000'))
+
+    def test_backfill_export(self):
+        destination = os.path.join(self.directory.name, 'export')
+        # exporting windows touch no table, so they can run on the process pool next to the mock
+        status, output = self.run_backfill('--from-tag', '10.07.00.000000', '--to-tag', '10.07.00.000002',
+                                           '--export', destination, workers=2)
+
+        with open(os.path.join(destination, 'manifest.json')) as json_file:
+            manifest = json.load(json_file)
+        self.assertEqual(0, status, output)
+        self.assertEqual(['data/10.07.00.000000..10.07.00.000001-00000.json.gz',
+                          'data/10.07.00.000001..10.07.00.000002-00000.json.gz'],
+                         [shard['key'] for shard in manifest['shards']])
+        # two items and their two developer records per window
+        self.assertEqual(8, manifest['items'])
+        self.assertEqual({}, self.commits('10.07.00.000001'))
+
+    def test_backfill_export_date_range(self):
+        destination = os.path.join(self.directory.name, 'export')
+        # date windows share the build number, so their shards would repeat item keys
+        with self.assertRaises(SystemExit), redirect_stderr(io.StringIO()):
+            self.run_backfill('--since', '2021-01-01', '--until', '2021-01-07', '--export', destination)
+
+        self.assertFalse(os.path.exists(destination))
+
+    def test_parse_args(self):
+        for args in (['release/10.7'], ['release/10.7', '--since', '2021-01-01'],
+                     ['release/10.7', '--since', '2021-01-01', '--until', '2021-02-01', '--from-tag', 'a',
+                      '--to-tag', 'b']):
+            with self.assertRaises(SystemExit), redirect_stderr(io.StringIO()):
+                backfill_execution_history.parse_args(args)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from moto import mock_dynamodb2
+import aws_session
+import benchmark_execution_history
+
+
+@mock_dynamodb2
+class TestBenchmarkExecutionHistory(unittest.TestCase):
+
+    def setUp(self):
+        aws_session.configure(endpoint='')
+
+    def tearDown(self):
+        aws_session.reset()
+
+    def test_run_benchmark(self):
+        results = benchmark_execution_history.run_benchmark(commits=40, developers=4, files_per_commit=2,
+                                                            risk_frequency=0.5)
+
+        self.assertEqual(40, results['results']['git_logs'])
+        self.assertEqual(results['results']['items'], results['results']['items_written'])
+        for stage in ['clone_repo', 'harvest_git_logs', 'build_db_item', 'update_dynamodb_table',
+                      'build_dynamodb_payload', 'parse_git_logs']:
+            self.assertIn(stage, results['stages'])
+        # harvesting costs a constant number of processes regardless of commit count
+        self.assertLessEqual(results['stages']['harvest_git_logs']['subprocesses'], 3)
+        self.assertEqual(0, results['stages']['build_db_item']['subprocesses'])
+
+    def test_measure_peak_rss_per_stage(self):
+        if not benchmark_execution_history.reset_peak_rss():
+            self.skipTest('peak RSS cannot be reset on this platform')
+
+        stages = {}
+        benchmark_execution_history.measure(stages, 'allocate', lambda: len(bytearray(64 * 1024 * 1024)))
+        benchmark_execution_history.measure(stages, 'idle', lambda: None)
+
+        # the idle stage does not inherit the high-water mark of the stage before it
+        self.assertGreater(stages['allocate']['peak_rss_kb'] - stages['idle']['peak_rss_kb'], 32 * 1024)
+
+    def test_compare_results(self):
+        baseline = {'stages': {'harvest_git_logs': {'seconds': 1.0, 'subprocesses': 2},
+                               'build_db_item': {'seconds': 1.0, 'subprocesses': 0}}}
+        current = {'stages': {'harvest_git_logs': {'seconds': 1.1, 'subprocesses': 2},
+                              'build_db_item': {'seconds': 2.0, 'subprocesses': 0}}}
+
+        actual = benchmark_execution_history.compare_results(baseline, current, 0.2)
+        self.assertEqual(['build_db_item'], actual)
+
+
+if __name__ == '__main__':
+    unittest.main()
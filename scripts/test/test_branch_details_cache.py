@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+from dataclasses import dataclass
+from decimal import Decimal
+from unittest import mock
+import branch_details_cache
+
+
+class TestBranchDetailsCache(unittest.TestCase):
+
+    table_name = 'Test_Repo_T_Gerrit_CPE_Branch_Details'
+
+    def setUp(self):
+        self.ttl = branch_details_cache.ttl
+        self.loads = []
+        branch_details_cache.configure(60, '')
+
+    def tearDown(self):
+        branch_details_cache.configure(self.ttl, '')
+
+    def load_many(self, keys: list) -> dict:
+        self.loads.append(keys)
+        return {key: {'gerrit_branch_name': key, 'build_version': '10.07.00.000000', 'retries': Decimal(3),
+                      'developers': ['Weston Boyd']} for key in keys if key != 'release/0.0'}
+
+    def test_get_many(self):
+        @dataclass
+        class TestCase:
+            name: str
+            keys: list
+            expected_loads: list
+            expected_keys: list
+
+        testcases = [
+            TestCase(name='cold cache batches every key', keys=['release/10.7', 'release/10.8'],
+                     expected_loads=[['release/10.7', 'release/10.8']],
+                     expected_keys=['release/10.7', 'release/10.8']),
+            TestCase(name='only misses are loaded', keys=['release/10.7', 'release/10.9', 'release/10.9'],
+                     expected_loads=[['release/10.9']], expected_keys=['release/10.7', 'release/10.9']),
+            TestCase(name='warm cache', keys=['release/10.8'], expected_loads=[], expected_keys=['release/10.8']),
+            TestCase(name='missing rows are not cached', keys=['release/0.0'], expected_loads=[['release/0.0']],
+                     expected_keys=[]),
+            TestCase(name='missing rows are not cached again', keys=['release/0.0'],
+                     expected_loads=[['release/0.0']], expected_keys=[]),
+        ]
+
+        for case in testcases:
+            self.loads = []
+            actual = branch_details_cache.get_many(self.table_name, case.keys, self.load_many)
+            self.assertEqual(case.expected_loads, self.loads,
+                             f'failed test {case.name} expected {case.expected_loads}, actual {self.loads}')
+            self.assertEqual(case.expected_keys, sorted(actual),
+                             f'failed test {case.name} expected {case.expected_keys}, actual {sorted(actual)}')
+
+    def test_returned_items_are_copies(self):
+        item = branch_details_cache.get(self.table_name, 'release/10.7', lambda key: self.load_many([key])[key])
+        item['developers'].append('Thomas Lea')
+        item = branch_details_cache.get(self.table_name, 'release/10.7', lambda key: self.load_many([key])[key])
+        self.assertEqual(['Weston Boyd'], item['developers'])
+        self.assertEqual(1, len(self.loads))
+
+    def test_ttl(self):
+        now = 1000.0
+        with mock.patch('time.time', lambda: now):
+            branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+            now += 59
+            branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+            self.assertEqual(1, len(self.loads))
+            now += 2
+            branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+            self.assertEqual(2, len(self.loads))
+
+        branch_details_cache.configure(0)
+        branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+        branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+        self.assertEqual(4, len(self.loads))
+
+    def test_update_and_invalidate(self):
+        branch_details_cache.get_many(self.table_name, ['release/10.7', 'release/10.8'], self.load_many)
+        branch_details_cache.update(self.table_name, 'release/10.7', {'last_processed_commit': 'a' * 40})
+        actual = branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+        self.assertEqual('a' * 40, actual['release/10.7']['last_processed_commit'])
+
+        branch_details_cache.invalidate(self.table_name, 'release/10.7')
+        branch_details_cache.get_many(self.table_name, ['release/10.7', 'release/10.8'], self.load_many)
+        self.assertEqual([['release/10.7', 'release/10.8'], ['release/10.7']], self.loads)
+
+        branch_details_cache.invalidate()
+        branch_details_cache.get_many(self.table_name, ['release/10.8'], self.load_many)
+        self.assertEqual(['release/10.8'], self.loads[-1])
+
+    def test_cache_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache', 'branch_details.json')
+            branch_details_cache.configure(path=path)
+            branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+            branch_details_cache.update(self.table_name, 'release/10.7', {'last_processed_commit': 'a' * 40})
+
+            # a later run reads the file instead of the table
+            branch_details_cache.configure(path=path)
+            actual = branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+            self.assertEqual(1, len(self.loads))
+            self.assertEqual(Decimal(3), actual['release/10.7']['retries'])
+            self.assertEqual('a' * 40, actual['release/10.7']['last_processed_commit'])
+
+            branch_details_cache.invalidate(self.table_name)
+            branch_details_cache.configure(path=path)
+            branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+            self.assertEqual(2, len(self.loads))
+
+            with open(path, 'w') as json_file:
+                json_file.write('{')
+            branch_details_cache.configure(path=path)
+            branch_details_cache.get_many(self.table_name, ['release/10.7'], self.load_many)
+            self.assertEqual(3, len(self.loads))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+from dataclasses import dataclass
+import component_index
+
+
+class TestComponentIndex(unittest.TestCase):
+
+    rules = {
+        'source/utils/networkUtil': {'package': 'xhNetworkUtil', 'component': 'Networking'},
+        'source/utils/networkUtil/test': {'component': 'Tests'},
+        'source/utils': {'package': 'xhUtils'},
+        'source/*/test': {'component': 'Tests'},
+        'source/wifi/': {'package': 'xhWifi', 'component': 'WiFi'},
+        'build/Makefile': {'component': 'Build'}
+    }
+
+    def test_resolve(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: str
+            expected: tuple
+
+        testcases = [
+            TestCase(name='prefix rule', input='source/utils/networkUtil/src/dns.c',
+                     expected=('xhNetworkUtil', 'Networking')),
+            TestCase(name='nested rule inherits package', input='source/utils/networkUtil/test/dns_test.c',
+                     expected=('xhNetworkUtil', 'Tests')),
+            TestCase(name='package without component', input='source/utils/timeUtil/time.c',
+                     expected=('xhUtils', '')),
+            TestCase(name='wildcard segment', input='source/hal/test/hal_test.c', expected=('', 'Tests')),
+            TestCase(name='trailing slash', input='source/wifi/wifi.c', expected=('xhWifi', 'WiFi')),
+            TestCase(name='deeper wildcard rule past exact prefix', input='source/wifi/test/wifi_test.c',
+                     expected=('xhWifi', 'Tests')),
+            TestCase(name='wildcard beside exact sibling', input='source/utils/test/a.c',
+                     expected=('xhUtils', 'Tests')),
+            TestCase(name='file rule', input='build/Makefile', expected=('', 'Build')),
+            TestCase(name='segments match whole names', input='source/utilsExtra/file.c', expected=('', '')),
+            TestCase(name='no rule', input='README.md', expected=('', '')),
+        ]
+
+        index = component_index.ComponentIndex(self.rules)
+        for case in testcases:
+            actual = index.resolve(case.input)
+            self.assertEqual(case.expected, actual,
+                             f'failed test {case.name} expected {case.expected}, actual {actual}')
+
+        # at the same depth an exact segment is preferred over '*'
+        index = component_index.ComponentIndex({'source/*': {'component': 'Source'},
+                                                'source/wifi': {'component': 'WiFi'}})
+        self.assertEqual(('', 'WiFi'), index.resolve('source/wifi/wifi.c'))
+        self.assertEqual(('', 'Source'), index.resolve('source/hal/hal.c'))
+
+    def test_package_and_components(self):
+        index = component_index.ComponentIndex(self.rules)
+        filenames = ['source/wifi/wifi.c', 'source/utils/networkUtil/dns.c', 'source/utils/networkUtil/test/t.c',
+                     'README.md']
+
+        self.assertEqual('xhNetworkUtil', index.package(filenames))
+        self.assertEqual('xhWifi', index.package(filenames[:1] + ['source/utils/timeUtil/time.c']))
+        self.assertEqual('', index.package(['README.md']))
+        self.assertEqual(['WiFi', 'Networking', 'Tests'], index.components(filenames))
+        self.assertEqual([], index.components([]))
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'components.json')
+            with open(path, 'w') as json_file:
+                json.dump(self.rules, json_file)
+
+            index = component_index.load(path)
+            self.assertIs(index, component_index.load(path))
+            self.assertEqual(('xhWifi', 'WiFi'), index.resolve('source/wifi/wifi.c'))
+
+
+if __name__ == '__main__':
+    unittest.main()
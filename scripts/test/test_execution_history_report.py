@@ -0,0 +1,116 @@
+import io
+import csv
+import json
+import unittest
+from unittest import mock
+import warnings
+from moto import mock_dynamodb2
+import aws_session
+import execution_history_report
+import execution_history_table
+import update_execution_history
+from execution_history_table import ExecutionHistoryError
+
+
+@mock_dynamodb2
+class TestExecutionHistoryReport(unittest.TestCase):
+
+    table_name = 'Test_Report_Repo_T_Execution_History'
+
+    def setUp(self):
+        warnings.filterwarnings(action='ignore', message='unclosed', category=ResourceWarning)
+        aws_session.configure(endpoint='')
+        execution_history_table.create_table(self.table_name, wait=False)
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        git_logs = [self.git_log(f'8a6f24a{number:02}', f'Developer {number % 3}', f'XHFW-{1000 + number % 7}',
+                                 ['High', 'Low', ''][number % 3]) for number in range(30)]
+        payload = update_execution_history.build_db_item(git_logs, cpe_branch_details)
+        cpe_branch_details['build_version'] = '10.08.00.000000'
+        payload += update_execution_history.build_db_item(git_logs[:3], cpe_branch_details)
+        payload += execution_history_table.build_developer_records(payload)
+
+        report = update_execution_history.update_dynamodb_table(self.table_name, payload)
+        self.assertEqual(0, report['failed'])
+
+    def tearDown(self):
+        aws_session.get_resource('dynamodb').Table(self.table_name).delete()
+        aws_session.reset()
+
+    def git_log(self, commit: str, name: str, jira_id: str, risk: str) -> dict:
+        return {'author': {'email': f'{name.lower().replace(" ", "_")}@comcast.com', 'name': name},
+                'commit': commit, 'date': 'Mon Aug 9 18:45:20 2021 -0500', 'risk': risk,
+                'filenames': [f'source/{commit[-1]}.c', 'source/common.c'],
+                'summary': f'{jira_id} : synthetic change'}
+
+    def test_parallel_scan(self):
+        items = list(execution_history_report.parallel_scan(self.table_name, 1, page_size=2, max_queued=2))
+        actual = sorted((item['build_number'], item['jira_id']) for item in items)
+        self.assertEqual(10, len(actual))
+        self.assertEqual(('10.07.00.000000', 'XHFW-1000'), actual[0])
+
+    def test_parallel_scan_segments(self):
+        # moto ignores Segment/TotalSegments, so give each segment its own slice of items
+        def scan_segment(table_name, segment, segments, page_size=None):
+            if segment == 2:
+                raise RuntimeError('throttled')
+            for number in range(segment, 12, segments):
+                yield {'build_number': '10.07.00.000000', 'jira_id': f'XHFW-{number}'}
+
+        with mock.patch.object(execution_history_report, 'scan_segment', scan_segment):
+            items = execution_history_report.parallel_scan(self.table_name, 2, max_queued=1)
+            actual = sorted(int(item['jira_id'][5:]) for item in items)
+            self.assertEqual(list(range(12)), actual)
+
+            with self.assertRaisesRegex(ExecutionHistoryError, 'segment 2 of .*: throttled'):
+                list(execution_history_report.parallel_scan(self.table_name, 3, max_queued=1))
+
+    def test_parallel_scan_closed_early(self):
+        items = execution_history_report.parallel_scan(self.table_name, 3, page_size=1, max_queued=1)
+        self.assertIn('jira_id', next(items))
+        items.close()
+
+    def test_write_report_ndjson(self):
+        output = io.StringIO()
+        aggregates_output = io.StringIO()
+        items = execution_history_report.parallel_scan(self.table_name, 1)
+        rows = execution_history_report.write_report(items, output, 'ndjson', aggregates_output)
+
+        expected = {'build_number': '10.07.00.000000', 'branch_names': ['release/10.7'], 'items': 7,
+                    'commits': 30, 'developers': 3, 'files_touched': 11, 'risk_high': 10, 'risk_medium': 0,
+                    'risk_low': 10, 'risk_none': 10, 'risk_other': 0}
+        self.assertEqual(expected, rows['10.07.00.000000'])
+        self.assertEqual(3, rows['10.08.00.000000']['commits'])
+        self.assertEqual(10, len(output.getvalue().splitlines()))
+        aggregates = [json.loads(line) for line in aggregates_output.getvalue().splitlines()]
+        self.assertEqual(['10.07.00.000000', '10.08.00.000000'], [row['build_number'] for row in aggregates])
+
+    def test_aggregate_row_risks(self):
+        aggregates = {}
+        git_logs = [self.git_log(f'8a6f24a{number:02}', 'Developer 1', 'XHFW-1000', risk)
+                    for number, risk in enumerate(['High', 'Very High', ' medium ', '', 'Unknown'])]
+        execution_history_report.add_to_aggregates(aggregates, {'build_number': '10.07.00.000000',
+                                                                'jira_id': 'XHFW-1000', 'git_logs': git_logs})
+
+        row = execution_history_report.aggregate_row(aggregates['10.07.00.000000'])
+        actual = [row[f'risk_{level}'] for level in ['high', 'medium', 'low', 'none', 'other']]
+        self.assertEqual([1, 1, 0, 1, 2], actual, f'failed test risks expected [1, 1, 0, 1, 2], actual {actual}')
+
+    def test_write_report_csv(self):
+        output = io.StringIO()
+        aggregates_output = io.StringIO()
+        items = execution_history_report.query_items(build_number='10.08.00.000000', table_name=self.table_name)
+        execution_history_report.write_report(items, output, 'csv', aggregates_output)
+
+        rows = sorted(csv.DictReader(io.StringIO(output.getvalue())), key=lambda row: row['jira_id'])
+        self.assertEqual(['XHFW-1000', 'XHFW-1001', 'XHFW-1002'], [row['jira_id'] for row in rows])
+        self.assertEqual({'developers': 'Developer 1', 'commits': '1', 'files': '2', 'risks': 'Low'},
+                         {key: rows[1][key] for key in ['developers', 'commits', 'files', 'risks']})
+        aggregates = list(csv.DictReader(io.StringIO(aggregates_output.getvalue())))
+        self.assertEqual('release/10.7', aggregates[0]['branch_names'])
+        self.assertEqual('4', aggregates[0]['files_touched'])
+
+
+if __name__ == '__main__':
+    unittest.main()
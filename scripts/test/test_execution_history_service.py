@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+import execution_history_service
+import metrics
+import update_execution_history
+
+
+def ok_report() -> dict:
+    return {'failed': 0, 'succeeded': 1, 'unchanged': 0, 'message': 'ok', 'items': []}
+
+
+class TestExecutionHistoryService(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_run_cycles(self):
+        calls = []
+
+        def parse_branches(branch_names, workers):
+            calls.append(list(branch_names))
+            return {branch_name: ok_report() for branch_name in branch_names}
+
+        service = execution_history_service.Service(['release/10.7', 'release/10.8'], interval=0.01, jitter=0)
+        with mock.patch.object(update_execution_history, 'parse_branches', parse_branches):
+            service.run(max_cycles=3)
+
+        self.assertEqual([['release/10.7', 'release/10.8']] * 3, calls)
+        self.assertEqual(3, service.cycles)
+        self.assertEqual(3, metrics.snapshot()['counters']['service_cycles'])
+        self.assertTrue(service.health()['healthy'])
+
+    def test_all_branches_rescanned_after_ttl(self):
+        scans = []
+
+        def get_branch_details(branch_names=None):
+            scans.append(branch_names)
+            return {'release/10.7': {}}
+
+        service = execution_history_service.Service(interval=0.01, jitter=0)
+        with mock.patch.object(update_execution_history, 'get_branch_details', get_branch_details), \
+                mock.patch.object(execution_history_service.branch_details_cache, 'ttl', 60):
+            self.assertEqual(['release/10.7'], service.cycle_branches())
+            self.assertEqual(['release/10.7'], service.cycle_branches())
+        self.assertEqual([None], scans)
+
+    def test_stop_interrupts_wait(self):
+        service = execution_history_service.Service(['release/10.7'], interval=60, jitter=0)
+        with mock.patch.object(update_execution_history, 'parse_branches', lambda names, workers: {}):
+            thread = threading.Thread(target=service.run)
+            thread.start()
+            time.sleep(0.1)
+            service.stop()
+            thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, service.cycles)
+
+    def test_failed_cycle_does_not_stop_service(self):
+        def parse_branches(branch_names, workers):
+            raise OSError('repo cache lock unavailable')
+
+        service = execution_history_service.Service(['release/10.7'], interval=0.01, jitter=0)
+        with mock.patch.object(update_execution_history, 'parse_branches', parse_branches):
+            service.run(max_cycles=2)
+
+        self.assertEqual(2, service.cycles)
+        self.assertIn('repo cache lock unavailable', service.health()['last_cycle']['error'])
+        self.assertIsNone(service.health()['seconds_since_success'])
+
+    def test_next_delay_jitter(self):
+        service = execution_history_service.Service(interval=100, jitter=0.2)
+        delays = [service.next_delay() for _ in range(200)]
+        self.assertTrue(all(80 <= delay <= 120 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_health_endpoint(self):
+        failed = {'failed': 1, 'succeeded': 0, 'unchanged': 0, 'message': 'error', 'items': []}
+        service = execution_history_service.Service(['release/10.7'], interval=0.05, jitter=0)
+        server = execution_history_service.start_health_server(service, port=0)
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            with mock.patch.object(update_execution_history, 'parse_branches',
+                                   lambda names, workers: {'release/10.7': ok_report()}):
+                service.run_cycle()
+            with urllib.request.urlopen(f'{url}/healthz') as response:
+                health = json.load(response)
+            self.assertEqual(1, health['cycles'])
+            self.assertEqual([], health['last_cycle']['failed_branches'])
+
+            with urllib.request.urlopen(f'{url}/metrics') as response:
+                self.assertIn('repo_t_service_cycles_total{job="execution_history_service"} 1',
+                              response.read().decode())
+
+            # no successful cycle for more than stale_intervals
+            with mock.patch.object(update_execution_history, 'parse_branches',
+                                   lambda names, workers: {'release/10.7': failed}):
+                service.run_cycle()
+            time.sleep(0.05 * execution_history_service.stale_intervals + 0.05)
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(f'{url}/healthz')
+            self.assertEqual(503, context.exception.code)
+            self.assertEqual(['release/10.7'], json.load(context.exception)['last_cycle']['failed_branches'])
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,147 @@
+import unittest
+from unittest import mock
+import warnings
+from moto import mock_dynamodb2
+import aws_session
+import execution_history_table
+import update_execution_history
+
+
+@mock_dynamodb2
+class TestExecutionHistoryTable(unittest.TestCase):
+
+    table_name = 'Test_Query_Repo_T_Execution_History'
+
+    def setUp(self):
+        warnings.filterwarnings(action='ignore', message='unclosed', category=ResourceWarning)
+        aws_session.configure(endpoint='')
+        execution_history_table.create_table(self.table_name, wait=False)
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        git_logs = [self.git_log('8a6f24a21', 'Weston Boyd', 'XHFW-1018'),
+                    self.git_log('8a6f24a51', 'Thomas Lea', 'XHFW-1018'),
+                    self.git_log('8a6f24b21', 'Thomas Lea', 'XHFW-1080')]
+        payload = update_execution_history.build_db_item(git_logs, cpe_branch_details)
+        # split XHFW-1018 across two pages
+        payload = update_execution_history.paginate_db_items(payload[:1], 1200, 'never') + payload[1:]
+        cpe_branch_details['build_version'] = '10.08.00.000000'
+        payload += update_execution_history.build_db_item(
+            git_logs[2:] + [self.git_log('8a6f24c21', 'Weston Boyd', 'XHFW-1565 XHFW-1018')], cpe_branch_details)
+        payload += execution_history_table.build_index_records(payload)
+
+        report = update_execution_history.update_dynamodb_table(self.table_name, payload)
+        self.assertEqual(0, report['failed'])
+
+    def tearDown(self):
+        aws_session.get_resource('dynamodb').Table(self.table_name).delete()
+        aws_session.reset()
+
+    def git_log(self, commit: str, name: str, jira_id: str) -> dict:
+        return {'author': {'email': f'{name.lower().replace(" ", "_")}@comcast.com', 'name': name},
+                'commit': commit, 'date': 'Mon Aug 9 18:45:20 2021 -0500',
+                'filenames': [f'source/utils/networkUtil/src/file{index}.c' for index in range(10)],
+                'package': '', 'risk': 'Low', 'summary': f'{jira_id} : xhNetworkUtil no custom DNS for Flex'}
+
+    def test_query_build(self):
+        actual = sorted(item['jira_id'] for item in
+                        execution_history_table.query_build('10.07.00.000000', self.table_name, page_size=1))
+        self.assertEqual(['XHFW-1018', 'XHFW-1018#2', 'XHFW-1080'], actual)
+
+    def test_query_jira(self):
+        actual = sorted((item['build_number'], item['jira_id']) for item in
+                        execution_history_table.query_jira('xhfw-1018', self.table_name))
+        self.assertEqual([('10.07.00.000000', 'XHFW-1018'), ('10.07.00.000000', 'XHFW-1018#2'),
+                          ('10.08.00.000000', 'XHFW-1565_XHFW-1018')], actual)
+
+        actual = sorted(item['build_number'] for item in
+                        execution_history_table.query_jira('XHFW-1080', self.table_name))
+        self.assertEqual(['10.07.00.000000', '10.08.00.000000'], actual)
+
+    def test_query_jira_linked(self):
+        # a commit referencing several jira ids is found under each of them, and its records stay out of builds
+        actual = [item['jira_id'] for item in execution_history_table.query_jira('XHFW-1565', self.table_name)]
+        self.assertEqual(['XHFW-1565_XHFW-1018'], actual)
+        self.assertEqual(['XHFW-1080', 'XHFW-1565_XHFW-1018'], sorted(
+            item['jira_id'] for item in execution_history_table.query_build('10.08.00.000000', self.table_name)))
+
+    def test_query_developer(self):
+        actual = sorted((item['build_number'], item['jira_id']) for item in
+                        execution_history_table.query_developer('Thomas Lea', self.table_name))
+        self.assertEqual([('10.07.00.000000', 'XHFW-1018#2'), ('10.07.00.000000', 'XHFW-1080'),
+                          ('10.08.00.000000', 'XHFW-1080')], actual)
+
+        actual = [item['jira_id'] for item in
+                  execution_history_table.query_developer('Thomas Lea', self.table_name, '10.08.00.000000')]
+        self.assertEqual(['XHFW-1080'], actual)
+
+    def test_put_deletes_stale_developer_records(self):
+        # rewriting XHFW-1080 of build 10.08 without Thomas Lea drops it from his developer queries
+        cpe_branch_details = {'build_version': '10.08.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        payload = update_execution_history.build_db_item([self.git_log('8a6f24b21', 'Weston Boyd', 'XHFW-1080')],
+                                                         cpe_branch_details)
+        payload += execution_history_table.build_index_records(payload)
+        report = update_execution_history.update_dynamodb_table(self.table_name, payload, 'put')
+        self.assertEqual(0, report['failed'])
+
+        actual = [item['jira_id'] for item in
+                  execution_history_table.query_developer('Thomas Lea', self.table_name, '10.08.00.000000')]
+        self.assertEqual([], actual)
+        actual = sorted(item['jira_id'] for item in
+                        execution_history_table.query_developer('Weston Boyd', self.table_name, '10.08.00.000000'))
+        self.assertEqual(['XHFW-1080', 'XHFW-1565_XHFW-1018'], actual)
+        # records of other items of the build are left alone
+        actual = [item['jira_id'] for item in
+                  execution_history_table.query_developer('Thomas Lea', self.table_name, '10.07.00.000000')]
+        self.assertEqual(['XHFW-1018#2', 'XHFW-1080'], sorted(actual))
+
+    def test_put_deletes_stale_pages(self):
+        # XHFW-1018 of build 10.07 is stored on two pages; rewriting it as one page drops the second
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        payload = update_execution_history.build_db_item([self.git_log('8a6f24a21', 'Weston Boyd', 'XHFW-1018')],
+                                                         cpe_branch_details)
+        payload += execution_history_table.build_index_records(payload)
+        report = update_execution_history.update_dynamodb_table(self.table_name, payload, 'put')
+        self.assertEqual(0, report['failed'])
+
+        actual = sorted(item['jira_id'] for item in execution_history_table.query_build('10.07.00.000000',
+                                                                                        self.table_name))
+        self.assertEqual(['XHFW-1018', 'XHFW-1080'], actual)
+        actual = [item['jira_id'] for item in
+                  execution_history_table.query_developer('Thomas Lea', self.table_name, '10.07.00.000000')]
+        self.assertEqual(['XHFW-1080'], actual)
+
+    def test_get_items_unprocessed_keys(self):
+        keys = [{'build_number': '10.07.00.000000', 'jira_id': jira_id} for jira_id in ['XHFW-1018', 'XHFW-1080']]
+        dynamo_db = aws_session.get_resource('dynamodb')
+        batch_get_item = dynamo_db.batch_get_item
+
+        def unprocessed_once(RequestItems):
+            # the first request leaves its last key unprocessed
+            if len(calls) == 0:
+                calls.append(RequestItems)
+                request = {self.table_name: {'Keys': RequestItems[self.table_name]['Keys'][:1]}}
+                return dict(batch_get_item(RequestItems=request),
+                            UnprocessedKeys={self.table_name: {'Keys': RequestItems[self.table_name]['Keys'][1:]}})
+            calls.append(RequestItems)
+            return batch_get_item(RequestItems=RequestItems)
+
+        calls = []
+        with mock.patch.object(dynamo_db, 'batch_get_item', unprocessed_once), \
+                mock.patch.object(execution_history_table.time, 'sleep') as sleep:
+            actual = sorted(item['jira_id'] for item in execution_history_table.get_items(keys, self.table_name))
+        self.assertEqual(['XHFW-1018', 'XHFW-1080'], actual)
+        self.assertEqual(2, len(calls))
+        self.assertEqual(1, sleep.call_count)
+
+        with mock.patch.object(dynamo_db, 'batch_get_item',
+                               lambda RequestItems: {'Responses': {}, 'UnprocessedKeys': RequestItems}), \
+                mock.patch.object(execution_history_table.time, 'sleep'):
+            with self.assertRaises(execution_history_table.ExecutionHistoryError):
+                list(execution_history_table.get_items(keys, self.table_name))
+
+
+if __name__ == '__main__':
+    unittest.main()
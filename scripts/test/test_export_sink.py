@@ -0,0 +1,84 @@
+import base64
+import gzip
+import json
+import os
+import tempfile
+import unittest
+import zlib
+from boto3.dynamodb.types import Binary, TypeDeserializer
+from moto import mock_s3
+import aws_session
+import export_sink
+
+
+class TestExportSink(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.payload = [{
+            'build_number': '10.07.00.000000',
+            'jira_id': f'XHFW-{number}',
+            'developers': ['Weston Boyd'],
+            'commits': {'8a6f24a21'},
+            'pagination': {'current_page': 0, 'total_pages': 1},
+            'git_logs': [{'commit': '8a6f24a21', 'filenames_zlib': zlib.compress(b'src/main.c')}]
+        } for number in range(10)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def deserialize(self, item: dict) -> dict:
+        filenames_zlib = item['git_logs']['L'][0]['M']['filenames_zlib']
+        filenames_zlib['B'] = base64.b64decode(filenames_zlib['B'])
+        return {attribute: TypeDeserializer().deserialize(value) for attribute, value in item.items()}
+
+    def test_shard_writer(self):
+        with export_sink.ShardWriter(self.directory.name, max_bytes=1000) as writer:
+            for start in range(0, 10, 3):
+                writer.write(self.payload[start:start + 3])
+
+        with open(os.path.join(self.directory.name, 'manifest.json')) as json_file:
+            manifest = json.load(json_file)
+        self.assertEqual(10, manifest['items'])
+        self.assertGreater(len(writer.shards), 1)
+        self.assertEqual(writer.shards, manifest['shards'])
+        self.assertEqual('data/items-00000.json.gz', manifest['shards'][0]['key'])
+        self.assertEqual('data/', manifest['import_table']['S3BucketSource']['S3KeyPrefix'])
+        self.assertEqual('PAY_PER_REQUEST', manifest['import_table']['TableCreationParameters']['BillingMode'])
+
+        items = []
+        for shard in manifest['shards']:
+            self.assertLessEqual(shard['uncompressed_bytes'], 1000)
+            shard_items = export_sink.read_items(os.path.join(self.directory.name, shard['key']))
+            self.assertEqual(shard['items'], len(shard_items))
+            items += shard_items
+
+        actual = self.deserialize(items[3])
+        self.assertEqual('XHFW-3', actual['jira_id'])
+        self.assertEqual({'8a6f24a21'}, actual['commits'])
+        self.assertEqual(Binary(zlib.compress(b'src/main.c')), actual['git_logs'][0]['filenames_zlib'])
+
+    @mock_s3
+    def test_shard_writer_s3(self):
+        aws_session.reset()
+        s3 = aws_session.get_client('s3')
+        s3.create_bucket(Bucket='repo-t-exports', CreateBucketConfiguration={'LocationConstraint': 'us-east-2'})
+
+        with export_sink.ShardWriter('s3://repo-t-exports/backfill/release_10.7', max_bytes=1000) as writer:
+            writer.write(self.payload)
+
+        keys = sorted(item['Key'] for item in s3.list_objects_v2(Bucket='repo-t-exports')['Contents'])
+        manifest = json.loads(s3.get_object(Bucket='repo-t-exports',
+                                            Key='backfill/release_10.7/manifest.json')['Body'].read())
+        shard = s3.get_object(Bucket='repo-t-exports', Key=f'backfill/release_10.7/{writer.shards[0]["key"]}')
+        lines = gzip.decompress(shard['Body'].read()).decode().splitlines()
+        aws_session.reset()
+
+        self.assertEqual(len(writer.shards) + 1, len(keys))
+        self.assertEqual('backfill/release_10.7/data/', manifest['import_table']['S3BucketSource']['S3KeyPrefix'])
+        self.assertEqual('repo-t-exports', manifest['import_table']['S3BucketSource']['S3Bucket'])
+        self.assertEqual({'S': 'XHFW-0'}, json.loads(lines[0])['Item']['jira_id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
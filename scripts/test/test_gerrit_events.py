@@ -0,0 +1,168 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from dataclasses import dataclass
+from unittest import mock
+import gerrit_events
+import metrics
+import update_execution_history
+
+
+def ref_updated(ref_name: str, new_rev: str = 'b' * 40, project: str = 'xhfw') -> str:
+    return json.dumps({'type': 'ref-updated', 'refUpdate': {'oldRev': 'a' * 40, 'newRev': new_rev,
+                                                            'refName': ref_name, 'project': project}}) + '\n'
+
+
+def change_merged(branch_name: str, project: str = 'xhfw') -> str:
+    return json.dumps({'type': 'change-merged', 'change': {'project': project, 'branch': branch_name},
+                       'patchSet': {'revision': 'c' * 40}, 'newRev': 'd' * 40}) + '\n'
+
+
+def ok_report() -> dict:
+    return {'failed': 0, 'succeeded': 1, 'unchanged': 0, 'message': 'ok', 'items': []}
+
+
+class TestGerritEvents(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.runs = []
+
+    def parse_branches(self, branch_names, workers):
+        self.runs.append(sorted(branch_names))
+        return {branch_name: ok_report() for branch_name in branch_names}
+
+    def test_branch_update(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: str
+            expected: tuple
+
+        testcases = [
+            TestCase(name='ref-updated branch', input=ref_updated('refs/heads/release/10.7'),
+                     expected=('release/10.7', 'b' * 40)),
+            TestCase(name='ref-updated short name', input=ref_updated('master'), expected=('master', 'b' * 40)),
+            TestCase(name='ref-updated change ref', input=ref_updated('refs/changes/01/1/1'), expected=None),
+            TestCase(name='ref-updated tag', input=ref_updated('refs/tags/v1.0'), expected=None),
+            TestCase(name='branch deleted', input=ref_updated('refs/heads/old', new_rev='0' * 40), expected=None),
+            TestCase(name='change-merged', input=change_merged('release/10.8'), expected=('release/10.8', 'd' * 40)),
+            TestCase(name='other project', input=ref_updated('refs/heads/master', project='other'), expected=None),
+            TestCase(name='other event', input=json.dumps({'type': 'comment-added'}), expected=None),
+        ]
+
+        for case in testcases:
+            actual = gerrit_events.branch_update(gerrit_events.parse_event(case.input), 'xhfw')
+            self.assertEqual(case.expected, actual,
+                             f'failed test {case.name} expected {case.expected}, actual {actual}')
+
+        self.assertIsNone(gerrit_events.parse_event('{not json'))
+        self.assertIsNone(gerrit_events.parse_event('  \n'))
+
+    def test_coalescer(self):
+        coalescer = gerrit_events.Coalescer(quiet=5, max_delay=20)
+        coalescer.add('release/10.7', 'a', 0)
+        coalescer.add('release/10.7', 'b', 4)
+        coalescer.add('release/10.8', 'c', 4)
+
+        self.assertEqual(9, coalescer.next_due())
+        self.assertEqual({}, coalescer.pop_due(8))
+        for now in range(8, 20, 4):
+            coalescer.add('release/10.7', 'd', now)
+        self.assertEqual(['release/10.8'], list(coalescer.pop_due(9)))
+        # a branch that never goes quiet still runs max_delay after its first event
+        due = coalescer.pop_due(20)
+        self.assertEqual(5, due['release/10.7']['events'])
+        self.assertEqual('d', due['release/10.7']['revision'])
+        self.assertEqual({}, coalescer.pending)
+
+    def test_run_coalesces_bursts(self):
+        lines = [ref_updated('refs/heads/release/10.7'), change_merged('release/10.7'), '{not json\n',
+                 ref_updated('refs/changes/01/1/1'), change_merged('release/10.8'), ref_updated('refs/heads/master'),
+                 ref_updated('refs/heads/release/10.7')]
+
+        ingester = gerrit_events.Ingester(['release/10.7', 'release/10.8'], quiet=60)
+        with mock.patch.object(update_execution_history, 'parse_branches', self.parse_branches):
+            reports = ingester.run(lines)
+
+        self.assertEqual([['release/10.7', 'release/10.8']], self.runs)
+        self.assertEqual(['release/10.7', 'release/10.8'], sorted(reports))
+        counters = metrics.snapshot()['counters']
+        self.assertEqual(4, counters['gerrit_events'])
+        self.assertEqual(2, counters['gerrit_events_coalesced'])
+        self.assertEqual(3, counters['gerrit_events_ignored'])
+
+    def test_run_when_quiet(self):
+        def lines():
+            yield ref_updated('refs/heads/release/10.7')
+            yield ref_updated('refs/heads/release/10.7')
+            time.sleep(0.4)
+            yield ref_updated('refs/heads/release/10.7')
+
+        ingester = gerrit_events.Ingester(['release/10.7'], quiet=0.1)
+        with mock.patch.object(update_execution_history, 'parse_branches', self.parse_branches):
+            ingester.run(lines())
+
+        self.assertEqual([['release/10.7'], ['release/10.7']], self.runs)
+
+    def test_run_all_skips_untracked(self):
+        def get_branch_details(branch_names=None):
+            return {name: {} for name in branch_names or ['release/10.7'] if name == 'release/10.7'}
+
+        ingester = gerrit_events.Ingester(quiet=60)
+        with mock.patch.object(update_execution_history, 'parse_branches', self.parse_branches), \
+                mock.patch.object(update_execution_history, 'get_branch_details', get_branch_details):
+            ingester.run([ref_updated('refs/heads/release/10.7'), ref_updated('refs/heads/sandbox')])
+            self.assertEqual([['release/10.7']], self.runs)
+
+            # catch up runs every tracked branch before any event
+            ingester.run([], catch_up=True)
+            self.assertEqual([['release/10.7'], ['release/10.7']], self.runs)
+
+        self.assertEqual(1, metrics.snapshot()['counters']['gerrit_events_untracked'])
+
+    def test_socket_source(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        lines = [ref_updated('refs/heads/release/10.7'), change_merged('release/10.8')]
+
+        def serve():
+            connection, _ = server.accept()
+            with connection:
+                connection.sendall(''.join(lines).encode())
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        with server:
+            actual = list(gerrit_events.open_source(f'tcp://127.0.0.1:{server.getsockname()[1]}'))
+        thread.join()
+
+        self.assertEqual(lines, actual)
+
+    def test_follow_file_source(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.json')
+            with open(path, 'w') as events_file:
+                events_file.write(ref_updated('refs/heads/release/10.7'))
+
+            stop = threading.Event()
+
+            def append():
+                time.sleep(0.2)
+                with open(path, 'a') as events_file:
+                    events_file.write(change_merged('release/10.8')[:20])
+                    events_file.flush()
+                    time.sleep(0.2)
+                    events_file.write(change_merged('release/10.8')[20:])
+                time.sleep(0.2)
+                stop.set()
+
+            thread = threading.Thread(target=append)
+            thread.start()
+            actual = list(gerrit_events.open_source(path, follow=True, stop=stop))
+            thread.join()
+
+        self.assertEqual([ref_updated('refs/heads/release/10.7'), change_merged('release/10.8')], actual)
@@ -0,0 +1,202 @@
+import unittest
+from dataclasses import dataclass
+import os
+import subprocess
+import tempfile
+import git_backend
+
+
+class TestGitBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.repo = self.directory.name
+        self.git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+        subprocess.run(['git', 'init', '-q', '-b', 'main', self.repo], check=True)
+
+        self.write('README.md', 'readme\n')
+        self.write('source/utils/networkUtil/src/main.c', 'int main;\n')
+        self.commit('XHFW-1000: initial import')
+        self.write('source/utils/networkUtil/src/main.c', 'int main(void);\n')
+        self.write('source/utils/networkUtil/CMakeLists.txt', 'project(networkUtil)\n')
+        self.commit('XHFW-1018 : xhNetworkUtil "quoted" summary', 'Details\n\nRisks: Low')
+        subprocess.run(['git', 'checkout', '-q', '-b', 'topic'], cwd=self.repo, check=True)
+        os.remove(os.path.join(self.repo, 'README.md'))
+        self.write('docs/guide.md', 'guide\n')
+        self.commit('XHFW-1080: move docs', 'Risks: Very High')
+        subprocess.run(['git', 'checkout', '-q', 'main'], cwd=self.repo, check=True)
+        self.write('source/utils/other.c', 'int other;\n')
+        self.commit('XHFW-1081: other')
+        subprocess.run(self.git + ['merge', '-q', '--no-ff', '-m', 'Merge topic', 'topic'], cwd=self.repo,
+                       check=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, path: str, content: str):
+        path = os.path.join(self.repo, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+
+    def commit(self, summary: str, body: str = None):
+        message = ['-m', summary] + (['-m', body] if body else [])
+        subprocess.run(['git', 'add', '-A'], cwd=self.repo, check=True)
+        subprocess.run(self.git + ['commit', '-q'] + message, cwd=self.repo, check=True)
+
+    def test_backends_agree(self):
+        expected = list(git_backend.SubprocessGitBackend(self.repo).list_commits(['main']))
+        with git_backend.CatFileGitBackend(self.repo) as backend:
+            actual = list(backend.list_commits(['main']))
+
+        self.assertEqual(5, len(expected))
+        for commit in expected + actual:
+            commit['body'] = commit['body'].strip()
+        self.assertEqual(expected, actual)
+
+    def test_commit_lookups(self):
+        for name in git_backend.backends:
+            with git_backend.get_backend(name, self.repo) as backend:
+                head = backend.resolve_commit('main')
+                docs = backend.resolve_commit('topic')
+                self.assertEqual(40, len(head), name)
+                self.assertTrue(backend.is_ancestor(docs, head), name)
+                self.assertFalse(backend.is_ancestor(head, docs), name)
+                self.assertEqual(['README.md', 'docs/guide.md'], backend.list_changed_files(docs), name)
+                self.assertEqual([], backend.list_changed_files(head), name)
+                self.assertEqual('Risks: Very High', backend.read_commit_body(docs).strip(), name)
+                with self.assertRaises(git_backend.GitError, msg=name):
+                    backend.list_changed_files('missing')
+                with self.assertRaises(git_backend.GitError):
+                    backend.resolve_commit('missing')
+
+    def test_blobless_clone_fetches_no_blobs(self):
+        subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=self.repo, check=True)
+        clone = os.path.join(self.repo, '.git', 'blobless')
+        subprocess.run(['git', 'clone', '-q', '--bare', '--filter=blob:none', f'file://{self.repo}', clone],
+                       check=True)
+
+        def missing_objects() -> int:
+            process = subprocess.run(['git', 'rev-list', '--objects', '--all', '--missing=print'], cwd=clone,
+                                     capture_output=True, text=True, check=True)
+            return sum(1 for line in process.stdout.splitlines() if line.startswith('?'))
+
+        missing = missing_objects()
+        for name in git_backend.backends:
+            with git_backend.get_backend(name, clone) as backend:
+                list(backend.list_commits(['main']))
+        self.assertGreater(missing, 0)
+        self.assertEqual(missing, missing_objects())
+
+    def test_backends_agree_on_renames(self):
+        subprocess.run(['git', 'mv', 'source/utils/other.c', 'source/utils/moved.c'], cwd=self.repo, check=True)
+        self.commit('XHFW-1082: rename')
+
+        for name in git_backend.backends:
+            with git_backend.get_backend(name, self.repo) as backend:
+                self.assertEqual(['source/utils/moved.c', 'source/utils/other.c'],
+                                 next(backend.list_commits(['main']))['filenames'], name)
+                self.assertEqual(['source/utils/moved.c', 'source/utils/other.c'],
+                                 backend.list_changed_files('main'), name)
+
+    def test_backends_agree_on_mailmap(self):
+        self.write('.mailmap', 'Weston Boyd <weston.boyd@comcast.com> <weston_boyd@comcast.com>\n')
+        self.commit('XHFW-1082: mailmap')
+
+        for name in git_backend.backends:
+            with git_backend.get_backend(name, self.repo) as backend:
+                actual = {commit['author']['email'] for commit in backend.list_commits(['main'])}
+                self.assertEqual({'weston.boyd@comcast.com'}, actual, name)
+
+    def test_backends_agree_on_shallow_clone(self):
+        clone = os.path.join(self.repo, '.git', 'shallow-clone')
+        subprocess.run(['git', 'clone', '-q', '--bare', '--depth', '2', '--no-single-branch', f'file://{self.repo}',
+                        clone], check=True)
+
+        expected = list(git_backend.SubprocessGitBackend(clone).list_commits(['main']))
+        with git_backend.CatFileGitBackend(clone) as backend:
+            actual = list(backend.list_commits(['main']))
+
+        # the boundary commit lists its whole tree, as a root commit does
+        self.assertIn('README.md', expected[-1]['filenames'])
+        for commit in expected + actual:
+            commit['body'] = commit['body'].strip()
+        self.assertEqual(expected, actual)
+
+    def test_failed_listing_raises(self):
+        for name in git_backend.backends:
+            with git_backend.get_backend(name, self.repo) as backend:
+                with self.assertRaises(git_backend.GitError, msg=name):
+                    list(backend.list_commits(['deadbeef..main']))
+                # stopping early is not a failure
+                commits = backend.list_commits(['main'])
+                next(commits)
+                commits.close()
+
+    def test_format_git_date(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: list
+            expected: str
+
+        testcases = [
+            TestCase(
+                name='NEGATIVE OFFSET',
+                input=[1628552720, '-0500'],
+                expected='Mon Aug 9 18:45:20 2021 -0500'
+            ),
+            TestCase(
+                name='POSITIVE OFFSET',
+                input=[1628552720, '+0530'],
+                expected='Tue Aug 10 05:15:20 2021 +0530'
+            )
+        ]
+
+        for case in testcases:
+            actual = git_backend.format_git_date(case.input[0], case.input[1])
+            self.assertEqual(
+                case.expected,
+                actual,
+                f'failed test {case.name} expected {case.expected}, actual {actual}'
+            )
+
+    def test_parse_git_log_record(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: str
+            expected: dict
+
+        testcases = [
+            TestCase(
+                name='Happy Path',
+                input='e32b218\x1fMon Aug 16 08:44:51 2021 -0500\x1fxhaven-5184: updated names\x1f'
+                      'rreed210\x1frichard_reed@comcast.com\x1fRisks: Low\n\x1f\n\nsrc/a.c\nsrc/b.c',
+                expected={'commit': 'e32b218', 'date': 'Mon Aug 16 08:44:51 2021 -0500',
+                          'summary': 'xhaven-5184: updated names',
+                          'author': {'name': 'rreed210', 'email': 'richard_reed@comcast.com'},
+                          'body': 'Risks: Low\n', 'filenames': ['src/a.c', 'src/b.c']}
+            ),
+            TestCase(
+                name='QUOTES IN SUMMARY',
+                input='8a6f24a\x1fMon Aug 9 18:45:20 2021 -0500\x1fXHFW-1018: fix "quoted" {value}\x1f'
+                      'Weston Boyd\x1fweston_boyd@comcast.com\x1f\x1f',
+                expected={'commit': '8a6f24a', 'date': 'Mon Aug 9 18:45:20 2021 -0500',
+                          'summary': 'XHFW-1018: fix "quoted" {value}',
+                          'author': {'name': 'Weston Boyd', 'email': 'weston_boyd@comcast.com'},
+                          'body': '', 'filenames': []}
+            )
+        ]
+
+        for case in testcases:
+            actual = git_backend.parse_git_log_record(case.input)
+            self.assertEqual(
+                case.expected,
+                actual,
+                f'failed test {case.name} expected {case.expected}, actual {actual}'
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import json
+import os
+import pstats
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_timed_and_increment(self):
+        @metrics.timed('stage')
+        def stage(value):
+            metrics.increment('items', value)
+            return value
+
+        stage(2)
+        stage(3)
+        actual = metrics.snapshot()
+
+        self.assertEqual({'items': 5}, actual['counters'])
+        self.assertEqual(2, actual['timers']['stage']['count'])
+        self.assertGreaterEqual(actual['timers']['stage']['sum'], actual['timers']['stage']['max'])
+
+    def test_write(self):
+        metrics.increment('git_bytes_read', 128)
+        metrics.observe('clone_repo', 1.5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            jsonl_path = os.path.join(directory, 'metrics.jsonl')
+            metrics.write(jsonl_path, 'jsonl', {'job': 'test'})
+            metrics.write(jsonl_path, 'jsonl', {'job': 'test'})
+            with open(jsonl_path) as metrics_file:
+                lines = [json.loads(line) for line in metrics_file]
+
+            prometheus_path = os.path.join(directory, 'metrics.prom')
+            metrics.write(prometheus_path, 'prometheus', {'job': 'test'})
+            with open(prometheus_path) as metrics_file:
+                prometheus = metrics_file.read()
+
+        self.assertEqual(4, len(lines))
+        self.assertEqual({'timestamp': lines[0]['timestamp'], 'name': 'git_bytes_read', 'type': 'counter',
+                          'value': 128, 'labels': {'job': 'test'}}, lines[0])
+        self.assertIn('repo_t_git_bytes_read_total{job="test"} 128\n', prometheus)
+        self.assertIn('repo_t_clone_repo_seconds_sum{job="test"} 1.5\n', prometheus)
+
+
+    def test_profile_worker_threads(self):
+        def worker_function():
+            return sum(range(1000))
+
+        def work():
+            with metrics.profile_thread():
+                return worker_function()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.prof')
+            with metrics.profile(path):
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(lambda _: work(), range(4)))
+            functions = [function for _, _, function in pstats.Stats(path).stats]
+
+        self.assertIn('worker_function', functions)
+        # outside profile() workers are not profiled
+        with metrics.profile_thread():
+            self.assertIsNone(metrics._thread_profilers)
+
+
+if __name__ == '__main__':
+    unittest.main()
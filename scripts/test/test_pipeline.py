@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+import pipeline
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_run(self):
+        def double(values):
+            for value in values:
+                yield value * 2
+
+        def pairs(values):
+            pair = []
+            for value in values:
+                pair.append(value)
+                if len(pair) == 2:
+                    yield pair
+                    pair = []
+            if pair:
+                yield pair
+
+        actual = list(pipeline.run(range(5), [('double', double), ('pairs', pairs)], max_queued=1))
+        self.assertEqual([[0, 2], [4, 6], [8]], actual)
+
+    def test_stages_overlap(self):
+        def slow(values):
+            for value in values:
+                time.sleep(0.05)
+                yield value
+
+        def source():
+            for value in range(6):
+                time.sleep(0.05)
+                yield value
+
+        start = time.perf_counter()
+        actual = []
+        for value in pipeline.run(source(), [('first', slow), ('second', slow)]):
+            time.sleep(0.05)
+            actual.append(value)
+        seconds = time.perf_counter() - start
+
+        # four 0.3s stages run sequentially would take 1.2s
+        self.assertEqual(list(range(6)), actual)
+        self.assertLess(seconds, 0.8)
+
+    def test_backpressure(self):
+        produced = []
+
+        def source():
+            for value in range(100):
+                produced.append(value)
+                yield value
+
+        values = pipeline.run(source(), [('identity', lambda values: values)], max_queued=2)
+        self.assertEqual(0, next(values))
+        time.sleep(0.3)
+        # the source blocks once both queues and the stage hold their few values
+        self.assertLess(len(produced), 10)
+        values.close()
+
+    def test_stage_error(self):
+        def fail(values):
+            for value in values:
+                if value == 3:
+                    raise ValueError('bad value 3')
+                yield value
+
+        threads = threading.active_count()
+        actual = []
+        with self.assertRaisesRegex(ValueError, 'bad value 3'):
+            for value in pipeline.run(iter(range(1000)), [('fail', fail)], max_queued=1):
+                actual.append(value)
+
+        self.assertEqual([0, 1, 2], actual)
+        self.assertEqual(threads, threading.active_count())
+
+    def test_closed_early(self):
+        threads = threading.active_count()
+        values = pipeline.run(iter(range(1000)), [('identity', lambda values: values)], max_queued=1)
+        self.assertEqual(0, next(values))
+        values.close()
+        self.assertEqual(threads, threading.active_count())
+
+
+if __name__ == '__main__':
+    unittest.main()
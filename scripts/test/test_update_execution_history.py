@@ -1,12 +1,20 @@
 import unittest
+from unittest import mock
 from dataclasses import dataclass
 from typing import Dict, List
 import json
+import os
+import subprocess
+import tempfile
 import warnings
 from botocore import endpoint
 from moto import mock_dynamodb2
 import boto3
 from botocore.exceptions import ClientError
+import aws_session
+import branch_details_cache
+import execution_history_table
+import export_sink
 import update_execution_history
 
 
@@ -21,17 +29,23 @@ class TestUpdateExecutionHistory(unittest.TestCase):
         },
         {
             'table_name': 'Test_Repo_T_Execution_History',
-            'p_key': 'build_number'
+            'p_key': 'build_number',
+            's_key': 'jira_id'
         }
     ]
 
     def setUp(self, dynamodb=None):
         warnings.filterwarnings(action='ignore', message='unclosed', category=ResourceWarning)
+        aws_session.configure(endpoint='http://localhost:8000')
+        branch_details_cache.configure(path='')
         if not dynamodb:
             dynamo_db = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
 
         for repo_t_table in self.repo_t_tables:
             try:
+                if 's_key' in repo_t_table:
+                    dynamo_db.create_table(**execution_history_table.table_definition(repo_t_table['table_name']))
+                    continue
                 table = dynamo_db.create_table(
                     TableName=repo_t_table['table_name'],
                     KeySchema=[
@@ -86,6 +100,17 @@ class TestUpdateExecutionHistory(unittest.TestCase):
                           'summary': 'xhaven-5184: updated names', 'risk': 'NONE', 'package': '',
                           'author': {'name': 'rreed210', 'email': 'richard_reed@comcast.com'}, 
                           'filenames': []}
+            ),
+            TestCase(
+                name='HARVESTED BODY AND FILES', 
+                input={'commit': 'e32b218', 'date': 'Mon Aug 16 08:44:51 2021 -0500', 
+                       'summary': 'xhaven-5184: updated names', 
+                       'author': {'name': 'rreed210', 'email': 'richard_reed@comcast.com'},
+                       'body': 'Details\nRisks: Medium\nTesting: unit', 'filenames': ['src/main.c']},
+                expected={'commit': 'e32b218', 'date': 'Mon Aug 16 08:44:51 2021 -0500', 
+                          'summary': 'xhaven-5184: updated names', 'risk': 'Medium', 'package': '',
+                          'author': {'name': 'rreed210', 'email': 'richard_reed@comcast.com'}, 
+                          'filenames': ['src/main.c']}
             )
         ]
 
@@ -213,6 +238,204 @@ class TestUpdateExecutionHistory(unittest.TestCase):
                 f'failed test {case.name} expected {case.expected}, actual {actual}'
             )
 
+    def test_get_item_from_dynamodb_missing(self):
+        with self.assertRaises(update_execution_history.ExecutionHistoryError):
+            update_execution_history.get_item_from_dynamodb(
+                self.repo_t_tables[0]['table_name'], self.repo_t_tables[0]['p_key'], 'release/0.0')
+
+    def test_get_items_from_dynamodb(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: list
+            expected: list
+
+        testcases = [
+            TestCase(
+                name='ONE FOUND',
+                input=['release/10.7'],
+                expected=['release/10.7']
+            ),
+            TestCase(
+                name='MISSING AND DUPLICATE KEYS',
+                input=['release/10.7', 'release/0.0', 'release/10.7'],
+                expected=['release/10.7']
+            )
+        ]
+
+        for case in testcases:
+            items = update_execution_history.get_items_from_dynamodb(
+                self.repo_t_tables[0]['table_name'], self.repo_t_tables[0]['p_key'], case.input)
+            actual = sorted(items)
+            self.assertEqual(
+                case.expected,
+                actual,
+                f'failed test {case.name} expected {case.expected}, actual {actual}'
+            )
+        self.assertEqual('10.07.00.000000', items['release/10.7']['build_version'])
+
+    def test_parse_branches_isolates_failures(self):
+        repo_t_tables = update_execution_history.repo_t_tables
+        update_execution_history.repo_t_tables = self.repo_t_tables
+        try:
+            reports = update_execution_history.parse_branches(['release/0.0'], workers=2)
+        finally:
+            update_execution_history.repo_t_tables = repo_t_tables
+
+        self.assertEqual(['release/0.0'], list(reports))
+        self.assertTrue(update_execution_history.report_failed(reports['release/0.0']))
+        self.assertIn('not found', reports['release/0.0']['message'])
+
+    def test_get_revision_range(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: str
+            expected: list
+
+        with tempfile.TemporaryDirectory() as repo:
+            git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+            subprocess.run(['git', 'init', '-q', repo], check=True)
+            commits = []
+            for number in range(3):
+                subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', f'XHFW-{number}: change'],
+                               cwd=repo, check=True)
+                commits.append(subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo, capture_output=True,
+                                              text=True, check=True).stdout.strip())
+
+            testcases = [
+                TestCase(
+                    name='NO WATERMARK',
+                    input=None,
+                    expected=[commits[2], '--since', update_execution_history.git_time_period]
+                ),
+                TestCase(
+                    name='WATERMARK IN HISTORY',
+                    input=commits[0],
+                    expected=[f'{commits[0]}..{commits[2]}']
+                ),
+                TestCase(
+                    name='REWRITTEN HISTORY',
+                    input='0' * 40,
+                    expected=[commits[2], '--since', update_execution_history.git_time_period]
+                )
+            ]
+
+            xhfw_repo = update_execution_history.xhfw_repo
+            update_execution_history.xhfw_repo = repo
+            try:
+                self.assertEqual(commits[2], update_execution_history.get_head_commit('HEAD'))
+                for case in testcases:
+                    actual, _ = update_execution_history.get_revision_range(commits[2], case.input)
+                    self.assertEqual(
+                        case.expected,
+                        actual,
+                        f'failed test {case.name} expected {case.expected}, actual {actual}'
+                    )
+            finally:
+                update_execution_history.xhfw_repo = xhfw_repo
+
+    def test_update_repo_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+            origin = os.path.join(directory, 'origin')
+            subprocess.run(['git', 'init', '-q', '-b', 'release/10.7', origin], check=True)
+            subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=origin, check=True)
+
+            repo_cache_dir = update_execution_history.repo_cache_dir
+            xhfw_repo = update_execution_history.xhfw_repo
+            update_execution_history.repo_cache_dir = os.path.join(directory, 'cache')
+            update_execution_history.xhfw_repo = os.path.join(directory, 'cache', 'core')
+            try:
+                heads = []
+                for number in range(2):
+                    subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', f'XHFW-{number}: change'],
+                                   cwd=origin, check=True)
+                    update_execution_history.update_repo_cache(f'file://{origin}', 'release/10.7')
+                    heads.append(update_execution_history.get_head_commit(
+                        update_execution_history.remote_branch_ref('release/10.7')))
+                expected = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=origin, capture_output=True,
+                                          text=True, check=True).stdout.strip()
+                self.assertEqual(expected, heads[1])
+                self.assertNotEqual(heads[0], heads[1])
+            finally:
+                update_execution_history.repo_cache_dir = repo_cache_dir
+                update_execution_history.xhfw_repo = xhfw_repo
+
+    def test_parse_branches_single_fetch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+            origin = os.path.join(directory, 'origin')
+            subprocess.run(['git', 'init', '-q', '-b', 'release/10.7', origin], check=True)
+            subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=origin, check=True)
+            subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', 'XHFW-1018: change'], cwd=origin, check=True)
+            subprocess.run(['git', 'branch', 'release/10.8'], cwd=origin, check=True)
+            subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', 'XHFW-1080: change'], cwd=origin, check=True)
+
+            table = boto3.resource('dynamodb', endpoint_url='http://localhost:8000').Table(
+                self.repo_t_tables[0]['table_name'])
+            for branch_name in ('release/10.7', 'release/10.8'):
+                table.put_item(Item={'build_version': '10.07.00.000000', 'developers': ['Weston Boyd'],
+                                     'gerrit_branch_name': branch_name, 'gerrit_url': f'file://{origin}',
+                                     'inventory_board': 'Onsite_Rack_8_Board_3',
+                                     'nexus_url': 'https://nexus.comcast.com'})
+
+            fetches = []
+            fetch_refs = update_execution_history.git_backend.SubprocessGitBackend.fetch_refs
+
+            def counting_fetch_refs(backend, remote, refspecs, extra_args=None):
+                fetches.append(len(refspecs))
+                return fetch_refs(backend, remote, refspecs, extra_args)
+
+            settings = (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                        update_execution_history.xhfw_repo)
+            update_execution_history.repo_t_tables = self.repo_t_tables
+            update_execution_history.repo_cache_dir = os.path.join(directory, 'cache')
+            update_execution_history.xhfw_repo = os.path.join(directory, 'cache', 'core')
+            try:
+                with mock.patch.object(update_execution_history.git_backend.SubprocessGitBackend, 'fetch_refs',
+                                       counting_fetch_refs):
+                    reports = update_execution_history.parse_branches(['release/10.7', 'release/10.8'], workers=2)
+                    # a branch missing upstream fails the combined fetch; the others fetch on their own
+                    fetched = update_execution_history.fetch_branches([
+                        {'gerrit_branch_name': 'release/10.7', 'gerrit_url': f'file://{origin}'},
+                        {'gerrit_branch_name': 'release/0.0', 'gerrit_url': f'file://{origin}'}])
+                bare = os.path.isfile(os.path.join(directory, 'cache', 'core', 'HEAD'))
+            finally:
+                (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                 update_execution_history.xhfw_repo) = settings
+
+        self.assertEqual([2, 2], fetches)
+        self.assertEqual(set(), fetched)
+        self.assertTrue(bare)
+        self.assertEqual([False, False], [update_execution_history.report_failed(report)
+                                          for report in reports.values()])
+        self.assertEqual([['XHFW-1018', 'XHFW-1080'], ['XHFW-1018']],
+                         [sorted(item['jira_id'] for item in report['items'] if item['jira_id'].startswith('XHFW'))
+                          for report in reports.values()])
+
+    def test_update_watermark(self):
+        repo_t_tables = update_execution_history.repo_t_tables
+        update_execution_history.repo_t_tables = self.repo_t_tables
+        try:
+            details = update_execution_history.get_item_from_dynamodb(
+                self.repo_t_tables[0]['table_name'], self.repo_t_tables[0]['p_key'], 'release/10.7')
+            update_execution_history.get_branch_details(['release/10.7'])
+            update_execution_history.update_watermark(details, 'a' * 40)
+            # the new watermark is written through to the cached branch details
+            cached = update_execution_history.get_branch_details(['release/10.7'])['release/10.7']
+            # stale watermark read by a concurrent run does not rewind the stored one
+            update_execution_history.update_watermark(details, 'b' * 40)
+            actual = update_execution_history.get_item_from_dynamodb(
+                self.repo_t_tables[0]['table_name'], self.repo_t_tables[0]['p_key'], 'release/10.7')
+            reloaded = update_execution_history.get_branch_details(['release/10.7'])['release/10.7']
+        finally:
+            update_execution_history.repo_t_tables = repo_t_tables
+
+        self.assertEqual('a' * 40, actual[update_execution_history.watermark_attribute])
+        self.assertEqual('a' * 40, cached[update_execution_history.watermark_attribute])
+        self.assertEqual('a' * 40, reloaded[update_execution_history.watermark_attribute])
+
     def test_build_db_item(self):
         @dataclass
         class TestCase:
@@ -407,24 +630,220 @@ class TestUpdateExecutionHistory(unittest.TestCase):
                 f'failed test {case.name} expected {case.expected}, actual {actual}'
             )
 
+    def test_match_developer(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: dict
+            expected: str
+
+        developer_index = update_execution_history.build_developer_index(
+            ['John Elderton', 'Weston Boyd', 'Thomas Lea'],
+            {'thoas_lea@comcast.com': 'Thomas Lea', 'jelderton': 'John Elderton', 'unknown': 'Micah Koch'})
+        testcases = [
+            TestCase(
+                name='NAME MATCH',
+                input={'name': 'Weston Boyd', 'email': 'weston_boyd@comcast.com'},
+                expected='Weston Boyd'
+            ),
+            TestCase(
+                name='CASE INSENSITIVE NAME MATCH',
+                input={'name': 'weston boyd', 'email': 'wboyd@example.com'},
+                expected='Weston Boyd'
+            ),
+            TestCase(
+                name='EMAIL ALIAS MATCH',
+                input={'name': 'tlea', 'email': 'thoas_lea@comcast.com'},
+                expected='Thomas Lea'
+            ),
+            TestCase(
+                name='NAME ALIAS MATCH',
+                input={'name': 'jelderton', 'email': 'john@example.com'},
+                expected='John Elderton'
+            ),
+            TestCase(
+                name='ALIAS FOR UNTRACKED DEVELOPER',
+                input={'name': 'unknown', 'email': 'micah_koch@comcast.com'},
+                expected=None
+            ),
+            TestCase(
+                name='NO MATCH',
+                input={'name': 'Micah Koch', 'email': 'micah_koch@comcast.com'},
+                expected=None
+            )
+        ]
+
+        for case in testcases:
+            actual = update_execution_history.match_developer({'author': case.input}, developer_index)
+            self.assertEqual(
+                case.expected,
+                actual,
+                f'failed test {case.name} expected {case.expected}, actual {actual}'
+            )
+
+    def test_get_jira_id(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: list
+            expected: str
+
+        testcases = [
+            TestCase(
+                name='ONE JIRA ID',
+                input=['Xhfw-1234: This is a test', None],
+                expected='XHFW-1234'
+            ),
+            TestCase(
+                name='TWO JIRA IDS',
+                input=['XHFW-1565, XHFW-1566: Reference XHFW-1234', None],
+                expected='XHFW-1565_XHFW-1566'
+            ),
+            TestCase(
+                name='NO JIRA ID',
+                input=['This is a test', None],
+                expected='NONE'
+            ),
+            TestCase(
+                name='PROJECT KEY ALLOWLIST',
+                input=['CVE-2021: XHFW-1565 fix', {'XHFW'}],
+                expected='XHFW-1565'
+            ),
+            TestCase(
+                name='PROJECT KEY NOT ALLOWED',
+                input=['CVE-2021: fix', {'XHFW'}],
+                expected='NONE'
+            )
+        ]
+
+        for case in testcases:
+            actual = update_execution_history.get_jira_id(case.input[0], case.input[1])
+            self.assertEqual(
+                case.expected,
+                actual,
+                f'failed test {case.name} expected {case.expected}, actual {actual}'
+            )
+
+    def test_build_db_item_independent_items(self):
+        git_logs = [
+            {'author': {'email': 'weston_boyd@comcast.com', 'name': 'Weston Boyd'}, 'commit': '8a6f24a21',
+             'date': 'Mon Aug 9 18:45:20 2021 -0500', 'filenames': ['src/main.c'], 'package': '', 'risk': 'Low',
+             'summary': 'XHFW-1018 : xhNetworkUtil no custom DNS for Flex'},
+            {'author': {'email': 'thoas_lea@comcast.com', 'name': 'Thomas Lea'}, 'commit': '8a6f24a51',
+             'date': 'Mon Aug 9 18:31:20 2021 -0500', 'filenames': ['src/main.c'], 'package': '', 'risk': 'Low',
+             'summary': 'XHFW-1080 : xhNetworkUtil no custom DNS for Flex'}
+        ]
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+
+        payload = update_execution_history.build_db_item(git_logs, cpe_branch_details)
+        payload[0]['components'].append('networkUtil')
+        payload[0]['pagination']['current_page'] = 1
+        payload[0]['git_logs'][0]['filenames'].append('src/util.c')
+
+        self.assertEqual([], payload[1]['components'])
+        self.assertEqual(0, payload[1]['pagination']['current_page'])
+        self.assertEqual(['src/main.c'], git_logs[0]['filenames'])
+
+    def test_paginate_db_items(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: list
+            expected: list
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        git_logs = [
+            {'author': {'email': f'developer_{number}@comcast.com', 'name': f'Developer {number}'},
+             'commit': f'8a6f24a{number}', 'date': 'Mon Aug 9 18:45:20 2021 -0500',
+             'filenames': [f'source/module{number}/file{index}.c' for index in range(40)],
+             'package': '', 'risk': 'Low', 'summary': 'XHFW-1018 : large refactor'}
+            for number in range(6)
+        ]
+        testcases = [
+            TestCase(
+                name='FITS, NOT PAGINATED',
+                input=[100000, 'never'],
+                expected=[('XHFW-1018', 0, 0, 0, 6)]
+            ),
+            TestCase(
+                name='SPLIT ACROSS PAGES',
+                input=[4000, 'never'],
+                expected=[('XHFW-1018', 1, 2, 3, 3), ('XHFW-1018#2', 2, 2, 3, 3)]
+            ),
+            TestCase(
+                name='COMPRESSED TO FIT',
+                input=[4000, 'oversized'],
+                expected=[('XHFW-1018', 0, 0, 0, 6)]
+            )
+        ]
+
+        for case in testcases:
+            payload = [update_execution_history.new_db_item(cpe_branch_details, 'XHFW-1018')]
+            payload[0]['git_logs'] = json.loads(json.dumps(git_logs))
+            paginated = update_execution_history.paginate_db_items(payload, case.input[0], case.input[1])
+            actual = [(item['jira_id'], item['pagination']['current_page'], item['pagination']['total_pages'],
+                       item['pagination']['page_size'], len(item['git_logs'])) for item in paginated]
+            self.assertEqual(
+                case.expected,
+                actual,
+                f'failed test {case.name} expected {case.expected}, actual {actual}'
+            )
+            for item in paginated:
+                self.assertLessEqual(update_execution_history.item_size(item), case.input[0])
+                for git_log in item['git_logs']:
+                    self.assertEqual(40, len(update_execution_history.decompress_filenames(git_log)))
+
+    def test_truncate_oversized_git_log(self):
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        payload = [update_execution_history.new_db_item(cpe_branch_details, 'XHFW-1018')]
+        payload[0]['git_logs'] = [
+            {'author': {'email': 'weston_boyd@comcast.com', 'name': 'Weston Boyd'}, 'commit': '8a6f24a21',
+             'date': 'Mon Aug 9 18:45:20 2021 -0500', 'package': '', 'risk': 'Low',
+             'filenames': [f'source/module/file{index}.c' for index in range(1000)],
+             'summary': 'XHFW-1018 : vendor import'}
+        ]
+
+        paginated = update_execution_history.paginate_db_items(payload, 2000, 'never')
+
+        self.assertEqual(1, len(paginated))
+        self.assertLessEqual(update_execution_history.item_size(paginated[0]), 2000)
+        self.assertTrue(paginated[0]['git_logs'][0]['filenames_truncated'])
+
     def test_get_filenames(self):
         pass
 
     def test_build_dynamodb_payload(self):
         pass
 
+    def test_table_key_attributes(self):
+        table = mock.Mock()
+        table.name = 'Test_Key_Schema_Table'
+        key_schema = mock.PropertyMock(return_value=[{'AttributeName': 'build_number', 'KeyType': 'HASH'},
+                                                     {'AttributeName': 'jira_id', 'KeyType': 'RANGE'}])
+        type(table).key_schema = key_schema
+        try:
+            for _ in range(3):
+                self.assertEqual(['build_number', 'jira_id'], update_execution_history.table_key_attributes(table))
+        finally:
+            update_execution_history.key_attributes_cache.pop(table.name, None)
+        # the table is described once
+        self.assertEqual(1, key_schema.call_count)
+
     def test_update_dynamodb_table(self):
         @dataclass
         class TestCase:
             name: str
             input: list
-            expected: str
+            expected: dict
 
         testcases = [
             TestCase(
                 name='NO PAYLOAD',
                 input=[],
-                expected='Nothing to update'
+                expected={'message': 'Nothing to update', 'succeeded': 0, 'failed': 0}
             ),
             TestCase(
                 name='VALID PAYLOAD - 1 ITEM', 
@@ -472,7 +891,8 @@ class TestUpdateExecutionHistory(unittest.TestCase):
                         }
                     }
                 ], 
-                expected=f'Successfully added 1 item(s) to {self.repo_t_tables[1]["table_name"]} table.'
+                expected={'message': f'Successfully added 1 item(s) to {self.repo_t_tables[1]["table_name"]} table.',
+                          'succeeded': 1, 'failed': 0}
             ),
             TestCase(
                 name='VALID PAYLOAD - 2 ITEMS', 
@@ -561,18 +981,420 @@ class TestUpdateExecutionHistory(unittest.TestCase):
                         }
                     }
                 ], 
-                expected=f'Successfully added 2 item(s) to {self.repo_t_tables[1]["table_name"]} table.'
+                expected={'message': f'Successfully added 2 item(s) to {self.repo_t_tables[1]["table_name"]} table.',
+                          'succeeded': 2, 'failed': 0}
             )
         ]
         
         for case in testcases:
-            actual = update_execution_history.update_dynamodb_table('Test_Repo_T_Execution_History', case.input)
+            report = update_execution_history.update_dynamodb_table('Test_Repo_T_Execution_History', case.input)
+            actual = {key: report[key] for key in case.expected}
+            self.assertEqual(
+                case.expected,
+                actual,
+                f'failed test {case.name} expected {case.expected}, actual {actual}'
+            )
+
+    def test_update_dynamodb_table_upsert(self):
+        def git_log(commit: str, name: str) -> dict:
+            return {'author': {'email': f'{name.lower().replace(" ", "_")}@comcast.com', 'name': name},
+                    'commit': commit, 'date': 'Mon Aug 9 18:45:20 2021 -0500', 'filenames': ['src/main.c'],
+                    'package': '', 'risk': 'Low', 'summary': 'XHFW-1018 : xhNetworkUtil no custom DNS for Flex'}
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        table_name = self.repo_t_tables[1]['table_name']
+
+        first_run = update_execution_history.build_db_item(
+            [git_log('8a6f24a21', 'Weston Boyd'), git_log('8a6f24a51', 'Thomas Lea')], cpe_branch_details)
+        second_run = update_execution_history.build_db_item(
+            [git_log('8a6f24a51', 'Thomas Lea'), git_log('8a6f24b21', 'Micah Koch')], cpe_branch_details)
+        reports = [update_execution_history.update_dynamodb_table(table_name, payload, 'upsert')
+                   for payload in (first_run, second_run, second_run)]
+
+        dynamo_db = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
+        item = dynamo_db.Table(table_name).get_item(
+            Key={'build_number': '10.07.00.000000', 'jira_id': 'XHFW-1018'})['Item']
+
+        self.assertEqual([1, 1, 1], [report['succeeded'] for report in reports])
+        self.assertEqual(['8a6f24a21', '8a6f24a51', '8a6f24b21'], [log['commit'] for log in item['git_logs']])
+        self.assertEqual({'Weston Boyd', 'Thomas Lea', 'Micah Koch'}, item['developers'])
+        self.assertEqual({'8a6f24a21', '8a6f24a51', '8a6f24b21'}, item['commits'])
+        self.assertEqual('XHFW-1018', item['jira_id'])
+
+    def test_update_dynamodb_table_put_then_upsert(self):
+        def git_log(commit: str, name: str) -> dict:
+            return {'author': {'email': f'{name.lower().replace(" ", "_")}@comcast.com', 'name': name},
+                    'commit': commit, 'date': 'Mon Aug 9 18:45:20 2021 -0500', 'filenames': ['src/main.c'],
+                    'package': '', 'risk': 'Low', 'summary': 'XHFW-1018 : xhNetworkUtil no custom DNS for Flex'}
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        table_name = self.repo_t_tables[1]['table_name']
+
+        put_run = update_execution_history.build_db_item(
+            [git_log('8a6f24a21', 'Weston Boyd'), git_log('8a6f24a51', 'Thomas Lea')], cpe_branch_details)
+        upsert_run = update_execution_history.build_db_item(
+            [git_log('8a6f24a51', 'Thomas Lea'), git_log('8a6f24b21', 'Micah Koch')], cpe_branch_details)
+        reports = [update_execution_history.update_dynamodb_table(table_name, put_run, 'put')]
+        reports += [update_execution_history.update_dynamodb_table(table_name, upsert_run, 'upsert')
+                    for _ in range(2)]
+
+        dynamo_db = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
+        item = dynamo_db.Table(table_name).get_item(
+            Key={'build_number': '10.07.00.000000', 'jira_id': 'XHFW-1018'})['Item']
+
+        # the put item's lists are converted to sets and its commits are not appended again
+        self.assertEqual([0, 0, 0], [report['failed'] for report in reports])
+        self.assertEqual(['8a6f24a21', '8a6f24a51', '8a6f24b21'], [log['commit'] for log in item['git_logs']])
+        self.assertEqual({'Weston Boyd', 'Thomas Lea', 'Micah Koch'}, item['developers'])
+        self.assertEqual({'8a6f24a21', '8a6f24a51', '8a6f24b21'}, item['commits'])
+        self.assertNotIn('components', item)
+
+    def test_update_dynamodb_table_upsert_spills_pages(self):
+        def git_log(number: int) -> dict:
+            return {'author': {'email': 'weston_boyd@comcast.com', 'name': 'Weston Boyd'}, 'commit': f'8a6f{number:05}',
+                    'date': 'Mon Aug 9 18:45:20 2021 -0500', 'filenames': [f'src/file{number}.c'] * 10,
+                    'package': '', 'risk': 'Low', 'summary': 'XHFW-1018 : xhNetworkUtil no custom DNS for Flex'}
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        table_name = self.repo_t_tables[1]['table_name']
+
+        with mock.patch.object(update_execution_history, 'max_item_bytes', 2000), \
+                mock.patch.object(update_execution_history, 'upsert_chunk_size', 2):
+            reports = [update_execution_history.update_dynamodb_table(
+                table_name, update_execution_history.build_db_item([git_log(number) for number in numbers],
+                                                                   cpe_branch_details, ['XHFW']), 'upsert')
+                for numbers in (range(10), range(5, 20), range(20))]
+            items = list(execution_history_table.query_jira('XHFW-1018', table_name))
+
+        commits = [log['commit'] for item in items for log in item['git_logs']]
+        self.assertEqual([0, 0, 0], [report['failed'] for report in reports])
+        self.assertGreater(len(items), 2)
+        # every commit is stored once, on a page that stays under the size budget
+        self.assertEqual(sorted(git_log(number)['commit'] for number in range(20)), sorted(commits))
+        for page_number, item in enumerate(items[1:], start=2):
+            self.assertEqual(f'XHFW-1018#{page_number}', item['jira_id'])
+            self.assertEqual(page_number, item['pagination']['current_page'])
+        for item in items:
+            self.assertLessEqual(update_execution_history.item_size(item), 2000 + 100)
+        self.assertEqual(len(items), items[0]['pagination']['total_pages'])
+
+    def test_update_dynamodb_table_upsert_payload_page(self):
+        def git_log(number: int) -> dict:
+            return {'author': {'email': 'weston_boyd@comcast.com', 'name': 'Weston Boyd'}, 'commit': f'8a6f{number:05}',
+                    'date': 'Mon Aug 9 18:45:20 2021 -0500', 'filenames': [f'src/file{number}.c'],
+                    'package': '', 'risk': 'Low', 'summary': 'XHFW-1018 : xhNetworkUtil no custom DNS for Flex'}
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        table_name = self.repo_t_tables[1]['table_name']
+        first_page = update_execution_history.build_db_item([git_log(number) for number in range(3)],
+                                                            cpe_branch_details, ['XHFW'])
+        # a payload page of the same jira id repeating a commit stored on the first page
+        second_page = [dict(item, jira_id=f'{item["jira_id"]}#2', git_logs=[git_log(1), git_log(3)])
+                       for item in first_page]
+
+        reports = [update_execution_history.update_dynamodb_table(table_name, payload, 'upsert')
+                   for payload in (first_page, second_page)]
+        items = list(execution_history_table.query_jira('XHFW-1018', table_name))
+
+        commits = [log['commit'] for item in items for log in item['git_logs']]
+        self.assertEqual([0, 0], [report['failed'] for report in reports])
+        self.assertEqual(sorted(git_log(number)['commit'] for number in range(4)), sorted(commits))
+        self.assertEqual(['XHFW-1018'], [item['jira_id'] for item in items])
+
+    def test_parse_git_logs_pipeline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            origin = os.path.join(directory, 'origin')
+            subprocess.run(['git', 'init', '-q', '-b', 'release/10.7', origin], check=True)
+            subprocess.run(['git', 'config', 'uploadpack.allowFilter', 'true'], cwd=origin, check=True)
+            for number in range(7):
+                name = ['Weston Boyd', 'Thomas Lea', 'Micah Koch'][number % 3]
+                email = f'{name.lower().replace(" ", "_")}@comcast.com'
+                git = ['git', '-c', f'user.name={name}', '-c', f'user.email={email}']
+                with open(os.path.join(origin, f'file{number}.c'), 'w') as source_file:
+                    source_file.write(f'{number}\n')
+                subprocess.run(git + ['add', '.'], cwd=origin, check=True)
+                message = f'XHFW-{1000 + number % 2} : change {number}\n\nRisks: Low'
+                subprocess.run(git + ['commit', '-q', '-m', message], cwd=origin, check=True)
+
+            cpe_branch_details = {'build_version': '10.07.00.000000', 'developers': ['Weston Boyd', 'Thomas Lea'],
+                                  'gerrit_branch_name': 'release/10.7', 'gerrit_url': f'file://{origin}',
+                                  'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+            settings = (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                        update_execution_history.xhfw_repo, update_execution_history.pipeline_mode,
+                        update_execution_history.pipeline_flush_size)
+            update_execution_history.repo_t_tables = self.repo_t_tables
+            update_execution_history.repo_cache_dir = os.path.join(directory, 'cache')
+            update_execution_history.xhfw_repo = os.path.join(directory, 'cache', 'core')
+            update_execution_history.pipeline_mode = True
+            update_execution_history.pipeline_flush_size = 2
+            try:
+                report = update_execution_history.parse_git_logs('release/10.7', cpe_branch_details)
+                items = execution_history_table.query_build('10.07.00.000000', self.repo_t_tables[1]['table_name'])
+                items = sorted(items, key=lambda item: item['jira_id'])
+            finally:
+                (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                 update_execution_history.xhfw_repo, update_execution_history.pipeline_mode,
+                 update_execution_history.pipeline_flush_size) = settings
+
+        self.assertEqual(0, report['failed'])
+        self.assertEqual(len(report['items']), report['succeeded'])
+        self.assertEqual(['XHFW-1000', 'XHFW-1001'], [item['jira_id'] for item in items])
+        self.assertEqual([['change 6', 'change 4', 'change 0'], ['change 3', 'change 1']],
+                         [[log['summary'][12:] for log in item['git_logs']] for item in items])
+        self.assertEqual({'Low'}, {log['risk'] for item in items for log in item['git_logs']})
+        self.assertEqual({'Weston Boyd', 'Thomas Lea'}, items[0]['developers'])
+
+    def test_parse_git_logs_pipeline_export(self):
+        with tempfile.TemporaryDirectory() as directory:
+            origin = os.path.join(directory, 'origin')
+            subprocess.run(['git', 'init', '-q', '-b', 'release/10.7', origin], check=True)
+            git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+            for number in range(5):
+                subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', f'XHFW-{1000 + number % 2} : change'],
+                               cwd=origin, check=True)
+
+            cpe_branch_details = {'build_version': '10.07.00.000000', 'developers': ['Weston Boyd'],
+                                  'gerrit_branch_name': 'release/10.7', 'gerrit_url': f'file://{origin}',
+                                  'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+            settings = (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                        update_execution_history.xhfw_repo, update_execution_history.pipeline_mode,
+                        update_execution_history.pipeline_flush_size, update_execution_history.export_writer)
+            update_execution_history.repo_t_tables = self.repo_t_tables
+            update_execution_history.repo_cache_dir = os.path.join(directory, 'cache')
+            update_execution_history.xhfw_repo = os.path.join(directory, 'cache', 'core')
+            update_execution_history.pipeline_mode = True
+            update_execution_history.pipeline_flush_size = 2
+            update_execution_history.export_writer = export_sink.ShardWriter(os.path.join(directory, 'export'))
+            try:
+                report = update_execution_history.parse_git_logs('release/10.7', cpe_branch_details)
+                shards = update_execution_history.export_writer.close()
+                items = export_sink.read_items(os.path.join(directory, 'export', shards[0]['key']))
+            finally:
+                (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                 update_execution_history.xhfw_repo, update_execution_history.pipeline_mode,
+                 update_execution_history.pipeline_flush_size, update_execution_history.export_writer) = settings
+
+        # exports are not merged like upserts, so flushes must not repeat a key across shards
+        keys = [(item['build_number']['S'], item['jira_id']['S']) for item in items]
+        self.assertEqual(0, report['failed'])
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual([3, 2], [len(item['git_logs']['L']) for item in items if 'git_logs' in item])
+
+    def test_parse_git_logs_twice(self):
+        with tempfile.TemporaryDirectory() as directory:
+            git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+            origin = os.path.join(directory, 'origin')
+            subprocess.run(['git', 'init', '-q', '-b', 'release/10.7', origin], check=True)
+            dynamo_db = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
+            dynamo_db.Table(self.repo_t_tables[0]['table_name']).put_item(Item={
+                'build_version': '10.07.00.000000', 'developers': ['Weston Boyd'], 'gerrit_branch_name': 'release/10.7',
+                'gerrit_url': f'file://{origin}', 'inventory_board': 'Onsite_Rack_8_Board_3',
+                'nexus_url': 'https://nexus.comcast.com'})
+
+            settings = (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                        update_execution_history.xhfw_repo, update_execution_history.write_mode)
+            update_execution_history.repo_t_tables = self.repo_t_tables
+            update_execution_history.repo_cache_dir = os.path.join(directory, 'cache')
+            update_execution_history.xhfw_repo = os.path.join(directory, 'cache', 'core')
+            update_execution_history.write_mode = 'put'
+            try:
+                reports = []
+                for number in range(2):
+                    subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', f'XHFW-1018 : change {number}'],
+                                   cwd=origin, check=True)
+                    reports.append(update_execution_history.parse_git_logs('release/10.7'))
+            finally:
+                (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                 update_execution_history.xhfw_repo, update_execution_history.write_mode) = settings
+
+        item = dynamo_db.Table(self.repo_t_tables[1]['table_name']).get_item(
+            Key={'build_number': '10.07.00.000000', 'jira_id': 'XHFW-1018'})['Item']
+
+        # the second run only harvests the new commit and must not replace the first one
+        self.assertEqual([0, 0], [report['failed'] for report in reports])
+        self.assertEqual(['XHFW-1018 : change 0', 'XHFW-1018 : change 1'],
+                         sorted(git_log['summary'] for git_log in item['git_logs']))
+
+    def test_parse_git_logs_git_failure(self):
+        with tempfile.TemporaryDirectory() as directory:
+            git = ['git', '-c', 'user.name=Weston Boyd', '-c', 'user.email=weston_boyd@comcast.com']
+            origin = os.path.join(directory, 'origin')
+            subprocess.run(['git', 'init', '-q', '-b', 'release/10.7', origin], check=True)
+            subprocess.run(git + ['commit', '-q', '--allow-empty', '-m', 'XHFW-1018: change'], cwd=origin, check=True)
+            table = boto3.resource('dynamodb', endpoint_url='http://localhost:8000').Table(
+                self.repo_t_tables[0]['table_name'])
+            cpe_branch_details = {'build_version': '10.07.00.000000', 'developers': ['Weston Boyd'],
+                                  'gerrit_branch_name': 'release/10.7', 'gerrit_url': f'file://{origin}',
+                                  'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+            table.put_item(Item=cpe_branch_details)
+
+            def failing_range(head_commit, last_commit=None, backend=None):
+                return [f'deadbeef..{head_commit}'], 'since deadbeef'
+
+            settings = (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                        update_execution_history.xhfw_repo, update_execution_history.pipeline_mode)
+            update_execution_history.repo_t_tables = self.repo_t_tables
+            update_execution_history.repo_cache_dir = os.path.join(directory, 'cache')
+            update_execution_history.xhfw_repo = os.path.join(directory, 'cache', 'core')
+            try:
+                with mock.patch.object(update_execution_history, 'get_revision_range', failing_range):
+                    for pipeline_mode in (False, True):
+                        update_execution_history.pipeline_mode = pipeline_mode
+                        with self.assertRaises(update_execution_history.ExecutionHistoryError):
+                            update_execution_history.parse_git_logs('release/10.7', dict(cpe_branch_details))
+            finally:
+                (update_execution_history.repo_t_tables, update_execution_history.repo_cache_dir,
+                 update_execution_history.xhfw_repo, update_execution_history.pipeline_mode) = settings
+            stored = table.get_item(Key={'gerrit_branch_name': 'release/10.7'})['Item']
+
+        # a failed git log must not move the watermark past commits that were never harvested
+        self.assertNotIn(update_execution_history.watermark_attribute, stored)
+
+    def test_component_map(self):
+        def git_log(commit: str, filenames: list) -> dict:
+            return {'author': {'email': 'weston_boyd@comcast.com', 'name': 'Weston Boyd'}, 'commit': commit,
+                    'date': 'Mon Aug 9 18:45:20 2021 -0500', 'filenames': filenames, 'body': 'Risks: Low',
+                    'summary': 'XHFW-1018 : xhNetworkUtil no custom DNS for Flex'}
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        rules = {'source/utils/networkUtil': {'package': 'xhNetworkUtil', 'component': 'Networking'},
+                 'source/wifi': {'package': 'xhWifi', 'component': 'WiFi'}}
+        table_name = self.repo_t_tables[1]['table_name']
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'components.json')
+            with open(path, 'w') as json_file:
+                json.dump(rules, json_file)
+
+            component_map_file = update_execution_history.component_map_file
+            update_execution_history.component_map_file = path
+            try:
+                git_logs = [update_execution_history.format_git_log(git_log(commit, filenames)) for commit, filenames in
+                            (('8a6f24a21', ['source/utils/networkUtil/dns.c']),
+                             ('8a6f24a51', ['source/wifi/wifi.c', 'README.md']))]
+                payload = update_execution_history.build_db_item(git_logs, cpe_branch_details)
+                reports = [update_execution_history.update_dynamodb_table(table_name, chunk, 'upsert')
+                           for chunk in (update_execution_history.build_db_item(git_logs[:1], cpe_branch_details),
+                                         update_execution_history.build_db_item(git_logs[1:], cpe_branch_details))]
+            finally:
+                update_execution_history.component_map_file = component_map_file
+
+        dynamo_db = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
+        item = dynamo_db.Table(table_name).get_item(
+            Key={'build_number': '10.07.00.000000', 'jira_id': 'XHFW-1018'})['Item']
+
+        self.assertEqual(['xhNetworkUtil', 'xhWifi'], [log['package'] for log in git_logs])
+        self.assertEqual(['Networking', 'WiFi'], payload[0]['components'])
+        self.assertEqual([0, 0], [report['failed'] for report in reports])
+        self.assertEqual({'Networking', 'WiFi'}, item['components'])
+
+    def test_update_dynamodb_table_dedup(self):
+        def git_log(commit: str) -> dict:
+            return {'author': {'email': 'weston_boyd@comcast.com', 'name': 'Weston Boyd'}, 'commit': commit,
+                    'date': 'Mon Aug 9 18:45:20 2021 -0500', 'filenames': ['src/main.c'], 'package': '',
+                    'risk': 'Low', 'summary': f'XHFW-{commit[-1]} : xhNetworkUtil no custom DNS for Flex'}
+
+        cpe_branch_details = {'build_version': '10.07.00.000000', 'gerrit_branch_name': 'release/10.7',
+                              'inventory_board': 'Onsite_Rack_8_Board_3', 'nexus_url': 'https://nexus.comcast.com'}
+        table_name = self.repo_t_tables[1]['table_name']
+        cache_file = update_execution_history.write_dedup.cache_file
+
+        def run(commits: list, dedup: str) -> dict:
+            payload = update_execution_history.build_db_item([git_log(commit) for commit in commits],
+                                                             cpe_branch_details)
+            return update_execution_history.update_dynamodb_table(table_name, payload, 'put', dedup)
+
+        with tempfile.TemporaryDirectory() as directory:
+            update_execution_history.write_dedup.cache_file = os.path.join(directory, 'fingerprints.json')
+            update_execution_history.write_dedup.reset()
+            try:
+                reports = [run(['8a6f24a21', '8a6f24a52'], 'cache'),
+                           run(['8a6f24a21', '8a6f24a53', '8a6f24a63'], 'cache')]
+                # a fresh cache falls back to the hashes stored with the items
+                update_execution_history.write_dedup.forget()
+                reports.append(run(['8a6f24a21', '8a6f24a53', '8a6f24a63'], 'check'))
+                reports.append(run(['8a6f24a21', '8a6f24a53', '8a6f24a63'], 'cache'))
+            finally:
+                update_execution_history.write_dedup.cache_file = cache_file
+                update_execution_history.write_dedup.reset()
+
+        dynamo_db = boto3.resource('dynamodb', endpoint_url='http://localhost:8000')
+        item = dynamo_db.Table(table_name).get_item(Key={'build_number': '10.07.00.000000', 'jira_id': 'XHFW-3'})
+
+        self.assertEqual([(2, 0), (2, 1), (2, 2), (2, 2)],
+                         [(report['succeeded'], report['unchanged']) for report in reports])
+        self.assertEqual({'XHFW-1': 'unchanged', 'XHFW-3': 'written'},
+                         {result['jira_id']: result['status'] for result in reports[1]['items']})
+        self.assertEqual(64, len(item['Item']['content_hash']))
+        self.assertIn('1 unchanged item(s) were not rewritten', reports[1]['message'])
+
+    def test_batch_payload(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: list
+            expected: list
+
+        testcases = [
+            TestCase(
+                name='EMPTY PAYLOAD',
+                input=[],
+                expected=[]
+            ),
+            TestCase(
+                name='UNIQUE KEYS, 2 BATCHES',
+                input=[{'build_number': str(number)} for number in range(30)],
+                expected=[list(range(25)), list(range(25, 30))]
+            ),
+            TestCase(
+                name='DUPLICATE KEYS SPLIT BATCH',
+                input=[{'build_number': '1'}, {'build_number': '2'}, {'build_number': '1'}],
+                expected=[[0, 1], [2]]
+            )
+        ]
+
+        for case in testcases:
+            actual = update_execution_history.batch_payload(case.input, ['build_number'])
             self.assertEqual(
                 case.expected,
                 actual,
                 f'failed test {case.name} expected {case.expected}, actual {actual}'
             )
 
-    
+    def test_write_batch_unprocessed_items(self):
+        class ThrottledDynamoDB:
+            def __init__(self):
+                self.calls = 0
+
+            def batch_write_item(self, RequestItems, **kwargs):
+                self.calls += 1
+                requests = RequestItems['Test_Repo_T_Execution_History']
+                if self.calls == 1:
+                    return {'UnprocessedItems': {'Test_Repo_T_Execution_History': requests[1:]}}
+                return {'UnprocessedItems': {}}
+
+        payload = [{'build_number': '1'}, {'build_number': '2'}, {'build_number': '3'}]
+        results = [{'index': index, 'jira_id': '', 'status': 'pending', 'attempts': 0, 'error': ''}
+                   for index in range(len(payload))]
+        dynamodb = ThrottledDynamoDB()
+        backoff_base = update_execution_history.batch_write_backoff_base
+        update_execution_history.batch_write_backoff_base = 0
+        try:
+            update_execution_history.write_batch(dynamodb, 'Test_Repo_T_Execution_History', payload,
+                                                 [0, 1, 2], ['build_number'], results)
+        finally:
+            update_execution_history.batch_write_backoff_base = backoff_base
+
+        expected = [('written', 1), ('written', 2), ('written', 2)]
+        actual = [(result['status'], result['attempts']) for result in results]
+        self.assertEqual(expected, actual, f'expected {expected}, actual {actual}')
+        self.assertEqual(2, dynamodb.calls)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from dataclasses import dataclass
+from decimal import Decimal
+import write_dedup
+
+
+class TestWriteDedup(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_file = write_dedup.cache_file
+        write_dedup.cache_file = os.path.join(self.directory.name, 'cache', 'fingerprints.json')
+        write_dedup.reset()
+
+    def tearDown(self):
+        write_dedup.cache_file = self.cache_file
+        write_dedup.reset()
+        self.directory.cleanup()
+
+    def test_fingerprint(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: dict
+            expected_equal: bool
+
+        item = {'build_number': '10.07.00.000000', 'jira_id': 'XHFW-1018', 'developers': ['Weston Boyd'],
+                'commits': {'8a6f24a21', '8a6f24a51'}, 'pagination': {'total_pages': Decimal('2.0')}}
+        testcases = [
+            TestCase(name='attribute order', input=dict(reversed(list(item.items()))), expected_equal=True),
+            TestCase(name='set order', input=dict(item, commits={'8a6f24a51', '8a6f24a21'}), expected_equal=True),
+            TestCase(name='own hash ignored', input=dict(item, content_hash='0' * 64), expected_equal=True),
+            TestCase(name='number scale', input=dict(item, pagination={'total_pages': Decimal('2')}),
+                     expected_equal=True),
+            TestCase(name='list order', input=dict(item, developers=['Thomas Lea', 'Weston Boyd']),
+                     expected_equal=False),
+            TestCase(name='new commit', input=dict(item, commits={'8a6f24a21'}), expected_equal=False),
+        ]
+
+        for case in testcases:
+            actual = write_dedup.fingerprint(case.input) == write_dedup.fingerprint(item)
+            self.assertEqual(case.expected_equal, actual,
+                             f'failed test {case.name} expected {case.expected_equal}, actual {actual}')
+
+    def test_find_unchanged(self):
+        key_attributes = ['build_number', 'jira_id']
+        payload = [{'build_number': '10.07.00.000000', 'jira_id': f'XHFW-{number}', 'git_logs': [number]}
+                   for number in range(3)]
+
+        self.assertEqual(set(), write_dedup.find_unchanged('Table', payload, key_attributes))
+        self.assertEqual(64, len(payload[0]['content_hash']))
+        write_dedup.record('Table', payload[:2], key_attributes)
+
+        # a later run reads the saved cache
+        write_dedup.reset()
+        rerun = [dict(item, content_hash='') for item in payload]
+        rerun[1]['git_logs'] = [1, 4]
+        self.assertEqual({0}, write_dedup.find_unchanged('Table', rerun, key_attributes))
+        self.assertEqual(set(), write_dedup.find_unchanged('Other_Table', rerun, key_attributes))
+
+        write_dedup.forget('Table')
+        self.assertEqual(set(), write_dedup.find_unchanged('Table', rerun, key_attributes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import threading
+import time
+import unittest
+import warnings
+from dataclasses import dataclass
+from unittest import mock
+from botocore.exceptions import ClientError
+from moto import mock_dynamodb2
+import aws_session
+import execution_history_table
+import update_execution_history
+import write_scheduler
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeDynamoDB:
+    """batch_write_item answering with the given exceptions or responses in turn"""
+
+    def __init__(self, responses: list):
+        self.responses = responses
+        self.requests = []
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity):
+        self.requests.append(RequestItems)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class TestWriteScheduler(unittest.TestCase):
+
+    table_name = 'Test_Scheduled_Repo_T_Execution_History'
+
+    def setUp(self):
+        warnings.filterwarnings(action='ignore', message='unclosed', category=ResourceWarning)
+        write_scheduler.configure('off', 1.0)
+
+    def tearDown(self):
+        write_scheduler.configure('off', 1.0)
+
+    def test_token_bucket(self):
+        clock = FakeClock()
+        bucket = write_scheduler.TokenBucket(10, burst=1, clock=clock, sleep=clock.sleep)
+
+        # the burst is free, then units are paced at the rate
+        self.assertEqual(0, bucket.acquire(10))
+        self.assertAlmostEqual(0.5, bucket.acquire(5))
+        clock.now += 1
+        self.assertEqual(0, bucket.acquire(10))
+
+        # units reserved but not consumed are credited back
+        self.assertAlmostEqual(0.4, bucket.acquire(4))
+        bucket.settle(4, 1)
+        self.assertAlmostEqual(0, bucket.acquire(3))
+
+    def test_throttled_backs_off_and_recovers(self):
+        clock = FakeClock()
+        bucket = write_scheduler.TokenBucket(8, burst=1, clock=clock, sleep=clock.sleep)
+
+        bucket.throttled()
+        bucket.throttled()
+        self.assertEqual(2, bucket.rate)
+        # the bucket was emptied, so the next unit waits at the reduced rate
+        self.assertAlmostEqual(0.5, bucket.acquire(1))
+        for _ in range(30):
+            bucket.settle(1, 1)
+        self.assertEqual(8, bucket.rate)
+        for _ in range(20):
+            bucket.throttled()
+        self.assertEqual(write_scheduler.min_rate, bucket.rate)
+
+    def test_shared_between_threads(self):
+        bucket = write_scheduler.TokenBucket(100, burst=0.1)
+
+        def write():
+            for _ in range(5):
+                bucket.acquire(1)
+
+        threads = [threading.Thread(target=write) for _ in range(8)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 40 units with 10 in the bucket take at least 30 units / 100 per second
+        self.assertGreaterEqual(time.perf_counter() - start, 0.28)
+
+    def test_table_units(self):
+        @dataclass
+        class TestCase:
+            name: str
+            input: dict
+            expected: float
+
+        testcases = [
+            TestCase(name='indexes', input={'ConsumedCapacity': [{
+                'TableName': 'Table', 'CapacityUnits': 6.0, 'Table': {'CapacityUnits': 2.0},
+                'GlobalSecondaryIndexes': {'jira_id-index': {'CapacityUnits': 4.0}}}]}, expected=2.0),
+            TestCase(name='total', input={'ConsumedCapacity': {'TableName': 'Table', 'CapacityUnits': 3.0}},
+                     expected=3.0),
+            TestCase(name='other table', input={'ConsumedCapacity': [{'TableName': 'Other', 'CapacityUnits': 3.0}]},
+                     expected=0.0),
+            TestCase(name='none', input={}, expected=0.0),
+        ]
+
+        for case in testcases:
+            actual = write_scheduler.table_units(case.input, 'Table')
+            self.assertEqual(case.expected, actual,
+                             f'failed test {case.name} expected {case.expected}, actual {actual}')
+
+    def test_write_batch_throttled(self):
+        write_scheduler.configure('100')
+        payload = [{'build_number': '10.07.00.000000', 'jira_id': f'XHFW-{number}'} for number in range(2)]
+        results = [{'index': index, 'status': 'pending', 'attempts': 0, 'error': ''} for index in range(2)]
+        throttle = ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': ''}},
+                               'BatchWriteItem')
+        dynamodb = FakeDynamoDB([
+            throttle,
+            {'UnprocessedItems': {'Table': [{'PutRequest': {'Item': payload[1]}}]},
+             'ConsumedCapacity': [{'TableName': 'Table', 'CapacityUnits': 1.0}]},
+            {'UnprocessedItems': {}, 'ConsumedCapacity': [{'TableName': 'Table', 'CapacityUnits': 1.0}]}
+        ])
+
+        with mock.patch.object(update_execution_history, 'batch_write_backoff_base', 0):
+            update_execution_history.write_batch(dynamodb, 'Table', payload, [0, 1], ['build_number', 'jira_id'],
+                                                 results)
+
+        self.assertEqual(['written', 'written'], [result['status'] for result in results])
+        self.assertEqual(3, len(dynamodb.requests))
+        # halved on the exception, a step up and halved on the unprocessed item, a step up on success
+        step = 100 * write_scheduler.success_increase
+        self.assertAlmostEqual((100 * 0.5 + step) * 0.5 + step, write_scheduler.snapshot()['Table'], places=5)
+
+    @mock_dynamodb2
+    def test_auto_capacity(self):
+        aws_session.configure(endpoint='')
+        try:
+            execution_history_table.create_table(self.table_name, wait=False)
+            write_scheduler.configure('auto', 0.5)
+            bucket = write_scheduler.get_bucket(self.table_name)
+            write_units = execution_history_table.table_definition(self.table_name)[
+                'ProvisionedThroughput']['WriteCapacityUnits']
+            self.assertEqual(write_units * 0.5, bucket.max_rate)
+
+            sleeps = []
+            bucket.sleep = sleeps.append
+            payload = [{'build_number': '10.07.00.000000', 'jira_id': f'XHFW-{number}', 'summary': 'x' * 1500}
+                       for number in range(3)]
+            report = update_execution_history.update_dynamodb_table(self.table_name, payload, 'put', 'off')
+            self.assertEqual(3, report['succeeded'])
+            # 3 items of 2 units each from a bucket holding at most max(1, rate * burst) units
+            self.assertEqual(1, len(sleeps))
+            self.assertGreater(sleeps[0], 0)
+        finally:
+            aws_session.reset()
+
+    def test_off(self):
+        self.assertIsNone(write_scheduler.get_bucket('Table'))
+        self.assertEqual(0, write_scheduler.acquire('Table', 25))
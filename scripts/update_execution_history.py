@@ -1,11 +1,32 @@
+import os
 import sys
-import json
+import argparse
+import copy
+import fcntl
 import subprocess
 import re
-from typing import List
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
 from botocore import endpoint
+from botocore.exceptions import ClientError
+import aws_session
+import branch_details_cache
+import component_index
+import execution_history_table
+import export_sink
+import git_backend
+import metrics
+import pipeline
+import write_dedup
+import write_scheduler
+# shared with the readers of the table; kept importable from here for existing callers
+from execution_history_table import ExecutionHistoryError, decompress_filenames
 
 repo_t_tables = [
     {
@@ -15,87 +36,307 @@ repo_t_tables = [
     },
     {
         'table_name': 'Repo_T_Execution_History',
-        'p_key': 'build_number'
+        'p_key': 'build_number',
+        's_key': 'jira_id'
     }
 ]
 
 git_time_period = "24 hours ago"
-xhfw_repo = "core"
-format = '\'{"commit": "%h", "date": "%ad", "summary": "%s", "author": {"name": "%an", "email": "%aE"}}\''
+# jira ids in commit summaries, eg. "XHFW-1018 : summary" or "XHFW-1565, XHFW-1566: summary"
+jira_id_pattern = re.compile(r'([a-zA-Z]+-\d+)\W')
 
+# persistent bare blobless partial clone shared by runs and branches, updated by incremental fetches
+repo_cache_dir = os.environ.get('REPO_T_REPO_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'repo_t'))
+xhfw_repo = os.path.join(repo_cache_dir, 'core')
+# optional --shallow-since limit for clone/fetch, eg. "1 week ago"; None keeps full commit history
+shallow_since = None
+# branch details attribute holding the last commit harvested for the branch (high-water mark)
+watermark_attribute = 'last_processed_commit'
+# JSON map of path prefixes to package/component (see component_index); None leaves them empty
+component_map_file = os.environ.get('REPO_T_COMPONENT_MAP') or None
+# git_backend implementation used to read history: 'subprocess' or 'cat-file'
+git_backend_name = os.environ.get('REPO_T_GIT_BACKEND', 'subprocess')
 
-def parse_git_logs(branch_name: str) -> str:
-    """Checks for new git commits in last 24 hours for given branch and developer(s). 
-       Formats and uploads payload to Repo_T Execution History table."""
+# dynamodb BatchWriteItem limits and retry policy for unprocessed items / throttling
+batch_write_size = 25
+batch_write_max_attempts = 8
+batch_write_backoff_base = 0.05
+batch_write_backoff_cap = 5.0
+retryable_error_codes = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError'
+)
 
-    cpe_branch_details = get_item_from_dynamodb(repo_t_tables[0]['table_name'], 
-                                                repo_t_tables[0]['p_key'], 
-                                                branch_name)
+# dynamodb caps items at 400 KB; items are paginated below this budget to leave headroom
+max_item_bytes = 350 * 1024
+# zlib-compress git log file lists: 'never', 'oversized' (only items over max_item_bytes) or 'always'
+compress_filenames = os.environ.get('REPO_T_COMPRESS_FILENAMES', 'oversized')
+# page suffix for execution history items split across pages, eg. XHFW-1018#2 for the second page
+page_separator = execution_history_table.page_separator
+# upserted items keep their approximate size here; appends spill into the next page past max_item_bytes
+size_attribute = 'item_bytes'
 
-    payload = build_dynamodb_payload(cpe_branch_details)
+# 'put' overwrites whole items with BatchWriteItem; 'upsert' merges new commits into existing items
+# with UpdateItem (list_append git_logs, string sets of developers and commit shas). Branches with a
+# watermark always upsert, since their runs only harvest the commits after it.
+write_mode = os.environ.get('REPO_T_WRITE_MODE', 'put')
+# new git logs merged per UpdateItem call, keeping the per-commit condition expression within limits
+upsert_chunk_size = 50
 
-    # upload execution history payload to dynamodb table
-    response = update_dynamodb_table(repo_t_tables[1]['table_name'], payload)
+# skip writing items whose content hash is unchanged: 'off', 'cache' (local fingerprint cache) or 'check'
+# (the cache, then the stored hashes via BatchGetItem)
+dedup_writes = os.environ.get('REPO_T_DEDUP_WRITES', 'off')
+
+# export_sink.ShardWriter receiving payloads as DynamoDB import shards instead of the table (--export);
+# exporting runs leave the watermark where it is
+export_writer = None
+
+# stream harvested commits through concurrent enrich/group/write stages instead of running them in turn.
+# Groups are flushed every pipeline_flush_size commits and merged into stored items, so pipeline runs
+# always write in 'upsert' mode. Exports cannot merge, so exporting runs build one payload per branch.
+pipeline_mode = os.environ.get('REPO_T_PIPELINE', '') == '1'
+pipeline_flush_size = 200
+
+# dynamodb BatchGetItem key limit and default worker count for multi-branch runs
+batch_get_size = 100
+branch_workers = 8
+
+# serializes clone/fetch of the repo cache between branch workers; the file lock covers other processes
+repo_lock = threading.Lock()
+# key attribute names by table name; a table's key schema never changes, so it is described once
+key_attributes_cache = {}
+
+
+def parse_git_logs(branch_name: str, cpe_branch_details: dict = None, fetch: bool = True) -> dict:
+    """Checks for new git commits for the given branch and developer(s) between the branch watermark
+       (last_processed_commit, or the last 24 hours when there is none) and the branch head.
+       Formats and uploads payload to Repo_T Execution History table. fetch=False skips updating
+       the repo cache when the caller already fetched the branch."""
+
+    if cpe_branch_details is None:
+        cpe_branch_details = get_branch_details([branch_name]).get(branch_name)
+        if cpe_branch_details is None:
+            raise ExecutionHistoryError(f'error: {branch_name} not found in table. Check value.')
+
+    # clone gerrit repo and harvest commits since the branch watermark
+    if fetch:
+        clone_repo(cpe_branch_details)
+    if pipeline_mode and export_writer is None:
+        response, head_commit = stream_git_logs(cpe_branch_details)
+    else:
+        git_log_list, head_commit = harvest_git_logs(cpe_branch_details)
+
+        payload = build_db_item(git_log_list, cpe_branch_details) if git_log_list else []
+
+        # upload execution history payload, plus the records backing the developer index, to dynamodb table.
+        # Past the watermark only new commits are harvested, and putting them would replace the commits
+        # earlier runs stored on the same items, so those runs merge.
+        payload += execution_history_table.build_index_records(payload)
+        mode = 'upsert' if cpe_branch_details.get(watermark_attribute) else None
+        response = write_payload(repo_t_tables[1]['table_name'], payload, mode)
+
+    # only advance the watermark once every item is written so failed commits are retried next run
+    if response['failed'] == 0 and export_writer is None:
+        update_watermark(cpe_branch_details, head_commit)
     
     return response
 
 
+def parse_branches(branch_names: list = None, workers: int = branch_workers) -> Dict[str, dict]:
+    """Runs parse_git_logs for many branches (all rows in the branch details table when none given)
+       on a bounded worker pool. Returns a report per branch; one branch failing does not stop the others."""
+
+    branch_details = get_branch_details(branch_names)
+    if not branch_names:
+        branch_names = list(branch_details)
+    fetched = fetch_branches([branch_details[branch_name] for branch_name in branch_names
+                              if branch_name in branch_details])
+
+    def parse_branch(branch_name: str) -> dict:
+        if branch_name not in branch_details:
+            return failed_report(f'error: {branch_name} not found in table. Check value.')
+        try:
+            with metrics.profile_thread():
+                return parse_git_logs(branch_name, branch_details[branch_name], branch_name not in fetched)
+        except Exception as e:
+            return failed_report(f'error processing branch {branch_name}: {e}')
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        reports = executor.map(parse_branch, branch_names)
+        return dict(zip(branch_names, reports))
+
+
+def get_branch_details(branch_names: list = None) -> Dict[str, dict]:
+    """Returns branch details by branch name through the branch details cache. Uncached branches are 
+       fetched together with BatchGetItem; with no names every row is scanned and cached."""
+
+    table_name = repo_t_tables[0]['table_name']
+    primary_key = repo_t_tables[0]['p_key']
+    if not branch_names:
+        branch_details = {item[primary_key]: item for item in scan_dynamodb_table(table_name)}
+        branch_details_cache.put_many(table_name, branch_details)
+        return branch_details
+
+    return branch_details_cache.get_many(
+        table_name, branch_names, lambda keys: get_items_from_dynamodb(table_name, primary_key, keys))
+
+
+def failed_report(message: str) -> dict:
+    """Returns an update_dynamodb_table style report for a branch that failed before writing"""
+
+    return {'table_name': repo_t_tables[1]['table_name'], 'message': message, 'succeeded': 0, 'failed': 0,
+            'items': [], 'error': True}
+
+
+@metrics.timed('get_item_from_dynamodb')
 def get_item_from_dynamodb(table_name: str, primary_key: str, pkey_value: str):
     """Returns value for a given dynamodb item attribute"""
 
     try:
-        dynamo_db = boto3.resource('dynamodb', region_name='us-east-2') 
+        dynamo_db = aws_session.get_resource('dynamodb') 
         table = dynamo_db.Table(table_name)
 
         response = table.get_item(
             Key={
                 primary_key: pkey_value
-            }
+            },
+            ReturnConsumedCapacity='TOTAL'
         )
-        try:
-            response = response['Item']
-        except KeyError:
-            print(f'error: {pkey_value} not found in table. Check value.')
-            exit(1)
+        record_consumed_capacity(response, 'dynamodb_read_capacity_units')
     except Exception as e:
-        print(f'error fetching data from dynamodb: {e}')
-        exit(1)
+        raise ExecutionHistoryError(f'error fetching data from dynamodb: {e}') from e
+
+    try:
+        response = response['Item']
+    except KeyError:
+        raise ExecutionHistoryError(f'error: {pkey_value} not found in table. Check value.')
 
     return response
 
 
+@metrics.timed('get_items_from_dynamodb')
+def get_items_from_dynamodb(table_name: str, primary_key: str, pkey_values: list) -> Dict[str, dict]:
+    """Returns items for many primary key values using BatchGetItem, keyed by primary key value. 
+       Missing keys are left out of the result."""
+
+    dynamo_db = aws_session.get_resource('dynamodb')
+    items = {}
+    pkey_values = list(dict.fromkeys(pkey_values))
+    try:
+        for start in range(0, len(pkey_values), batch_get_size):
+            request = {table_name: {
+                'Keys': [{primary_key: pkey_value} for pkey_value in pkey_values[start:start + batch_get_size]],
+                'ConsistentRead': True
+            }}
+            for attempt in range(batch_write_max_attempts):
+                if attempt > 0:
+                    time.sleep(backoff_delay(attempt))
+                response = dynamo_db.batch_get_item(RequestItems=request, ReturnConsumedCapacity='TOTAL')
+                record_consumed_capacity(response, 'dynamodb_read_capacity_units')
+                for item in response['Responses'].get(table_name, []):
+                    items[item[primary_key]] = item
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+            else:
+                raise ExecutionHistoryError(f'unprocessed keys remain after {batch_write_max_attempts} attempts')
+    except ExecutionHistoryError:
+        raise
+    except Exception as e:
+        raise ExecutionHistoryError(f'error fetching data from dynamodb: {e}') from e
+
+    return items
+
+
+def scan_dynamodb_table(table_name: str) -> list:
+    """Returns every item in a dynamodb table"""
+
+    table = aws_session.get_resource('dynamodb').Table(table_name)
+    try:
+        response = table.scan(ConsistentRead=True)
+        items = response['Items']
+        while 'LastEvaluatedKey' in response:
+            response = table.scan(ConsistentRead=True, ExclusiveStartKey=response['LastEvaluatedKey'])
+            items.extend(response['Items'])
+    except Exception as e:
+        raise ExecutionHistoryError(f'error fetching data from dynamodb: {e}') from e
+
+    return items
+
+
+@metrics.timed('format_git_log')
 def format_git_log(git_log: dict) -> dict:
     """Adds additional attributes to git log before updating dynamodb table item"""
 
-    # add risk to log
-    risk_line = ''
+    # add risk to log from the commit body captured during harvesting
+    git_log['risk'] = get_risk(git_log.pop('body', ''))
+
+    # changed files are captured during harvesting
+    git_log['filenames'] = git_log.get('filenames', [])
+
+    # add package owning most of the changed files
+    index = get_component_index()
+    git_log['package'] = index.package(git_log['filenames']) if index else ''
+
+    return git_log
 
-    process = subprocess.run(
-        [f'cd {xhfw_repo}/ && git show --format="%b" --name-only {git_log["commit"]} && cd ..'],
-        shell=True, capture_output=True, text=True)
-    git_lines = process.stdout.splitlines()
 
-    for item in git_lines:
+def get_component_index():
+    """Returns the compiled component map, or None when no map is configured"""
+
+    if not component_map_file:
+        return None
+    try:
+        return component_index.load(component_map_file)
+    except (OSError, ValueError) as e:
+        raise ExecutionHistoryError(f'error loading component map {component_map_file}: {e}') from e
+
+
+def get_risk(body: str) -> str:
+    """Returns value of the last 'Risks:' line in a commit body"""
+
+    risk_line = ''
+    for item in body.splitlines():
         if re.search(r'[Rr]isks:', item):
             risk_line = item
 
-    git_log['risk'] = regex_search(r':\s(.+)', risk_line)
-      
-    # capture changed files and add to log
-    git_log['filenames'] = get_filenames(git_log['commit'])
+    return regex_search(r':\s(.+)', risk_line)
 
-    # add package
-    git_log['package'] = ''
 
-    return git_log
+@metrics.timed('build_db_item')
+def build_db_item(git_logs_list: list, cpe_branch_details: dict, project_keys: list = None) -> list:
+    """Returns payload for dynamodb with one item per jira id, grouping git logs in a single pass. 
+       project_keys (or cpe_branch_details['jira_projects']) limits which jira projects are recognized."""
 
+    if project_keys is None:
+        project_keys = cpe_branch_details.get('jira_projects')
+    project_keys = {project_key.upper() for project_key in project_keys} if project_keys else None
 
-def build_db_item(git_logs_list: list, cpe_branch_details: dict) -> list:
-    """Returns payload for dynamodb"""
+    index = get_component_index()
+    db_items = {}
+    for git_log in git_logs_list:
+        jira_id = get_jira_id(git_log['summary'], project_keys)
+        db_item = db_items.get(jira_id)
+        if db_item is None:
+            db_item = db_items[jira_id] = new_db_item(cpe_branch_details, jira_id)
+        db_item['git_logs'].append(copy.deepcopy(git_log))
+        if git_log['author']['name'] not in db_item['developers']:
+            db_item['developers'].append(git_log['author']['name'])
+        if index:
+            for component in index.components(git_log['filenames']):
+                if component not in db_item['components']:
+                    db_item['components'].append(component)
 
-    payload = []
-    jira_ids = []
-    db_item = {
+    metrics.increment('db_items_built', len(db_items))
+    return paginate_db_items(list(db_items.values()))
+
+
+def new_db_item(cpe_branch_details: dict, jira_id: str) -> dict:
+    """Returns an execution history item for a jira id that shares no nested structures with other items"""
+
+    return {
         'branch_name': cpe_branch_details['gerrit_branch_name'],
         'build_number': cpe_branch_details['build_version'],
         'components': [],
@@ -112,41 +353,128 @@ def build_db_item(git_logs_list: list, cpe_branch_details: dict) -> list:
             'failed_test_cases': '',
             'passed_test_cases': '',
             'unexecuted_test_cases': ''
-        }
+        },
+        'jira_id': jira_id,
+        'git_logs': [],
+        'developers': []
     }
 
-    # create list of unique jira_id's from git logs
-    for git_log in git_logs_list:
-        jira_id = regex_search(r'([a-zA-Z]+-\d+)\W', git_log['summary']).upper()
-        jira_ids.append(jira_id)
-
-    jira_ids = list(dict.fromkeys(jira_ids))
-
-    for jira_id in jira_ids:
-        matched_logs = []
-        developers = []
-        db_item['jira_id'] = jira_id
-        for git_log in git_logs_list:
-            git_log_jira_id = regex_search(r'([a-zA-Z]+-\d+)\W', git_log['summary']).upper()
-            if jira_id == git_log_jira_id:
-                git_log_copy = git_log.copy()
-                matched_logs.append(git_log_copy)
-                developers.append(git_log['author']['name'])
-        db_item['git_logs'] = matched_logs
-        db_item['developers'] = list(dict.fromkeys(developers))
-        db_item_copy = db_item.copy()
-        payload.append(db_item_copy)
 
-    return payload
+def paginate_db_items(payload: list, max_bytes: int = None, compression: str = None) -> list:
+    """Splits items larger than max_bytes across pages of git logs using the pagination block. 
+       File lists are zlib-compressed first, per the compression mode. Items that fit are left as built."""
+
+    max_bytes = max_bytes or max_item_bytes
+    compression = compression or compress_filenames
+    paginated = []
+    for db_item in payload:
+        if compression == 'always':
+            compress_git_logs(db_item)
+        size = item_size(db_item)
+        metrics.increment('db_item_bytes', size)
+        if size <= max_bytes:
+            paginated.append(db_item)
+            continue
+        if compression == 'oversized':
+            compress_git_logs(db_item)
+            if item_size(db_item) <= max_bytes:
+                paginated.append(db_item)
+                continue
+
+        pages = split_git_logs(db_item, max_bytes)
+        metrics.increment('db_items_paginated')
+        for page_number, git_logs in enumerate(pages, start=1):
+            page = copy.deepcopy({key: value for key, value in db_item.items() if key != 'git_logs'})
+            if page_number > 1:
+                page['jira_id'] = f'{db_item["jira_id"]}{page_separator}{page_number}'
+            page['git_logs'] = git_logs
+            page['developers'] = list(dict.fromkeys(git_log['author']['name'] for git_log in git_logs))
+            page['pagination'].update({'current_page': page_number, 'page_size': len(git_logs),
+                                       'total_pages': len(pages)})
+            paginated.append(page)
+
+    return paginated
+
+
+def split_git_logs(db_item: dict, max_bytes: int) -> List[list]:
+    """Groups an item's git logs into pages that each fit in max_bytes alongside the item's other attributes. 
+       A single log too large for any page has its file list truncated."""
+
+    base_size = item_size({key: value for key, value in db_item.items() if key != 'git_logs'}) + 64
+    budget = max_bytes - base_size
+    pages = [[]]
+    page_bytes = 0
+    for git_log in db_item['git_logs']:
+        log_size = item_size({'git_log': git_log})
+        if log_size > budget:
+            truncate_filenames(git_log, budget)
+            log_size = item_size({'git_log': git_log})
+        if pages[-1] and page_bytes + log_size > budget:
+            pages.append([])
+            page_bytes = 0
+        pages[-1].append(git_log)
+        page_bytes += log_size
+
+    return pages
+
+
+def truncate_filenames(git_log: dict, budget: int):
+    """Drops trailing file names until the git log fits in budget bytes, flagging the log as truncated"""
+
+    git_log['filenames_truncated'] = True
+    filenames = decompress_filenames(git_log)
+    compressed = 'filenames_zlib' in git_log
+    while filenames and item_size({'git_log': git_log}) > budget:
+        filenames = filenames[:len(filenames) // 2]
+        if compressed:
+            git_log['filenames_zlib'] = zlib.compress('\n'.join(filenames).encode())
+        else:
+            git_log['filenames'] = filenames
+
+
+def compress_git_logs(db_item: dict):
+    """Replaces each git log's filenames list with a zlib-compressed, newline separated filenames_zlib binary"""
+
+    for git_log in db_item['git_logs']:
+        if 'filenames' in git_log:
+            git_log['filenames_zlib'] = zlib.compress('\n'.join(git_log.pop('filenames')).encode())
+
+
+def item_size(value) -> int:
+    """Returns the approximate dynamodb size in bytes of an item or attribute value: utf-8 lengths of 
+       names and strings, raw binary length, numbers by significant digits and 3 bytes per list/map."""
+
+    if isinstance(value, dict):
+        return 3 + sum(len(str(key).encode()) + item_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 3 + sum(item_size(item) + 1 for item in value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, 'value') and isinstance(value.value, (bytes, bytearray)):
+        return len(value.value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    return len(str(value).strip('-').replace('.', '').lstrip('0')) // 2 + 2
+
+
+def get_jira_id(summary: str, project_keys: set = None) -> str:
+    """Returns the jira id(s) referenced by a commit summary, joined with '_' when there are several. 
+       Ids outside project_keys are ignored; returns 'NONE' when no id is found."""
+
+    jira_ids = [jira_id.upper() for jira_id in jira_id_pattern.findall(summary)]
+    if project_keys is not None:
+        jira_ids = [jira_id for jira_id in jira_ids if jira_id.split('-', 1)[0] in project_keys]
+
+    return execution_history_table.jira_id_separator.join(jira_ids) if jira_ids else 'NONE'
 
 
 def get_filenames(commit: str) -> list:
     """Returns list of changed files in git commit"""
 
-    process = subprocess.run(
-        [f'cd {xhfw_repo}/ && git show --pretty="format:" --name-only {commit}'], 
-        shell=True, capture_output=True, text=True)
-    filenames = process.stdout.splitlines()
+    with git_backend.get_backend(git_backend_name, xhfw_repo) as backend:
+        filenames = backend.list_changed_files(commit)
     return filenames
 
 
@@ -163,35 +491,16 @@ def regex_search(regex: str, output: str) -> str:
         return 'NONE'
 
 
+@metrics.timed('build_dynamodb_payload')
 def build_dynamodb_payload(cpe_branch_details: dict) -> list:
     """Builds formatted dynamodb table payload"""
 
-    git_log_list = []
     payload = []
 
     # clone gerrit repo
     clone_repo(cpe_branch_details)
 
-    for developer in cpe_branch_details['developers']:
-        # capture git commits 24 hours ago for given developer and branch
-        process = subprocess.run(
-            [f'cd {xhfw_repo}/ && git log \
-            --author="{developer}" \
-            --since="{git_time_period}" \
-            --format={format} && cd ..'],
-            shell=True, capture_output=True, text=True
-        )
-
-        git_logs = process.stdout.splitlines()
-                
-        print(f'Retrieved {len(git_logs)} commits for {developer} ' 
-              f'on branch {cpe_branch_details["gerrit_branch_name"]} since {git_time_period}.')
-
-        # build git log list for payload['git_logs']
-        if len(git_logs) > 0:
-            for git_log in git_logs:               
-                formatted_git_log = format_git_log(json.loads(git_log))
-                git_log_list.append(formatted_git_log)
+    git_log_list, _ = harvest_git_logs(cpe_branch_details)
 
     # return empty payload if no new logs retrieved
     if len(git_log_list) < 1:
@@ -202,59 +511,999 @@ def build_dynamodb_payload(cpe_branch_details: dict) -> list:
     return payload
 
 
-def update_dynamodb_table(table_name: str, payload: list) -> str:
-    """Adds new item to dynamodb table."""
+@metrics.timed('harvest_git_logs')
+def harvest_git_logs(cpe_branch_details: dict, revision_range: list = None) -> Tuple[list, str]:
+    """Returns formatted git logs for the branch developers committed after the branch watermark, 
+       or in the given git log revision range, and the branch head commit they were harvested up to"""
+
+    git_log_list = []
+    branch_name = cpe_branch_details['gerrit_branch_name']
+    developers = cpe_branch_details['developers']
+    developer_index = build_developer_index(developers, cpe_branch_details.get('developer_aliases', {}))
+    developer_logs = {developer: [] for developer in developers}
+
+    with git_backend.get_backend(git_backend_name, xhfw_repo) as backend:
+        head_commit = get_head_commit(remote_branch_ref(branch_name), backend)
+        if revision_range is None:
+            revision_range, description = get_revision_range(head_commit,
+                                                             cpe_branch_details.get(watermark_attribute), backend)
+        else:
+            description = f'in {" ".join(revision_range)}'
+
+        # capture git commits, with bodies and changed files, for all developers in a single pass over
+        # the branch history. The head commit is named explicitly so other branch workers can check out
+        # the shared tree meanwhile.
+        try:
+            for git_log in backend.list_commits(revision_range):
+                metrics.increment('git_commits_scanned')
+                developer = match_developer(git_log, developer_index)
+                if developer is not None:
+                    developer_logs[developer].append(git_log)
+        except git_backend.GitError as e:
+            raise ExecutionHistoryError(f'error reading history of {branch_name}: {e}') from e
+
+    for developer in developers:
+        git_logs = developer_logs[developer]
+
+        print(f'Retrieved {len(git_logs)} commits for {developer} ' 
+              f'on branch {branch_name} {description}.')
+
+        # build git log list for payload['git_logs']
+        for git_log in git_logs:
+            formatted_git_log = format_git_log(git_log)
+            git_log_list.append(formatted_git_log)
+
+    metrics.increment('git_commits_harvested', len(git_log_list))
+    return git_log_list, head_commit
+
+
+@metrics.timed('stream_git_logs')
+def stream_git_logs(cpe_branch_details: dict) -> Tuple[dict, str]:
+    """Harvests, formats, groups and writes the branch's new commits as a pipeline: each stage runs in 
+       its own thread, handing work on through bounded queues, so git and dynamodb are busy at the same 
+       time. Returns the merged write report and the head commit harvested up to."""
+
+    table_name = repo_t_tables[1]['table_name']
+    branch_name = cpe_branch_details['gerrit_branch_name']
+    developers = cpe_branch_details['developers']
+    developer_index = build_developer_index(developers, cpe_branch_details.get('developer_aliases', {}))
+    commit_counts = {developer: 0 for developer in developers}
+
+    def harvest(revision_range: list):
+        for git_log in backend.list_commits(revision_range):
+            metrics.increment('git_commits_scanned')
+            developer = match_developer(git_log, developer_index)
+            if developer is not None:
+                commit_counts[developer] += 1
+                yield git_log
+
+    def enrich(git_logs):
+        for git_log in git_logs:
+            yield format_git_log(git_log)
+
+    def group(git_logs):
+        chunk = []
+        for git_log in git_logs:
+            chunk.append(git_log)
+            if len(chunk) == pipeline_flush_size:
+                yield build_db_item(chunk, cpe_branch_details)
+                chunk = []
+        if chunk:
+            yield build_db_item(chunk, cpe_branch_details)
+
+    report = update_dynamodb_table(table_name, [])
+    with git_backend.get_backend(git_backend_name, xhfw_repo) as backend:
+        head_commit = get_head_commit(remote_branch_ref(branch_name), backend)
+        revision_range, description = get_revision_range(head_commit, cpe_branch_details.get(watermark_attribute),
+                                                         backend)
+
+        stages = [('enrich', enrich), ('group', group)]
+        try:
+            for payload in pipeline.run(harvest(revision_range), stages):
+                payload += execution_history_table.build_index_records(payload)
+                merge_reports(report, write_payload(table_name, payload, 'upsert'))
+        except git_backend.GitError as e:
+            raise ExecutionHistoryError(f'error reading history of {branch_name}: {e}') from e
+
+    for developer in developers:
+        print(f'Retrieved {commit_counts[developer]} commits for {developer} '
+              f'on branch {branch_name} {description}.')
+
+    metrics.increment('git_commits_harvested', sum(commit_counts.values()))
+    return report, head_commit
+
+
+def merge_reports(report: dict, chunk_report: dict):
+    """Adds the item results of a later update_dynamodb_table call to report"""
+
+    offset = len(report['items'])
+    for result in chunk_report['items']:
+        report['items'].append(dict(result, index=result['index'] + offset))
+    report['succeeded'] += chunk_report['succeeded']
+    report['failed'] += chunk_report['failed']
+    report['unchanged'] += chunk_report['unchanged']
+    if report['failed'] == 0:
+        report['message'] = (f'Successfully merged {report["succeeded"]} item(s) into '
+                             f'{report["table_name"]} table.')
+    else:
+        report['message'] = (f'error updating dynamadb: {report["failed"]} of {len(report["items"])} item(s) '
+                             f'failed to write to {report["table_name"]} table.')
+    if report['unchanged']:
+        report['message'] += f' {report["unchanged"]} unchanged item(s) were not rewritten.'
+
+
+def get_head_commit(branch_name: str, backend: git_backend.GitBackend = None) -> str:
+    """Returns full sha of the branch head"""
+
+    try:
+        if backend is not None:
+            return backend.resolve_commit(branch_name)
+        with git_backend.get_backend(git_backend_name, xhfw_repo) as backend:
+            return backend.resolve_commit(branch_name)
+    except git_backend.GitError as e:
+        raise ExecutionHistoryError(f'error resolving branch {branch_name}: {e}') from e
+
+
+def get_revision_range(head_commit: str, last_commit: str = None,
+                       backend: git_backend.GitBackend = None) -> Tuple[list, str]:
+    """Returns git log revision arguments for commits after the watermark and a description for logging. 
+       Falls back to the fixed time window when there is no watermark or history was rewritten."""
+
+    if last_commit:
+        backend = backend or git_backend.SubprocessGitBackend(xhfw_repo)
+        if backend.is_ancestor(last_commit, head_commit):
+            return [f'{last_commit}..{head_commit}'], f'since commit {last_commit[:9]}'
+        print(f'warning: last processed commit {last_commit} is not in the history of {head_commit}, '
+              f'falling back to commits since {git_time_period}.')
+
+    return [head_commit, '--since', git_time_period], f'since {git_time_period}'
+
+
+def update_watermark(cpe_branch_details: dict, head_commit: str):
+    """Records the harvested head commit on the branch details item. The write is conditional on the 
+       watermark read at the start of the run so a concurrent run that got further is not rewound."""
+
+    previous_commit = cpe_branch_details.get(watermark_attribute)
+    if previous_commit == head_commit:
+        return
+
+    if previous_commit:
+        condition = Attr(watermark_attribute).eq(previous_commit)
+    else:
+        condition = Attr(watermark_attribute).not_exists()
+
+    table_name = repo_t_tables[0]['table_name']
+    branch_name = cpe_branch_details['gerrit_branch_name']
+    table = aws_session.get_resource('dynamodb').Table(table_name)
+    try:
+        table.update_item(
+            Key={repo_t_tables[0]['p_key']: branch_name},
+            UpdateExpression='SET #watermark = :head_commit',
+            ConditionExpression=condition,
+            ExpressionAttributeNames={'#watermark': watermark_attribute},
+            ExpressionAttributeValues={':head_commit': head_commit}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise ExecutionHistoryError(f'error updating watermark: {e}') from e
+        # the cached watermark is stale; the next run re-reads it
+        branch_details_cache.invalidate(table_name, branch_name)
+        print(f'warning: watermark for {branch_name} was updated by another run.')
+        return
+
+    # the watermark moves every run, so it is written through rather than left to expire
+    branch_details_cache.update(table_name, branch_name, {watermark_attribute: head_commit})
+
+
+def build_developer_index(developers: list, aliases: dict = None) -> Dict[str, str]:
+    """Returns lookup of lowercased developer name/email/alias to configured developer"""
+
+    developer_index = {developer.strip().lower(): developer for developer in developers}
+    for alias, developer in (aliases or {}).items():
+        if developer in developers:
+            developer_index[alias.strip().lower()] = developer
+
+    return developer_index
+
+
+def match_developer(git_log: dict, developer_index: Dict[str, str]):
+    """Returns configured developer for git log author by name or email, None if not tracked"""
+
+    for key in (git_log['author']['name'], git_log['author']['email']):
+        developer = developer_index.get(key.strip().lower())
+        if developer is not None:
+            return developer
+
+    return None
+
+
+def write_payload(table_name: str, payload: list, mode: str = None) -> dict:
+    """Writes payload to the table, or to the export shards when exporting"""
+
+    if export_writer is None:
+        return update_dynamodb_table(table_name, payload, mode)
+    return export_payload(export_writer, table_name, payload)
+
+
+def export_payload(writer: export_sink.ShardWriter, table_name: str, payload: list) -> dict:
+    """Appends payload to export shards. Returns an update_dynamodb_table style report."""
+
+    report = {'table_name': table_name, 'message': 'Nothing to update', 'succeeded': 0, 'failed': 0,
+              'unchanged': 0, 'items': []}
+    if not payload:
+        return report
+
+    status, error = 'exported', ''
+    try:
+        writer.write(payload)
+        report['succeeded'] = len(payload)
+        report['message'] = f'Exported {len(payload)} item(s) for {table_name} table to {writer.destination}.'
+    except (OSError, export_sink.ExportError) as e:
+        status, error = 'failed', str(e)
+        report['failed'] = len(payload)
+        report['message'] = f'error exporting {len(payload)} item(s) to {writer.destination}: {e}'
+    report['items'] = [{'index': index, 'jira_id': item.get('jira_id', ''), 'status': status, 'attempts': 1,
+                        'error': error} for index, item in enumerate(payload)]
+
+    return report
+
+
+@metrics.timed('update_dynamodb_table')
+def update_dynamodb_table(table_name: str, payload: list, mode: str = None, dedup: str = None) -> dict:
+    """Adds new items to dynamodb table in BatchWriteItem groups, or merges them into existing items 
+       in 'upsert' mode. Items whose content hash shows them unchanged are skipped per the dedup mode.
+       Returns a per-item result report."""
 
+    mode = mode or write_mode
+    dedup = dedup or dedup_writes
+
+    report = {
+        'table_name': table_name,
+        'message': 'Nothing to update',
+        'succeeded': 0,
+        'failed': 0,
+        'unchanged': 0,
+        'items': []
+    }
     if not payload:
-        return 'Nothing to update'
+        return report
 
-    dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
+    results = [{'index': index, 'jira_id': item.get('jira_id', ''), 'status': 'pending', 'attempts': 0, 'error': ''}
+               for index, item in enumerate(payload)]
+
+    dynamodb = aws_session.get_resource('dynamodb')
     try:
         table = dynamodb.Table(table_name)
-        for item in payload:
-            response = table.put_item(
-                Item=item
-            )
-        if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-            return f'Successfully added {len(payload)} item(s) to {table_name} table.'
-        return f"Status Code {response['ResponseMetadata']['HTTPStatusCode']}: error updating dynamadb"
+        key_attributes = table_key_attributes(table)
+        if dedup != 'off':
+            # upserted items hold more than one payload's content, so only the local cache applies
+            for index in write_dedup.find_unchanged(table_name, payload, key_attributes,
+                                                    dedup == 'check' and mode != 'upsert'):
+                results[index]['status'] = 'unchanged'
+        pending = [index for index, result in enumerate(results) if result['status'] == 'pending']
+        if mode == 'upsert':
+            for index in pending:
+                upsert_item(table, payload[index], key_attributes, results[index])
+        else:
+            for batch in batch_payload([payload[index] for index in pending], key_attributes):
+                write_batch(dynamodb, table_name, payload, [pending[number] for number in batch], key_attributes,
+                            results)
+            if key_attributes == [execution_history_table.partition_key, execution_history_table.sort_key]:
+                written = [index for index in pending if results[index]['status'] == 'written']
+                try:
+                    delete_stale_records(dynamodb, table, payload, written)
+                except (ClientError, ExecutionHistoryError) as e:
+                    print(f'warning: stale pages and records of {table_name} were not deleted: {e}')
+        if dedup != 'off':
+            write_dedup.record(table_name, [payload[index] for index in pending
+                                            if results[index]['status'] == 'written'], key_attributes)
     except Exception as e:
-        return f'error updating dynamadb: {e}'
+        for result in results:
+            if result['status'] == 'pending':
+                result['status'] = 'failed'
+                result['error'] = str(e)
+
+    report['items'] = results
+    report['unchanged'] = sum(1 for result in results if result['status'] == 'unchanged')
+    report['succeeded'] = sum(1 for result in results if result['status'] == 'written') + report['unchanged']
+    report['failed'] = len(results) - report['succeeded']
+    metrics.increment('dynamodb_items_written', report['succeeded'] - report['unchanged'])
+    metrics.increment('dynamodb_items_failed', report['failed'])
+    if report['failed'] == 0 and mode == 'upsert':
+        report['message'] = f'Successfully merged {report["succeeded"]} item(s) into {table_name} table.'
+    elif report['failed'] == 0:
+        report['message'] = f'Successfully added {report["succeeded"]} item(s) to {table_name} table.'
+    else:
+        report['message'] = (f'error updating dynamadb: {report["failed"]} of {len(payload)} item(s) '
+                             f'failed to write to {table_name} table.')
+    if report['unchanged']:
+        report['message'] += f' {report["unchanged"]} unchanged item(s) were not rewritten.'
+
+    return report
+
+
+def table_key_attributes(table) -> list:
+    """Returns a table's key attribute names, describing the table on first use only"""
+
+    if table.name not in key_attributes_cache:
+        key_attributes_cache[table.name] = [key['AttributeName'] for key in table.key_schema]
+    return key_attributes_cache[table.name]
+
+
+def upsert_item(table, item: dict, key_attributes: list, result: dict):
+    """Merges an item's git logs into the stored pages of its jira id with UpdateItem. The first page
+       holds the commits set of every page, so a commit is never appended twice: each append is
+       conditional on its shas being absent from that set, and on a conflict the stored shas are read
+       back and only the missing logs are retried. Logs are appended to the last page, which the first
+       page's pagination.total_pages points at; appends to a later page claim their shas on the first
+       page in the same transaction. A page that would grow past max_item_bytes is marked full and the
+       next one started. Payload pages (eg. XHFW-1018#2) are merged like any other logs of the jira id.
+       Developers and components are merged as string sets per page; other attributes are only set
+       when the page does not have them yet. Pages stored by a 'put' are converted to sets first."""
+
+    key = {attribute: item[attribute] for attribute in key_attributes}
+    if 'git_logs' not in item:
+        # records without git logs (eg. developer index records) are small and idempotent
+        result['attempts'] += 1
+        reserved = write_scheduler.acquire(table.name, write_scheduler.write_units(item, item_size))
+        response = table.put_item(Item=item, ReturnConsumedCapacity='INDEXES')
+        write_scheduler.settle(table.name, reserved, response)
+        result['status'] = 'written'
+        return
+
+    first_key = dict(key, jira_id=item['jira_id'].partition(page_separator)[0])
+    attributes = [attribute for attribute in item
+                  if attribute not in key_attributes and
+                  attribute not in ('git_logs', 'developers', 'components', 'pagination', write_dedup.hash_attribute)]
+    base_bytes = item_size({attribute: item[attribute] for attribute in item if attribute != 'git_logs'})
+    git_logs = list(item['git_logs'])
+    page_number = 1
+    attempt = 0
+    converted = False
+
+    while git_logs and attempt < batch_write_max_attempts:
+        chunk = git_logs[:upsert_chunk_size]
+        updates = upsert_updates(item, attributes, chunk, page_number, base_bytes)
+
+        result['attempts'] += 1
+        units = write_scheduler.write_units({'git_logs': chunk}, item_size) * len(updates)
+        reserved = write_scheduler.acquire(table.name, units)
+        try:
+            if len(updates) == 1:
+                response = table.update_item(Key=first_key, ReturnConsumedCapacity='INDEXES', **updates[0])
+            else:
+                # transactions consume two units per write, as reserved
+                page_key = dict(first_key, jira_id=page_id(first_key['jira_id'], page_number))
+                response = table.meta.client.transact_write_items(
+                    TransactItems=[{'Update': dict(updates[0], TableName=table.name, Key=first_key)},
+                                   {'Update': dict(updates[1], TableName=table.name, Key=page_key)}],
+                    ReturnConsumedCapacity='INDEXES')
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            metrics.increment(f'dynamodb_errors_{error_code}')
+            result['error'] = str(e)
+            attempt += 1
+            if error_code not in ('ConditionalCheckFailedException', 'TransactionCanceledException'):
+                if error_code in write_scheduler.throttle_error_codes:
+                    write_scheduler.throttled(table.name)
+                if error_code in retryable_error_codes:
+                    metrics.increment('dynamodb_write_retries')
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                break
+
+            first = read_item(table, first_key, ['commits', 'developers', 'pagination', size_attribute])
+            page_key = dict(first_key, jira_id=page_id(first_key['jira_id'], page_number))
+            page = first if page_number == 1 else read_item(table, page_key, ['developers', size_attribute])
+            if not converted and any(isinstance(stored.get('developers'), list) for stored in (first, page)):
+                # a 'put' wrote the stored pages, with lists where the ADD expects string sets
+                converted = convert_list_attributes(table, first_key)
+                continue
+
+            stored_commits = first.get('commits', set())
+            remaining = [git_log for git_log in git_logs if git_log['commit'] not in stored_commits]
+            metrics.increment('dynamodb_upsert_duplicate_commits', len(git_logs) - len(remaining))
+            last_page = max(1, int(first.get('pagination', {}).get('total_pages', 0)))
+            if last_page > page_number:
+                # another writer started a later page
+                page_number = last_page
+            elif remaining and page.get(size_attribute, 0) + item_size(remaining[:upsert_chunk_size]) > max_item_bytes:
+                spill_page(table, first_key, page_number)
+                page_number += 1
+            elif len(remaining) == len(git_logs):
+                # the transaction was cancelled for a reason other than its conditions, eg. a conflict
+                time.sleep(backoff_delay(attempt))
+                continue
+            git_logs = remaining
+            attempt = 0
+            continue
+
+        write_scheduler.settle(table.name, reserved, response)
+        record_consumed_capacity(response, 'dynamodb_write_capacity_units')
+        metrics.increment('dynamodb_upserts')
+        git_logs = git_logs[len(chunk):]
+        attempt = 0
+
+    if git_logs:
+        result['status'] = 'failed'
+    else:
+        result['status'] = 'written'
+        result['error'] = ''
+
+
+def upsert_updates(item: dict, attributes: list, chunk: list, page_number: int, base_bytes: int) -> List[dict]:
+    """Returns the UpdateItem arguments appending chunk to a page of the item's jira id: one update of the
+       first page, or for a later page the first page's claim on the shas and the page's append"""
+
+    claim = {
+        'add': ['#commits :commits'],
+        'conditions': ['(attribute_not_exists(#developers) OR attribute_type(#developers, :string_set))',
+                       f'(attribute_not_exists(#commits) OR ('
+                       f'{" AND ".join(f"NOT contains(#commits, :c{number})" for number in range(len(chunk)))}))'],
+        'names': {'#commits': 'commits', '#developers': 'developers'},
+        'values': {':commits': {git_log['commit'] for git_log in chunk}, ':string_set': 'SS',
+                   **{f':c{number}': git_log['commit'] for number, git_log in enumerate(chunk)}}
+    }
+    chunk_bytes = item_size(chunk)
+    append = {
+        'set': ['#git_logs = list_append(if_not_exists(#git_logs, :empty_list), :git_logs)',
+                '#item_bytes = if_not_exists(#item_bytes, :base_bytes) + :chunk_bytes'],
+        'add': ['#developers :developers'],
+        'conditions': ['(attribute_not_exists(#developers) OR attribute_type(#developers, :string_set))',
+                       '(attribute_not_exists(#item_bytes) OR #item_bytes <= :max_bytes)'],
+        'names': {'#git_logs': 'git_logs', '#developers': 'developers', '#item_bytes': size_attribute},
+        'values': {':empty_list': [], ':git_logs': chunk, ':string_set': 'SS', ':base_bytes': base_bytes,
+                   ':chunk_bytes': chunk_bytes, ':max_bytes': max_item_bytes - chunk_bytes,
+                   ':developers': {git_log['author']['name'] for git_log in chunk}}
+    }
+    if item.get('components'):
+        append['names']['#components'] = 'components'
+        append['values'][':components'] = set(item['components'])
+        append['add'].append('#components :components')
+    page_attributes = {attribute: item[attribute] for attribute in attributes}
+    if 'pagination' in item:
+        page_attributes['pagination'] = dict(item['pagination'], current_page=page_number, page_size=0,
+                                             total_pages=page_number)
+    for number, (attribute, value) in enumerate(page_attributes.items()):
+        append['names'][f'#a{number}'] = attribute
+        append['values'][f':a{number}'] = value
+        append['set'].append(f'#a{number} = if_not_exists(#a{number}, :a{number})')
+
+    if page_number == 1:
+        for part in ('add', 'names', 'values'):
+            append[part] = append[part] + claim[part] if part == 'add' else dict(append[part], **claim[part])
+        append['conditions'].append(claim['conditions'][1])
+        parts = [append]
+    else:
+        parts = [claim, append]
+
+    return [{'UpdateExpression': ' '.join(f'{clause} {", ".join(part[clause.lower()])}' for clause in ('SET', 'ADD')
+                                          if part.get(clause.lower())),
+             'ConditionExpression': ' AND '.join(part['conditions']),
+             'ExpressionAttributeNames': part['names'],
+             'ExpressionAttributeValues': part['values']} for part in parts]
+
+
+def page_id(jira_id: str, page_number: int) -> str:
+    return f'{jira_id}{page_separator}{page_number}' if page_number > 1 else jira_id
+
+
+def read_item(table, key: dict, attributes: list = None) -> dict:
+    """Returns the stored item, or only the given attributes of it, with a strongly consistent read"""
+
+    kwargs = {'Key': key, 'ConsistentRead': True, 'ReturnConsumedCapacity': 'TOTAL'}
+    if attributes:
+        kwargs['ProjectionExpression'] = ', '.join(f'#p{number}' for number in range(len(attributes)))
+        kwargs['ExpressionAttributeNames'] = {f'#p{number}': attribute for number, attribute in enumerate(attributes)}
+    response = table.get_item(**kwargs)
+    record_consumed_capacity(response, 'dynamodb_read_capacity_units')
+
+    return response.get('Item', {})
+
+
+def update_page(table, key: dict, units: float, **kwargs) -> dict:
+    """Runs an UpdateItem that is not an append, paced and accounted like the appends"""
+
+    reserved = write_scheduler.acquire(table.name, units)
+    response = table.update_item(Key=key, ReturnConsumedCapacity='INDEXES', **kwargs)
+    write_scheduler.settle(table.name, reserved, response)
+    record_consumed_capacity(response, 'dynamodb_write_capacity_units')
+
+    return response
+
+
+def spill_page(table, first_key: dict, page_number: int):
+    """Marks a full page so no later append lands on it, and points the first page's
+       pagination.total_pages at the next page"""
+
+    update_page(table, dict(first_key, jira_id=page_id(first_key['jira_id'], page_number)), 1,
+                UpdateExpression='SET #item_bytes = :max_bytes',
+                ExpressionAttributeNames={'#item_bytes': size_attribute},
+                ExpressionAttributeValues={':max_bytes': max_item_bytes})
+    try:
+        update_page(table, first_key, 1, UpdateExpression='SET #pagination.#total_pages = :total_pages',
+                    ConditionExpression='#pagination.#total_pages < :total_pages',
+                    ExpressionAttributeNames={'#pagination': 'pagination', '#total_pages': 'total_pages'},
+                    ExpressionAttributeValues={':total_pages': page_number + 1})
+    except ClientError as e:
+        # another writer already started the next page
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    metrics.increment('dynamodb_upsert_pages')
+
+
+def convert_list_attributes(table, first_key: dict) -> bool:
+    """Converts the pages of a jira id written in 'put' mode to the 'upsert' layout: developers and
+       components lists become string sets, the shas of every page are added to the first page's commits
+       set and every page but the last is marked full. Returns False when no page had lists to convert."""
+
+    pages = [read_item(table, first_key)]
+    total_pages = int(pages[0].get('pagination', {}).get('total_pages', 0))
+    for page_number in range(2, total_pages + 1):
+        pages.append(read_item(table, dict(first_key, jira_id=page_id(first_key['jira_id'], page_number))))
+
+    converted = False
+    commits = {git_log['commit'] for page in pages for git_log in page.get('git_logs', []) if git_log.get('commit')}
+    for page_number, page in enumerate(pages, start=1):
+        attributes = [attribute for attribute in ('developers', 'components') if isinstance(page.get(attribute), list)]
+        if not attributes:
+            continue
+
+        last_page = page_number == len(pages)
+        names = {'#item_bytes': size_attribute}
+        values = {':list_type': 'L', ':item_bytes': item_size(page) if last_page else max_item_bytes}
+        set_expressions = ['#item_bytes = :item_bytes']
+        remove_expressions = []
+        for attribute in attributes:
+            names[f'#{attribute}'] = attribute
+            if page[attribute]:
+                values[f':{attribute}'] = set(page[attribute])
+                set_expressions.append(f'#{attribute} = :{attribute}')
+            else:
+                # dynamodb has no empty sets; the first ADD creates the attribute
+                remove_expressions.append(f'#{attribute}')
+        update_expression = f'SET {", ".join(set_expressions)}'
+        if remove_expressions:
+            update_expression += f' REMOVE {", ".join(remove_expressions)}'
+        if page_number == 1 and commits:
+            names['#commits'] = 'commits'
+            values[':commits'] = commits
+            update_expression += ' ADD #commits :commits'
+
+        try:
+            update_page(table, {attribute: page[attribute] for attribute in first_key},
+                        write_scheduler.write_units(page, item_size), UpdateExpression=update_expression,
+                        ConditionExpression=' AND '.join(f'attribute_type(#{attribute}, :list_type)'
+                                                         for attribute in attributes),
+                        ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+        except ClientError as e:
+            # another writer converted the page first
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        converted = True
+        metrics.increment('dynamodb_items_converted')
+
+    return converted
+
+
+def batch_payload(payload: list, key_attributes: list) -> List[List[int]]:
+    """Splits payload indexes into BatchWriteItem sized groups without duplicate keys per group. 
+       Items sharing a key land in later groups so the last one written wins, as with put_item."""
+
+    batches = []
+    batch = []
+    batch_keys = set()
+    for index, item in enumerate(payload):
+        key = tuple(item.get(attribute) for attribute in key_attributes)
+        if len(batch) == batch_write_size or key in batch_keys:
+            batches.append(batch)
+            batch = []
+            batch_keys = set()
+        batch.append(index)
+        batch_keys.add(key)
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def write_batch(dynamodb, table_name: str, payload: list, batch: List[int], key_attributes: list,
+                results: List[dict]):
+    """Writes one BatchWriteItem group, re-submitting UnprocessedItems with jittered exponential backoff"""
+
+    pending = list(batch)
+    for attempt in range(batch_write_max_attempts):
+        if attempt > 0:
+            time.sleep(backoff_delay(attempt))
+            metrics.increment('dynamodb_write_retries')
+        for index in pending:
+            results[index]['attempts'] += 1
+
+        metrics.increment('dynamodb_batch_writes')
+        reserved = write_scheduler.acquire(
+            table_name, sum(write_scheduler.write_units(payload[index], item_size) for index in pending))
+        try:
+            response = dynamodb.batch_write_item(
+                RequestItems={table_name: [{'PutRequest': {'Item': payload[index]}} for index in pending]},
+                ReturnConsumedCapacity='INDEXES'
+            )
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            metrics.increment(f'dynamodb_errors_{error_code}')
+            for index in pending:
+                results[index]['error'] = str(e)
+            if error_code in write_scheduler.throttle_error_codes:
+                write_scheduler.throttled(table_name)
+            if error_code in retryable_error_codes:
+                continue
+            break
+
+        write_scheduler.settle(table_name, reserved, response)
+        record_consumed_capacity(response, 'dynamodb_write_capacity_units')
+
+        unprocessed = {tuple(request['PutRequest']['Item'].get(attribute) for attribute in key_attributes)
+                       for request in response.get('UnprocessedItems', {}).get(table_name, [])}
+        still_pending = []
+        for index in pending:
+            if tuple(payload[index].get(attribute) for attribute in key_attributes) in unprocessed:
+                results[index]['error'] = 'unprocessed item'
+                still_pending.append(index)
+            else:
+                results[index]['status'] = 'written'
+                results[index]['error'] = ''
+        pending = still_pending
+        if not pending:
+            return
+        # unprocessed items are DynamoDB shedding load the table cannot absorb
+        write_scheduler.throttled(table_name)
+
+    for index in pending:
+        results[index]['status'] = 'failed'
+
 
+def delete_stale_records(dynamodb, table, payload: list, written: List[int]):
+    """Deletes what items rewritten in 'put' mode left behind: pages past the first page's
+       pagination.total_pages (eg. XHFW-1018#3 when the item now has two pages) and developer records
+       naming developers the items, or those pages, no longer have. A put replaces each page whole,
+       but stored pages beyond the new count and the developer records are separate items."""
 
+    partition_key, sort_key = execution_history_table.partition_key, execution_history_table.sort_key
+    items = [payload[index] for index in written
+             if 'git_logs' in payload[index] and not execution_history_table.is_index_record(payload[index])]
+    item_keys = {(item[partition_key], item[sort_key]) for item in items}
+    expected = {(record[partition_key], record[sort_key])
+                for record in execution_history_table.build_developer_records(items)}
+
+    stale = []
+    stale_pages = set()
+    for item in items:
+        if page_separator in item[sort_key]:
+            continue
+        # items that fit on one page are built with total_pages 0
+        total_pages = max(1, int(item.get('pagination', {}).get('total_pages', 0)))
+        for page in stored_records(table, item[partition_key], f'{item[sort_key]}{page_separator}'):
+            page_number = page[sort_key].rpartition(page_separator)[2]
+            if page_number.isdigit() and int(page_number) > total_pages:
+                stale.append({partition_key: page[partition_key], sort_key: page[sort_key]})
+                stale_pages.add((page[partition_key], page[sort_key]))
+    for build_number, jira_id in sorted({(item[partition_key], item[sort_key].partition(page_separator)[0])
+                                         for item in items}):
+        prefix = f'{execution_history_table.developer_record_prefix}{jira_id}{page_separator}'
+        for record in stored_records(table, build_number, prefix):
+            record_item = (record[partition_key], record['item_jira_id'])
+            if ((record_item in item_keys and (record[partition_key], record[sort_key]) not in expected) or
+                    record_item in stale_pages):
+                stale.append({partition_key: record[partition_key], sort_key: record[sort_key]})
+    delete_items(dynamodb, table.name, stale)
+
+
+def stored_records(table, build_number: str, sort_key_prefix: str):
+    """Yields the keys (and item_jira_id of developer records) of the stored items of a build whose
+       sort key starts with sort_key_prefix"""
+
+    kwargs = {
+        'KeyConditionExpression': Key(execution_history_table.partition_key).eq(build_number) &
+        Key(execution_history_table.sort_key).begins_with(sort_key_prefix),
+        'ProjectionExpression': '#partition_key, #sort_key, item_jira_id',
+        'ExpressionAttributeNames': {'#partition_key': execution_history_table.partition_key,
+                                     '#sort_key': execution_history_table.sort_key},
+        'ReturnConsumedCapacity': 'TOTAL'
+    }
+    while True:
+        response = table.query(**kwargs)
+        record_consumed_capacity(response, 'dynamodb_read_capacity_units')
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def delete_items(dynamodb, table_name: str, keys: List[dict]):
+    """Deletes items in BatchWriteItem groups, re-submitting UnprocessedItems with jittered exponential backoff"""
+
+    for start in range(0, len(keys), batch_write_size):
+        requests = [{'DeleteRequest': {'Key': key}} for key in keys[start:start + batch_write_size]]
+        for attempt in range(batch_write_max_attempts):
+            if attempt > 0:
+                time.sleep(backoff_delay(attempt))
+                metrics.increment('dynamodb_write_retries')
+            reserved = write_scheduler.acquire(table_name, len(requests))
+            response = dynamodb.batch_write_item(RequestItems={table_name: requests}, ReturnConsumedCapacity='INDEXES')
+            write_scheduler.settle(table_name, reserved, response)
+            record_consumed_capacity(response, 'dynamodb_write_capacity_units')
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not requests:
+                break
+            write_scheduler.throttled(table_name)
+        else:
+            raise ExecutionHistoryError(f'unprocessed deletes remain after {batch_write_max_attempts} attempts')
+    metrics.increment('dynamodb_items_deleted', len(keys))
+
+
+def record_consumed_capacity(response: dict, name: str):
+    """Adds the ConsumedCapacity units of a dynamodb response to a counter"""
+
+    consumed_capacity = response.get('ConsumedCapacity', [])
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    metrics.increment(name, sum(capacity.get('CapacityUnits', 0) for capacity in consumed_capacity))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Returns full jitter exponential backoff delay in seconds for a retry attempt"""
+
+    return execution_history_table.backoff_delay(attempt, batch_write_backoff_base, batch_write_backoff_cap)
+
+
+@metrics.timed('clone_repo')
 def clone_repo(db_item: dict):
+    """Ensures the repo cache holds a blobless partial clone and fetches the latest commits for the branch"""
+
+    update_repo_cache(repo_url(db_item), db_item['gerrit_branch_name'])
+
+
+@metrics.timed('fetch_branches')
+def fetch_branches(branch_details: list) -> set:
+    """Updates the repo cache for many branches with one fetch. Returns the names of the branches 
+       fetched; when the combined fetch fails (eg. one branch was deleted) none are, and each branch 
+       fetches on its own so the failure stays with the branch that caused it."""
+
+    branch_names = list(dict.fromkeys(details['gerrit_branch_name'] for details in branch_details))
+    if len(branch_names) < 2:
+        return set()
+
+    try:
+        update_repo_cache(repo_url(branch_details[0]), branch_names)
+    except ExecutionHistoryError as e:
+        print(f'warning: {e}; fetching branches one at a time.')
+        return set()
+
+    return set(branch_names)
+
+
+def repo_url(db_item: dict) -> str:
+    """Returns the gerrit url to clone, with the service user for https urls"""
+
     git_user = 'rreed210'   # TODO: REPLACE WITH SERVICE USER
-    partial_url = regex_search(r'https:\/\/(.+)', db_item['gerrit_url'])
-    url = 'https://' + git_user + '@' + partial_url
+    url = db_item['gerrit_url']
+    # local mirrors (eg. file:// urls used by benchmarks) are cloned as given
+    if url.startswith('https://'):
+        partial_url = regex_search(r'https:\/\/(.+)', url)
+        url = 'https://' + git_user + '@' + partial_url
+
+    return url
+
+
+def update_repo_cache(url: str, branch_names):
+    """Clones url into the repo cache when missing, then fetches only the new commits of the branch
+       (or list of branches, in a single fetch) into their remote-tracking refs"""
+
+    if isinstance(branch_names, str):
+        branch_names = [branch_names]
+    shallow_args = [f'--shallow-since={shallow_since}'] if shallow_since else []
+
+    with repo_cache_lock():
+        # checks to see if repo is already locally available before cloning. History is only read 
+        # through refs, so the clone is bare: commits and trees are enough for git log --name-only, 
+        # blobs are never downloaded and there is no working tree. Caches cloned with a working 
+        # tree by earlier versions keep working.
+        if not is_repo_cached():
+            try:
+                subprocess.run(['git', 'clone', '--bare', '--filter=blob:none'] + shallow_args + [url, xhfw_repo],
+                               check=True)
+            except subprocess.CalledProcessError as e:
+                raise ExecutionHistoryError(f'error occurred cloning gerrit repo: {e}') from e
+
+        refspecs = [f'+refs/heads/{branch_name}:{remote_branch_ref(branch_name)}' for branch_name in branch_names]
+        try:
+            git_backend.SubprocessGitBackend(xhfw_repo).fetch_refs('origin', refspecs, shallow_args)
+        except git_backend.GitError as e:
+            raise ExecutionHistoryError(f'error occurred fetching {", ".join(branch_names)}: {e}') from e
+
+
+def is_repo_cached() -> bool:
+    return os.path.isdir(os.path.join(xhfw_repo, '.git')) or os.path.isfile(os.path.join(xhfw_repo, 'HEAD'))
+
 
-    # checks to see if repo is already locally available before cloning
-    process = subprocess.run([f'ls {xhfw_repo}/'], shell=True, capture_output=True, text=True)
-    if process.stderr != "":
+def remote_branch_ref(branch_name: str) -> str:
+    """Returns the remote-tracking ref harvested for a branch"""
+
+    return f'refs/remotes/origin/{branch_name}'
+
+
+@contextmanager
+def repo_cache_lock():
+    """Holds an exclusive lock on the repo cache across threads and concurrent runs"""
+
+    os.makedirs(repo_cache_dir, exist_ok=True)
+    with repo_lock, open(f'{xhfw_repo}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            process = subprocess.run([f'git clone {url}'], shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f'error occurred cloning gerrit repo: {e}')      
-            exit(1)  
-    subprocess.run(
-        [f'cd {xhfw_repo}/ && git checkout {db_item["gerrit_branch_name"]} \
-            && git pull && cd ..'], shell=True, capture_output=True, text=True
-    )
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 def delete_repo():
-    subprocess.run([f'cd ..'], shell=True)
+    """Removes the repo cache so the next run starts from a fresh clone"""
+
     try:
-        process = subprocess.run([f'rm -rf {xhfw_repo}/'], shell=True, check=True)
+        with repo_cache_lock():
+            subprocess.run(['rm', '-rf', xhfw_repo], check=True)
     except subprocess.CalledProcessError as e:
-        print(f'error occurred deleting gerrit repo: {e}')
-        exit(1)
+        raise ExecutionHistoryError(f'error occurred deleting gerrit repo: {e}') from e
+
+
+def print_report(branch_name: str, response: dict):
+    """Prints the outcome of a branch run, including items that failed to write"""
+
+    print(f'{branch_name}: {response["message"]}')
+    for result in response['items']:
+        if result['status'] == 'failed':
+            print(f'error: item {result["index"]} ({result["jira_id"]}) not written: {result["error"]}')
+
+
+def report_failed(response: dict) -> bool:
+    """Returns True when a branch run failed or left items unwritten"""
+
+    return bool(response.get('error')) or response['failed'] > 0
+
+
+def write_capacity_setting(value: str) -> str:
+    """argparse type of --write-capacity"""
+
+    if value in ('off', 'auto'):
+        return value
+    try:
+        if float(value) > 0:
+            return value
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"expected 'off', 'auto' or a positive number, got {value!r}")
+
+
+def build_parser(description: str, epilog: str) -> argparse.ArgumentParser:
+    """Returns a parser for the branch selection and run settings shared by the command line tools"""
+
+    parser = argparse.ArgumentParser(description=description, epilog=epilog)
+    parser.add_argument('gerrit_branch_names', nargs='*', metavar='gerrit_branch_name',
+                        help='gerrit branch(es) to process')
+    parser.add_argument('--all', action='store_true',
+                        help=f'process every branch in {repo_t_tables[0]["table_name"]}')
+    parser.add_argument('--workers', type=int, default=branch_workers,
+                        help='maximum number of branches processed concurrently')
+    parser.add_argument('--repo-cache', default=repo_cache_dir,
+                        help='directory holding the persistent partial clone of the gerrit repo')
+    parser.add_argument('--write-mode', choices=['put', 'upsert'], default=write_mode,
+                        help='overwrite items, or merge new commits into existing items')
+    parser.add_argument('--dedup', choices=['off', 'cache', 'check'], default=dedup_writes,
+                        help='skip items whose content hash is unchanged, per the local fingerprint cache '
+                             '(cache) or also the stored hash (check)')
+    parser.add_argument('--fingerprint-cache', default=write_dedup.cache_file,
+                        help='file remembering the content hash of written items')
+    parser.add_argument('--export', default=None, metavar='DESTINATION',
+                        help='write payloads as gzip DynamoDB JSON import shards to a directory or s3://bucket/prefix '
+                             'instead of the table (dry run); the watermark is not advanced')
+    parser.add_argument('--export-shard-bytes', type=int, default=export_sink.max_shard_bytes,
+                        help='uncompressed bytes per export shard')
+    parser.add_argument('--pipeline', action='store_true', default=pipeline_mode,
+                        help='overlap harvesting, grouping and writing in concurrent stages (writes upsert; '
+                             'ignored with --export)')
+    parser.add_argument('--component-map', default=component_map_file,
+                        help='JSON file mapping path prefixes to package and component')
+    parser.add_argument('--git-backend', choices=list(git_backend.backends), default=git_backend_name,
+                        help='read history with one git process per query, or persistent cat-file pipes')
+    parser.add_argument('--shallow-since', default=shallow_since,
+                        help='limit the cached clone to commits since this date (eg. "1 month ago")')
+    parser.add_argument('--delete-repo', action='store_true',
+                        help='remove the cached clone after the run')
+    parser.add_argument('--cache-ttl', type=float, default=branch_details_cache.ttl,
+                        help='seconds branch details are served from the cache; 0 disables it')
+    parser.add_argument('--cache-file', default=branch_details_cache.cache_file,
+                        help='file sharing cached branch details between runs')
+    parser.add_argument('--invalidate-cache', action='store_true',
+                        help='drop cached branch details before the run')
+    parser.add_argument('--write-capacity', type=write_capacity_setting, default=write_scheduler.write_capacity,
+                        help="pace writes to 'auto' (the tables' provisioned write capacity), a number of write "
+                             "capacity units per second shared by all workers, or 'off'")
+    parser.add_argument('--metrics-file', default=None,
+                        help='write stage durations, counts and consumed capacity to this file')
+    parser.add_argument('--metrics-format', choices=['jsonl', 'prometheus'], default='jsonl',
+                        help='append JSON lines, or replace a Prometheus textfile collector file')
+    parser.add_argument('--profile', default=None,
+                        help='dump cProfile stats of the run to this file')
+
+    return parser
+
+
+def parse_args(args: list) -> argparse.Namespace:
+    parser = build_parser(
+        description='Uploads new git commits for gerrit branches to the Repo_T Execution History table.',
+        epilog='eg. "$ python update_execution_history.py release/10.7 release/10.8"')
+
+    parsed = parser.parse_args(args)
+    if not parsed.gerrit_branch_names and not parsed.all:
+        parser.error('missing gerrit_branch_name argument (eg. "$ python update_execution_history.py release/10.7")')
+
+    return parsed
+
+
+def apply_args(parsed: argparse.Namespace):
+    """Applies parsed run settings to the module configuration"""
+
+    global repo_cache_dir, xhfw_repo, shallow_since, git_backend_name, write_mode, pipeline_mode
+    global component_map_file, dedup_writes
+
+    repo_cache_dir = parsed.repo_cache
+    xhfw_repo = os.path.join(repo_cache_dir, 'core')
+    shallow_since = parsed.shallow_since
+    git_backend_name = parsed.git_backend
+    write_mode = parsed.write_mode
+    pipeline_mode = parsed.pipeline
+    component_map_file = parsed.component_map
+    dedup_writes = parsed.dedup
+    if parsed.fingerprint_cache != write_dedup.cache_file:
+        write_dedup.cache_file = parsed.fingerprint_cache
+        write_dedup.reset()
+    branch_details_cache.configure(parsed.cache_ttl, parsed.cache_file or '')
+    write_scheduler.configure(parsed.write_capacity)
+    if parsed.invalidate_cache:
+        branch_details_cache.invalidate()
+
+
+def main(args: list) -> int:
+    global export_writer
+
+    parsed = parse_args(args)
+    apply_args(parsed)
+    try:
+        if parsed.export:
+            export_writer = export_sink.ShardWriter(parsed.export, max_bytes=parsed.export_shard_bytes,
+                                                    table_name=repo_t_tables[1]['table_name'])
+        with metrics.profile(parsed.profile), metrics.timer('run'):
+            reports = parse_branches(None if parsed.all else parsed.gerrit_branch_names, parsed.workers)
+        if export_writer is not None:
+            export_writer.close()
+    except (ExecutionHistoryError, OSError, export_sink.ExportError) as e:
+        print(e)
+        return 1
+    finally:
+        export_writer = None
+        if parsed.metrics_file:
+            metrics.write(parsed.metrics_file, parsed.metrics_format, {'job': 'update_execution_history'})
+
+    for branch_name, response in reports.items():
+        print_report(branch_name, response)
+
+    if parsed.delete_repo:
+        try:
+            delete_repo()
+        except ExecutionHistoryError as e:
+            print(e)
+            return 1
+
+    return 1 if any(report_failed(response) for response in reports.values()) else 0
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        response = parse_git_logs(str(sys.argv[1]))
-        print(response)
-        delete_repo()
-    else:
-        print('error: missing gerrit_branch_name argument (eg. \"$ python parse_repo.py release/10.7\")')
-        exit(1)
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,178 @@
+import os
+import hashlib
+import json
+import threading
+from decimal import Decimal
+from typing import Dict, List, Set
+import aws_session
+import metrics
+
+# Payload items carry a content_hash: sha256 of their canonical JSON. A local cache remembers the hash
+# last written under each key, so a rerun that rebuilds an identical item skips its write. In 'check'
+# mode keys missing from the cache have their stored hash read with BatchGetItem first: reading an item
+# costs a fraction of rewriting it, while a failed conditional put is still charged the full write.
+hash_attribute = 'content_hash'
+cache_file = os.environ.get('REPO_T_FINGERPRINT_CACHE') or os.path.join(
+    os.path.expanduser('~'), '.cache', 'repo_t', 'fingerprints.json')
+batch_get_size = 100
+
+_lock = threading.Lock()
+_hashes = None
+_dirty = {}
+
+
+def canonical(value):
+    """json.dumps default giving dynamodb values one stable representation"""
+
+    if isinstance(value, Decimal):
+        return str(value.normalize())
+    if isinstance(value, (set, frozenset)):
+        return sorted(canonical(item) if not isinstance(item, str) else item for item in value)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    if hasattr(value, 'value') and isinstance(value.value, (bytes, bytearray)):
+        return value.value.hex()
+    raise TypeError(f'{type(value)} is not JSON serializable')
+
+
+def fingerprint(item: dict) -> str:
+    """Returns the sha256 of an item's canonical JSON, leaving out its own content_hash"""
+
+    content = {attribute: value for attribute, value in item.items() if attribute != hash_attribute}
+    text = json.dumps(content, sort_keys=True, separators=(',', ':'), default=canonical)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def cache_key(table_name: str, item: dict, key_attributes: list) -> str:
+    return '\t'.join([table_name] + [str(item.get(attribute, '')) for attribute in key_attributes])
+
+
+def find_unchanged(table_name: str, payload: list, key_attributes: list, check_table: bool = False) -> Set[int]:
+    """Sets content_hash on every payload item and returns the indexes of items whose hash matches the
+       last one written, per the local cache or, with check_table, the stored item"""
+
+    unchanged = set()
+    misses = {}
+    with _lock:
+        hashes = _load()
+        for index, item in enumerate(payload):
+            item[hash_attribute] = fingerprint(item)
+            if hashes.get(cache_key(table_name, item, key_attributes)) == item[hash_attribute]:
+                unchanged.add(index)
+            else:
+                misses.setdefault(tuple(item[attribute] for attribute in key_attributes), []).append(index)
+
+    if check_table and misses:
+        stored = get_stored_hashes(table_name, list(misses), key_attributes)
+        confirmed = []
+        for key, indexes in misses.items():
+            if key in stored and all(payload[index][hash_attribute] == stored[key] for index in indexes):
+                confirmed.extend(indexes)
+        unchanged.update(confirmed)
+        record(table_name, [payload[index] for index in confirmed], key_attributes)
+
+    metrics.increment('dynamodb_writes_skipped_unchanged', len(unchanged))
+    return unchanged
+
+
+def get_stored_hashes(table_name: str, keys: List[tuple], key_attributes: list) -> Dict[tuple, str]:
+    """Returns the content_hash stored under each key that has one"""
+
+    dynamo_db = aws_session.get_resource('dynamodb')
+    names = {f'#k{number}': attribute for number, attribute in enumerate(key_attributes)}
+    names['#hash'] = hash_attribute
+    stored = {}
+    for start in range(0, len(keys), batch_get_size):
+        request = {table_name: {
+            'Keys': [dict(zip(key_attributes, key)) for key in keys[start:start + batch_get_size]],
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }}
+        while request:
+            response = dynamo_db.batch_get_item(RequestItems=request, ReturnConsumedCapacity='TOTAL')
+            for capacity in response.get('ConsumedCapacity', []):
+                metrics.increment('dynamodb_read_capacity_units', capacity.get('CapacityUnits', 0))
+            for item in response['Responses'].get(table_name, []):
+                if hash_attribute in item:
+                    stored[tuple(item[attribute] for attribute in key_attributes)] = item[hash_attribute]
+            request = response.get('UnprocessedKeys')
+
+    return stored
+
+
+def record(table_name: str, items: list, key_attributes: list):
+    """Remembers the content_hash of written items and saves the cache"""
+
+    if not items:
+        return
+
+    with _lock:
+        hashes = _load()
+        for item in items:
+            key = cache_key(table_name, item, key_attributes)
+            hashes[key] = _dirty[key] = item[hash_attribute]
+        _save()
+
+
+def forget(table_name: str = None):
+    """Drops cached hashes of one table, or all of them, eg. after the table was restored"""
+
+    global _hashes
+
+    with _lock:
+        hashes = _load()
+        for key in [key for key in hashes if table_name is None or key.split('\t', 1)[0] == table_name]:
+            del hashes[key]
+            _dirty.pop(key, None)
+        _write(hashes)
+        _hashes = None
+
+
+def reset():
+    """Drops the in-memory cache so the next lookup re-reads cache_file"""
+
+    global _hashes
+
+    with _lock:
+        _hashes = None
+        _dirty.clear()
+
+
+def _load() -> dict:
+    """Returns the cached hashes, reading cache_file on first use. Call with _lock held."""
+
+    global _hashes
+
+    if _hashes is None:
+        _hashes = _read()
+    return _hashes
+
+
+def _read() -> dict:
+    try:
+        with open(cache_file) as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        print(f'warning: ignoring unreadable fingerprint cache {cache_file}.')
+        return {}
+
+
+def _save():
+    """Merges this process's new hashes into cache_file, keeping those other runs saved meanwhile.
+       Call with _lock held."""
+
+    hashes = _read()
+    hashes.update(_dirty)
+    _write(hashes)
+
+
+def _write(hashes: dict):
+    directory = os.path.dirname(cache_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_file = f'{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary_file, 'w') as json_file:
+        json.dump(hashes, json_file)
+    os.replace(temporary_file, cache_file)
@@ -0,0 +1,174 @@
+import os
+import math
+import threading
+import time
+from typing import Callable, Dict, Optional
+import aws_session
+import metrics
+
+# Paces DynamoDB writes with one token bucket per table, shared by every branch worker thread of the
+# process. Writers reserve the units they expect to consume before a request and settle the difference
+# with the request's ConsumedCapacity afterwards. The rate backs off multiplicatively on throttling and
+# recovers additively on success (AIMD), so bulk loads run at the provisioned throughput without
+# exceeding it for long.
+# 'off', 'auto' (the table's provisioned write capacity units; on-demand tables are not paced) or a
+# number of write capacity units per second
+write_capacity = os.environ.get('REPO_T_WRITE_CAPACITY', 'off')
+# fraction of the budget this process may use, eg. 1/workers for each process of a process pool
+capacity_share = 1.0
+# seconds of unused capacity the bucket may save up for a burst
+burst_seconds = 2.0
+throttle_decrease = 0.5
+success_increase = 0.05
+min_rate = 0.5
+write_unit_bytes = 1024
+throttle_error_codes = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+_lock = threading.Lock()
+_buckets = {}
+
+
+class TokenBucket:
+    """Token bucket refilled at rate units per second. acquire() takes the units immediately, so the
+       bucket may go into debt, and sleeps until the debt is paid off; concurrent writers queue up
+       behind each other's debt without holding the lock while they sleep."""
+
+    def __init__(self, rate: float, burst: float = burst_seconds, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.size()
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def size(self) -> float:
+        return max(1.0, self.rate * self.burst)
+
+    def acquire(self, units: float) -> float:
+        """Takes units from the bucket, waiting while it is in debt. Returns the seconds waited."""
+
+        with self._lock:
+            self._refill()
+            self.tokens -= units
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            metrics.observe('write_scheduler_wait', wait)
+            self.sleep(wait)
+
+        return wait
+
+    def settle(self, reserved: float, consumed: float):
+        """Credits back reserved units the request did not consume (or charges the excess), and raises
+           the rate a step towards max_rate"""
+
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.size(), self.tokens + reserved - consumed)
+            self.rate = min(self.max_rate, self.rate + self.max_rate * success_increase)
+
+    def throttled(self):
+        """Halves the rate and empties the bucket after a throttled request"""
+
+        with self._lock:
+            self._refill()
+            self.rate = max(min_rate, self.rate * throttle_decrease)
+            self.tokens = min(self.tokens, 0.0)
+        metrics.increment('write_scheduler_throttles')
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.size(), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+def configure(capacity: str = None, share: float = None):
+    """Sets the write capacity setting and this process's share of it, dropping existing buckets"""
+
+    global write_capacity, capacity_share
+
+    with _lock:
+        if capacity is not None:
+            write_capacity = capacity
+        if share is not None:
+            capacity_share = share
+        _buckets.clear()
+
+
+def get_bucket(table_name: str) -> Optional[TokenBucket]:
+    """Returns the table's bucket, or None when its writes are not paced"""
+
+    with _lock:
+        if table_name not in _buckets:
+            rate = table_write_capacity(table_name) * capacity_share
+            _buckets[table_name] = TokenBucket(rate) if rate > 0 else None
+        return _buckets[table_name]
+
+
+def table_write_capacity(table_name: str) -> float:
+    """Returns the write capacity units per second to pace a table's writes at; 0 when not paced"""
+
+    if write_capacity == 'off':
+        return 0.0
+    if write_capacity != 'auto':
+        return float(write_capacity)
+
+    table = aws_session.get_resource('dynamodb').Table(table_name)
+    if (table.billing_mode_summary or {}).get('BillingMode') == 'PAY_PER_REQUEST':
+        return 0.0
+    return float((table.provisioned_throughput or {}).get('WriteCapacityUnits', 0))
+
+
+def write_units(item: dict, item_bytes: Callable[[dict], int]) -> int:
+    """Returns the write capacity units a put of the item consumes in the table (1 per started KB)"""
+
+    return max(1, math.ceil(item_bytes(item) / write_unit_bytes))
+
+
+def acquire(table_name: str, units: float) -> float:
+    """Reserves units for a write to the table. Returns the units reserved (0 when not paced)."""
+
+    bucket = get_bucket(table_name)
+    if bucket is None:
+        return 0.0
+    bucket.acquire(units)
+    return units
+
+
+def settle(table_name: str, reserved: float, response: dict):
+    """Settles a reservation with the table units a write response consumed"""
+
+    bucket = get_bucket(table_name)
+    if bucket is not None:
+        bucket.settle(reserved, table_units(response, table_name))
+
+
+def throttled(table_name: str):
+    bucket = get_bucket(table_name)
+    if bucket is not None:
+        bucket.throttled()
+
+
+def table_units(response: dict, table_name: str) -> float:
+    """Returns the table's share of a response's ConsumedCapacity. Index units are left out, since
+       global secondary indexes have their own provisioned throughput."""
+
+    consumed_capacity = response.get('ConsumedCapacity', [])
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    units = 0.0
+    for capacity in consumed_capacity:
+        if capacity.get('TableName', table_name) != table_name:
+            continue
+        units += float((capacity.get('Table') or capacity).get('CapacityUnits', 0))
+
+    return units
+
+
+def snapshot() -> Dict[str, float]:
+    """Returns the current rate of every paced table"""
+
+    with _lock:
+        return {table_name: bucket.rate for table_name, bucket in _buckets.items() if bucket is not None}